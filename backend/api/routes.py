@@ -181,8 +181,8 @@ async def execute_task_stream(request: TaskRequest, user_id: str = Depends(get_c
                 model=request.model
             )
     
-    async def persist_and_broadcast(event):
-        """持久化事件数据到数据库，并广播给所有订阅者
+    async def persist_and_broadcast(event, sse: str):
+        """持久化事件数据到数据库，并广播给所有订阅者（sse 为该事件已序列化的 SSE 文本）
         
         关键事件（状态变更、Agent创建、计划生成等）同步等待持久化完成；
         高频非关键事件（thinking、progress、text content）异步持久化不阻塞 SSE 流。
@@ -375,7 +375,7 @@ async def execute_task_stream(request: TaskRequest, user_id: str = Depends(get_c
             asyncio.create_task(_do_persist())
         
         # 广播事件给所有订阅者（始终同步，确保前端收到）
-        await session_manager.broadcast_event(session_id, event)
+        await session_manager.broadcast_event(session_id, sse)
         
         # 广播状态变更通知（用于刷新会话列表）
         if change_type:
@@ -408,6 +408,8 @@ async def execute_task_stream(request: TaskRequest, user_id: str = Depends(get_c
                     previous_context=previous_context,
                     previous_roles=previous_roles,
                 )
+            # 任务执行期间会话计为运行中，Agent 不会被淘汰或回收
+            task_stream = session_manager.run_task(session_id, task_stream)
             
             # 使用异步迭代器 + 超时心跳机制
             aiter = task_stream.__aiter__()
@@ -417,9 +419,10 @@ async def execute_task_stream(request: TaskRequest, user_id: str = Depends(get_c
                         aiter.__anext__(),
                         timeout=HEARTBEAT_INTERVAL
                     )
-                    # 正常收到事件：持久化 + 广播 + 发送
-                    await persist_and_broadcast(event)
-                    yield event.to_sse()
+                    # 正常收到事件：序列化一次，持久化 + 广播 + 发送共用
+                    sse = event.to_sse()
+                    await persist_and_broadcast(event, sse)
+                    yield sse
                     await asyncio.sleep(0.01)  # 小延迟避免过快
                 except asyncio.TimeoutError:
                     # 超时未收到事件：发送 SSE 心跳注释保持连接
@@ -457,7 +460,7 @@ async def get_task_stream(session_id: str, user_id: str = Depends(get_current_us
     """
     await verify_session_owner(session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
@@ -495,7 +498,7 @@ async def get_task_state(session_id: str, user_id: str = Depends(get_current_use
     """获取任务状态"""
     await verify_session_owner(session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
@@ -679,7 +682,7 @@ async def apply_intervention(request: InterventionRequest, user_id: str = Depend
     """
     await verify_session_owner(request.session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(request.session_id)
+    agent = session_manager.get_or_restore_agent(request.session_id)
     
     if not agent:
         raise HTTPException(
@@ -939,7 +942,7 @@ async def broadcast_to_relay(
     """
     await verify_session_owner(session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
@@ -969,7 +972,7 @@ async def get_relay_history(session_id: str, limit: int = 20, user_id: str = Dep
     """获取指定会话的中继站消息历史"""
     await verify_session_owner(session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
@@ -1002,7 +1005,7 @@ async def get_relay_message_detail(session_id: str, message_id: str, user_id: st
     """获取指定会话中的单条中继消息详情"""
     await verify_session_owner(session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
@@ -1038,7 +1041,7 @@ async def get_intervention_history(session_id: str, limit: int = 10, user_id: st
     """获取指定会话的人工干预历史"""
     await verify_session_owner(session_id, user_id)
     session_manager = get_session_manager()
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     
     if not agent:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
@@ -1304,7 +1307,7 @@ async def subscribe_to_session(session_id: str, token: Optional[str] = Query(Non
     session_manager = get_session_manager()
     
     # 检查会话是否存在（内存或数据库）
-    agent = session_manager.get_agent(session_id)
+    agent = session_manager.get_or_restore_agent(session_id)
     session_info = session_manager.get_session_info(session_id)
     
     if not agent and not session_info:
@@ -1335,9 +1338,9 @@ async def subscribe_to_session(session_id: str, token: Optional[str] = Query(Non
                     # 等待新事件，超时 30 秒发送心跳
                     event = await asyncio.wait_for(event_queue.get(), timeout=30.0)
                     
-                    # 发送事件
-                    if hasattr(event, 'to_sse'):
-                        yield event.to_sse()
+                    # 发送事件（BaseEvent 已在广播时序列化为 SSE 文本）
+                    if isinstance(event, str):
+                        yield event
                     else:
                         # 普通字典事件
                         event_type = event.get('type', 'UNKNOWN')
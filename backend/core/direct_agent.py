@@ -12,13 +12,13 @@ Direct Agent - 普通模式 Agent
 
 import asyncio
 import uuid
-import json
 import time
 from typing import Dict, List, Optional, Any, AsyncGenerator
 from datetime import datetime
 
 from core.models import AgentStatus, TaskSession
 from llm.provider import LLMProviderFactory, LLMMessage, LLMConfig
+from utils.jsonfast import json_dumps as _json_dumps, json_loads as _json_loads
 from skills import list_skills, get_global_registry, get_runtime_manager
 from skills.executor import SkillExecutor, AgentSkillSet
 from agui.events import (
@@ -365,11 +365,11 @@ class DirectAgent:
                     
                     yield ToolCallArgsEvent(
                         tool_call_id=tool_call_id,
-                        delta=func_args_str if isinstance(func_args_str, str) else json.dumps(func_args_str, ensure_ascii=False),
+                        delta=func_args_str if isinstance(func_args_str, str) else _json_dumps(func_args_str),
                     )
                     
                     try:
-                        func_args = json.loads(func_args_str) if isinstance(func_args_str, str) else func_args_str
+                        func_args = _json_loads(func_args_str) if isinstance(func_args_str, str) else func_args_str
                         task_desc = func_args.get("task", task)
                         
                         print(f"[DirectAgent] Executing skill: {func_name}, task: {task_desc[:80]}")
@@ -394,22 +394,22 @@ class DirectAgent:
                         
                         yield ToolCallResultEvent(
                             tool_call_id=tool_call_id,
-                            result=json.dumps({
+                            result=_json_dumps({
                                 "agent_id": self.agent_id,
                                 "agent_name": "Assistant",
                                 "skill_name": func_name,
                                 "success": result.success,
                                 "summary": result.summary or "",
                                 "result_preview": str(tool_result_str)[:500] if tool_result_str else "",
-                            }, ensure_ascii=False),
+                            }),
                         )
                         
                         # 控制单条工具结果长度，避免多轮工具后上下文膨胀导致后续轮次变慢/卡住
-                        compact_tool_result = json.dumps({
+                        compact_tool_result = _json_dumps({
                             "success": result.success,
                             "summary": result.summary or "",
                             "result_preview": str(tool_result_str)[:1200] if tool_result_str else "",
-                        }, ensure_ascii=False)
+                        })
                         messages.append(LLMMessage(
                             role="tool",
                             content=compact_tool_result,
@@ -424,18 +424,18 @@ class DirectAgent:
                         
                         yield ToolCallResultEvent(
                             tool_call_id=tool_call_id,
-                            result=json.dumps({
+                            result=_json_dumps({
                                 "agent_id": self.agent_id,
                                 "agent_name": "Assistant",
                                 "skill_name": func_name,
                                 "success": False,
                                 "summary": error_msg,
                                 "result_preview": "",
-                            }, ensure_ascii=False),
+                            }),
                         )
                         messages.append(LLMMessage(
                             role="tool",
-                            content=json.dumps({"success": False, "error": error_msg}, ensure_ascii=False),
+                            content=_json_dumps({"success": False, "error": error_msg}),
                             tool_call_id=tool_call_id,
                         ))
                 
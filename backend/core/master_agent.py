@@ -1257,6 +1257,24 @@ class MasterAgent:
         
         print(f"[MasterAgent] Session {self.session_id[:8]}... cleaned up")
     
+    def reset_session_state(self):
+        """清空全部会话级状态，保留 provider / 角色引擎等可复用组件
+        
+        供 SessionManager 的 Agent 池回收实例，之后需调用 bind_session 绑定新会话。
+        """
+        self.cleanup()
+        self.relay_coordinator.active_station_id = None
+        self.relay_trigger = AdaptiveRelayTrigger()
+        self.current_task_session_id = None
+        self.event_queue = asyncio.Queue()
+    
+    def bind_session(self, session_id: str, user_id: Optional[str] = None):
+        """将（池中取出的）实例绑定到新会话"""
+        self.session_id = session_id
+        self.user_id = user_id
+        self.relay_coordinator.session_id = session_id
+        print(f"[MasterAgent] Bound pooled instance to session: {session_id[:8]}...")
+    
     def get_instance_info(self) -> Dict[str, Any]:
         """获取实例信息（用于调试）"""
         return {
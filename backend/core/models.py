@@ -4,9 +4,10 @@
 定义 Agent 集群系统中的所有核心数据结构
 """
 
+from collections import deque
 from enum import Enum
-from typing import Optional, Dict, List, Any, Union
-from pydantic import BaseModel, Field
+from typing import Optional, Dict, List, Any, Union, Deque
+from pydantic import BaseModel, Field, field_serializer
 from datetime import datetime
 import uuid
 
@@ -155,12 +156,17 @@ class SubagentConfig(BaseModel):
     priority: int = 5                   # 优先级 1-10
     max_iterations: int = 10            # 最大迭代次数
     timeout_seconds: int = 300          # 超时时间
+    history_window: int = 12            # 对话历史窗口（system + 任务之外保留的最近消息数）
     
     # 中继配置
     relay_enabled: bool = True          # 是否启用中继
     relay_threshold: float = 0.7        # 中继触发阈值（置信度）
 
 
+# 每个 Subagent 保留的已接收中继消息上限
+RELAY_RECEIVED_MAXLEN = 1000
+
+
 class SubagentState(BaseModelWithTimestamp):
     """Subagent 运行状态"""
     id: str
@@ -183,10 +189,18 @@ class SubagentState(BaseModelWithTimestamp):
     
     # 中继信息
     relay_messages_sent: List[Dict[str, Any]] = Field(default_factory=list)
-    relay_messages_received: List[Dict[str, Any]] = Field(default_factory=list)
+    # 保存消息对象引用，序列化推迟到状态快照；只保留最近 RELAY_RECEIVED_MAXLEN 条
+    relay_messages_received: Deque["RelayMessage"] = Field(
+        default_factory=lambda: deque(maxlen=RELAY_RECEIVED_MAXLEN)
+    )
     
     # 错误信息
     error: Optional[str] = None
+    
+    @field_serializer("relay_messages_received", mode="wrap")
+    def _serialize_relay_messages_received(self, messages, handler):
+        """序列化为普通列表，快照结构与原 List[Dict] 字段一致（可直接 JSON 编码）"""
+        return list(handler(messages))
 
 
 # ============== 中继站模型 ==============
@@ -222,6 +236,9 @@ class RelayMessage(BaseModel):
             self.mark_viewed(agent_id)
 
 
+SubagentState.model_rebuild()
+
+
 class RelayStation(BaseModel):
     """中继站状态"""
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -18,18 +18,138 @@ Session Manager - 会话管理器
 """
 
 import asyncio
+import heapq
+import itertools
+import math
+import time
 import uuid
-import json
-from typing import Dict, Optional, List, Any, Set
-from datetime import datetime, timedelta
+from typing import AsyncGenerator, Dict, Optional, List, Any, Set, Tuple, Iterator, Deque, ClassVar, FrozenSet
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime
 from dataclasses import dataclass, field
 from threading import Lock
 import logging
 
+from storage import get_repository
+from storage.base import (
+    SessionRecord,
+    AgentRecord,
+    RelayStationRecord,
+    RelayMessageRecord,
+    InterventionRecord,
+    MessageRecord,
+)
+from agui.events import SessionStateChangedEvent
+from utils.jsonfast import json_dumps as _dumps
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+# ========== 事件数据 -> 存储记录 ==========
+# 热路径（每个 Agent / 消息事件一次）：dict.get 绑定为局部变量，省去重复的属性查找
+
+def _agent_record_from_data(session_id: str, agent_id: str, data: Dict[str, Any]) -> AgentRecord:
+    get = data.get
+    return AgentRecord(
+        agent_id=agent_id,
+        session_id=session_id,
+        name=get("name", ""),
+        role_name=get("role_name", ""),
+        role_description=get("role_description", ""),
+        capabilities=_dumps(get("capabilities", [])),
+        task_segment=get("task_segment", ""),
+        status=get("status", "pending"),
+        progress=get("progress", 0),
+        current_step=get("current_step", ""),
+        iterations=get("iterations", 0),
+        thinking=get("thinking", ""),
+        work_objective=get("work_objective"),
+        deliverables=_dumps(get("deliverables", [])),
+        methodology=get("methodology"),
+        assigned_skills=_dumps(get("assigned_skills", [])),
+        expertise_level=get("expertise_level"),
+        focus_areas=_dumps(get("focus_areas", [])),
+    )
+
+
+def _relay_message_record_from_data(session_id: str, data: Dict[str, Any]) -> RelayMessageRecord:
+    get = data.get
+    return RelayMessageRecord(
+        message_id=get("message_id") or get("id"),
+        station_id=get("station_id"),
+        session_id=session_id,
+        relay_type=get("relay_type", ""),
+        source_agent_id=get("source_agent_id", ""),
+        source_agent_name=get("source_agent_name", ""),
+        target_agent_ids=_dumps(get("target_agent_ids", [])),
+        content=get("content", ""),
+        importance=get("importance", 5),
+        viewed_by=_dumps(get("viewed_by", [])),
+        acknowledged_by=_dumps(get("acknowledged_by", [])),
+        viewed_timestamps=_dumps(get("viewed_timestamps", {})),
+    )
+
+
+def _intervention_record_from_data(session_id: str, data: Dict[str, Any]) -> InterventionRecord:
+    get = data.get
+    payload = get("payload")
+    return InterventionRecord(
+        intervention_id=get("id") or str(uuid.uuid4()),
+        session_id=session_id,
+        intervention_type=get("type", ""),
+        scope=get("scope", "single"),
+        target_agent_id=get("target_agent_id"),
+        target_agent_ids=_dumps(get("target_agent_ids", [])),
+        payload_json=_dumps(payload) if payload else None,
+        reason=get("reason", ""),
+        priority=get("priority", 5),
+    )
+
+
+def _message_record_from_data(session_id: str, data: Dict[str, Any]) -> MessageRecord:
+    get = data.get
+    metadata = get("metadata")
+    return MessageRecord(
+        message_id=get("message_id") or get("id") or str(uuid.uuid4()),
+        session_id=session_id,
+        role=get("role", "assistant"),
+        content=get("content", ""),
+        metadata_json=_dumps(metadata) if metadata else None,
+    )
+
+
+def _cached_isoformat(value: Optional[datetime], cache: Optional[Tuple[datetime, str]]) -> Tuple[Optional[str], Optional[Tuple[datetime, str]]]:
+    """带缓存的 isoformat：时间对象未变化时复用上次的字符串
+    
+    Returns:
+        (iso 字符串, 新的缓存条目)
+    """
+    if value is None:
+        return None, None
+    if cache is not None and cache[0] is value:
+        return cache[1], cache
+    iso = value.isoformat()
+    return iso, (value, iso)
+
+
+@dataclass(slots=True)
+class TaskHistoryEntry:
+    """一轮已完成任务的摘要（追问上下文使用）"""
+    task: str
+    summary: str
+    roles: List[str]
+    timestamp: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task,
+            "summary": self.summary,
+            "roles": self.roles,
+            "timestamp": self.timestamp,
+        }
+
+
+@dataclass(slots=True)
 class SessionInfo:
     """会话信息（内存缓存）"""
     session_id: str
@@ -46,16 +166,43 @@ class SessionInfo:
     mode: str = "emergent"  # emergent(涌现模式) / direct(普通模式)
     # 追问支持：上一轮关键信息
     intervention_summary: Optional[str] = None  # 人工干预摘要
-    task_history: Optional[List[Dict]] = None   # 历史任务 [{task, summary, roles, timestamp}]
+    task_history: Optional[List[TaskHistoryEntry]] = None   # 历史任务（最近 3 轮）
     previous_roles: Optional[List[Dict]] = None  # 上一轮角色配置（用于角色复用）
+    # isoformat 缓存：(datetime, iso 字符串)，datetime 对象变化时自动失效
+    _created_iso: Optional[Tuple[datetime, str]] = field(default=None, init=False, repr=False, compare=False)
+    _last_active_iso: Optional[Tuple[datetime, str]] = field(default=None, init=False, repr=False, compare=False)
+    # 单调时钟下的最后活跃时间（过期判断用，last_active_at 仅用于展示和持久化）
+    _last_active_mono: float = field(default_factory=time.monotonic, init=False, repr=False, compare=False)
+    # 过期堆中本实例条目的标识（SessionManager 分配，用于识别失效条目）
+    _expiry_token: int = field(default=0, init=False, repr=False, compare=False)
+    # plan 序列化缓存：(plan, JSON 字符串)，plan 被替换时自动失效
+    _plan_json: Optional[Tuple[Dict, str]] = field(default=None, init=False, repr=False, compare=False)
+    # final_report 摘录缓存：(final_report, 摘录)，追问时复用
+    _final_report_truncated: Optional[Tuple[str, str]] = field(default=None, init=False, repr=False, compare=False)
+    
+    # 已结束（可追问）的会话状态
+    _DONE_STATUSES: ClassVar[FrozenSet[str]] = frozenset({"completed", "cancelled", "failed", "error"})
     
     def touch(self):
         """更新最后活跃时间"""
+        self._last_active_mono = time.monotonic()
         self.last_active_at = datetime.now()
     
     def is_expired(self, timeout_minutes: int = 60) -> bool:
         """检查会话是否过期"""
-        return datetime.now() - self.last_active_at > timedelta(minutes=timeout_minutes)
+        return time.monotonic() - self._last_active_mono > timeout_minutes * 60
+    
+    def plan_json(self) -> Optional[str]:
+        """plan 的 JSON 序列化结果（按 plan 对象缓存，只在 plan 被替换后重新编码）"""
+        plan = self.plan
+        if plan is None:
+            return None
+        cached = self._plan_json
+        if cached is not None and cached[0] is plan:
+            return cached[1]
+        encoded = _dumps(plan)
+        self._plan_json = (plan, encoded)
+        return encoded
     
     def has_history(self) -> bool:
         """是否有历史任务结果（用于判断追问）
@@ -63,7 +210,7 @@ class SessionInfo:
         对涌现模式要求 final_report 存在；
         对普通模式只要求状态已完成（DirectAgent 保留对话历史，即使没有 final_report 也能追问）。
         """
-        if self.status not in ("completed", "cancelled", "failed", "error"):
+        if self.status not in self._DONE_STATUSES:
             return False
         # direct 模式：只要已完成就可以追问（DirectAgent 内部维护 conversation_history）
         if self.mode == "direct":
@@ -71,12 +218,19 @@ class SessionInfo:
         # emergent 模式：需要 final_report
         return self.final_report is not None
     
+    def _iso_timestamps(self) -> Tuple[Optional[str], Optional[str]]:
+        """返回 (created_at, last_active_at) 的 iso 字符串（带缓存）"""
+        created_iso, self._created_iso = _cached_isoformat(self.created_at, self._created_iso)
+        last_active_iso, self._last_active_iso = _cached_isoformat(self.last_active_at, self._last_active_iso)
+        return created_iso, last_active_iso
+    
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
+        created_iso, last_active_iso = self._iso_timestamps()
         return {
             "session_id": self.session_id,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "last_active_at": self.last_active_at.isoformat() if self.last_active_at else None,
+            "created_at": created_iso,
+            "last_active_at": last_active_iso,
             "provider": self.provider,
             "model": self.model,
             "task": self.task,
@@ -87,61 +241,228 @@ class SessionInfo:
             "user_id": self.user_id,
             "mode": self.mode,
             "intervention_summary": self.intervention_summary,
-            "task_history": self.task_history,
+            "task_history": [entry.to_dict() for entry in self.task_history] if self.task_history else self.task_history,
             "has_history": self.has_history(),
         }
     
+    def to_list_item(self, has_agent: bool) -> Dict[str, Any]:
+        """转换为会话列表条目（任务描述截取前 100 字符）"""
+        created_iso, last_active_iso = self._iso_timestamps()
+        return {
+            "session_id": self.session_id,
+            "created_at": created_iso,
+            "last_active_at": last_active_iso,
+            "provider": self.provider,
+            "model": self.model,
+            "task": self.task[:100] if self.task else None,
+            "status": self.status,
+            "mode": self.mode,
+            "has_agent": has_agent,
+            "user_id": self.user_id,
+        }
+    
+    def _final_report_excerpt(self) -> str:
+        """final_report 的前 1500 字符摘录（按 final_report 对象缓存）"""
+        report = self.final_report or ""
+        cached = self._final_report_truncated
+        if cached is not None and cached[0] is report:
+            return cached[1]
+        excerpt = report[:1500]
+        if len(report) > 1500:
+            excerpt += "\n...(报告已截取前 1500 字符)"
+        self._final_report_truncated = (report, excerpt)
+        return excerpt
+    
+    def _followup_context_lines(self) -> Iterator[str]:
+        """按优先级逐行产出追问上下文：最终报告 > 历史任务 > 干预记录"""
+        # 上一轮最终报告（核心结论）
+        if self.final_report:
+            yield "## 上一轮任务的最终报告"
+            yield self._final_report_excerpt()
+            yield ""
+        
+        # 历史任务链（最近 3 轮）
+        if self.task_history:
+            yield "## 历史任务记录"
+            for i, entry in enumerate(self.task_history[-3:], 1):
+                yield f"### 第 {i} 轮"
+                yield f"- 任务: {entry.task}"
+                summary = entry.summary
+                if summary:
+                    yield f"- 结论摘要: {summary[:500]}"
+            yield ""
+        
+        # 人工干预记录
+        if self.intervention_summary:
+            yield "## 用户干预记录"
+            yield self.intervention_summary
+            yield ""
+    
     def build_followup_context(self, max_chars: int = 2500) -> str:
         """构建追问上下文摘要，注入新一轮 MasterAgent。
         
         3 层裁剪：
         1. final_report 截取前 1500 字符
         2. intervention_summary 保留（已在保存时裁剪）
-        3. 总上下文不超过 max_chars
+        3. 总上下文不超过 max_chars —— 按优先级写入，写满即停止，
+           不再先拼出完整字符串再截取
         
         Returns:
             格式化的追问上下文字符串
         """
-        parts = []
-        
-        # 历史任务链（最近 3 轮）
-        if self.task_history:
-            parts.append("## 历史任务记录")
-            for i, entry in enumerate(self.task_history[-3:], 1):
-                parts.append(f"### 第 {i} 轮")
-                parts.append(f"- 任务: {entry.get('task', '未知')}")
-                summary = entry.get('summary', '')
-                if summary:
-                    parts.append(f"- 结论摘要: {summary[:500]}")
-            parts.append("")
-        
-        # 上一轮最终报告（核心结论）
-        if self.final_report:
-            report_truncated = self.final_report[:1500]
-            if len(self.final_report) > 1500:
-                report_truncated += "\n...(报告已截取前 1500 字符)"
-            parts.append("## 上一轮任务的最终报告")
-            parts.append(report_truncated)
-            parts.append("")
-        
-        # 人工干预记录
-        if self.intervention_summary:
-            parts.append("## 用户干预记录")
-            parts.append(self.intervention_summary)
-            parts.append("")
+        parts: List[str] = []
+        remaining = max_chars
+        truncated = False
+        
+        for line in self._followup_context_lines():
+            if remaining <= 0:
+                truncated = True
+                break
+            if len(line) > remaining:
+                parts.append(line[:remaining])
+                truncated = True
+                break
+            parts.append(line)
+            remaining -= len(line) + 1  # join 时的换行符
         
         context = "\n".join(parts)
-        
-        # 总长度裁剪
-        if len(context) > max_chars:
-            context = context[:max_chars] + "\n...(上下文已截取)"
+        if truncated:
+            context += "\n...(上下文已截取)"
         
         return context
 
 
+class _SubscriberQueue:
+    """订阅者队列：deque + Event 实现的轻量队列（接口与 asyncio.Queue 的常用部分一致）
+    
+    广播热路径只做 append + Event.set，省去 asyncio.Queue 的 getter/putter 等待者簿记。
+    同时记录消费方最近一次取到事件的时间和正在等待的 get 数，
+    用于识别连接已断开但没有取消订阅的客户端。
+    """
+    __slots__ = ("maxsize", "last_get", "waiters", "_buf", "_not_empty", "_not_full")
+    
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self.last_get: float = time.monotonic()
+        self.waiters: int = 0
+        self._buf: Deque[Any] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+    
+    def qsize(self) -> int:
+        return len(self._buf)
+    
+    def empty(self) -> bool:
+        return not self._buf
+    
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self._buf)
+    
+    def put_nowait(self, item: Any) -> None:
+        if 0 < self.maxsize <= len(self._buf):
+            raise asyncio.QueueFull
+        self._buf.append(item)
+        self._not_empty.set()
+    
+    async def put(self, item: Any) -> None:
+        """队列满时等待消费方腾出空间"""
+        while self.full():
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.put_nowait(item)
+    
+    def get_nowait(self) -> Any:
+        if not self._buf:
+            raise asyncio.QueueEmpty
+        item = self._buf.popleft()
+        self._not_full.set()
+        return item
+    
+    async def get(self) -> Any:
+        self.waiters += 1
+        try:
+            while not self._buf:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+        finally:
+            self.waiters -= 1
+        item = self.get_nowait()
+        self.last_get = time.monotonic()
+        return item
+    
+    def is_idle(self, now: float, timeout: float) -> bool:
+        """没有消费方在等待，且超过 timeout 秒没有取过事件"""
+        return self.waiters == 0 and now - self.last_get > timeout
+
+
+class _WriteBuffer:
+    """按时间窗口合并写入的缓冲区
+    
+    窗口期内提交的条目按 key 暂存（merge=True 时同 key 的 dict 依次合并），
+    窗口到期或条数达到上限时交给 flush_fn 一次写入；提交方等待所在批次的写入结果。
+    flush_fn 接收 {key: item}，返回 {key: 是否成功}。
+    """
+    __slots__ = ("_flush_fn", "_window", "_max_items", "_items", "_waiters", "_loop", "_handle", "_flush_lock")
+    
+    def __init__(self, flush_fn, window: float, max_items: int):
+        self._flush_fn = flush_fn
+        self._window = window
+        self._max_items = max_items
+        self._items: Dict[Any, Any] = {}
+        self._waiters: List[Tuple[Any, asyncio.Future]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        # 串行化 flush：后到的 flush 会等待进行中的批次写完，保证调用方能读到之前的写入
+        self._flush_lock = asyncio.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    async def submit(self, key: Any, item: Any, merge: bool = False) -> bool:
+        """提交一条写入，等待所在批次完成后返回是否成功"""
+        loop = asyncio.get_running_loop()
+        if self._items and self._loop is not loop:
+            # 批次属于其他事件循环，直接单条写入
+            return (await self._flush_fn({key: item})).get(key, False)
+        
+        if merge and key in self._items:
+            self._items[key].update(item)
+        else:
+            self._items[key] = dict(item) if merge else item
+        future = loop.create_future()
+        self._waiters.append((key, future))
+        
+        if len(self._items) >= self._max_items:
+            loop.create_task(self.flush())
+        elif self._handle is None:
+            self._loop = loop
+            self._handle = loop.call_later(self._window, lambda: loop.create_task(self.flush()))
+        return await future
+    
+    async def flush(self):
+        """立即写入当前批次"""
+        async with self._flush_lock:
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+            items, waiters = self._items, self._waiters
+            self._items, self._waiters, self._loop = {}, [], None
+            if not items:
+                return
+            
+            try:
+                results = await self._flush_fn(items)
+            except Exception as e:
+                logger.error(f"[SessionManager] Buffered write failed: {e}")
+                results = {}
+        for key, future in waiters:
+            if not future.done():
+                future.set_result(results.get(key, False))
+
+
 class SessionManager:
     """
-    会话管理器 - 单例模式
+    会话管理器 - 全局唯一实例通过 get_session_manager() 获取
     
     管理所有活跃会话，确保每个会话有独立的 MasterAgent 实例
     
@@ -152,30 +473,57 @@ class SessionManager:
     - 【新增】订阅者管理：支持多客户端订阅同一会话的 SSE 事件流
     """
     
-    _instance: Optional['SessionManager'] = None
-    _lock: Lock = Lock()
+    # 订阅者分段锁数量 / 每会话广播源队列容量
+    _SUBSCRIBER_LOCK_STRIPES: int = 16
+    _BROADCAST_QUEUE_MAXSIZE: int = 1000
+    # 背压模式订阅者单个事件的最长等待时间（秒），超时视为丢弃，避免卡死的客户端拖住整个会话
+    _BLOCKING_PUT_TIMEOUT: float = 30.0
+    # 订阅者闲置判定时间 / 闲置订阅者巡检间隔（秒）
+    _SUBSCRIBER_IDLE_TIMEOUT: float = 300.0
+    _SUBSCRIBER_SWEEP_INTERVAL: float = 60.0
+    # Agent 类在首次使用时解析并缓存（core 包初始化依赖本模块，不能在模块顶部导入）
+    _MasterAgent: Optional[type] = None
+    _DirectAgent: Optional[type] = None
     
-    def __new__(cls):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance._initialized = False
-        return cls._instance
+    @classmethod
+    def _ensure_imports(cls) -> Tuple[type, type]:
+        """解析并缓存 MasterAgent / DirectAgent 类，后续调用直接返回类属性"""
+        if cls._MasterAgent is None:
+            from core.master_agent import MasterAgent
+            from core.direct_agent import DirectAgent
+            cls._MasterAgent = MasterAgent
+            cls._DirectAgent = DirectAgent
+        return cls._MasterAgent, cls._DirectAgent
     
     def __init__(self):
-        if self._initialized:
-            return
-        
         # 内存缓存 - 活跃会话
         self._sessions: Dict[str, SessionInfo] = {}
+        # 二级索引：user_id -> session_id 有序集合（dict 保持创建顺序，list_sessions 只遍历该用户的会话）
+        self._user_index: Dict[str, Dict[str, None]] = defaultdict(dict)
+        # 过期最小堆：(最后活跃单调时间, token, session_id)，每个会话至多一个有效条目
+        # touch 不入堆；弹出时若会话已被续期则按新时间重新入堆（惰性调度）
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._expiry_tokens = itertools.count(1)
         
         # MasterAgent 实例存储 (延迟导入，避免循环依赖)
         self._agents: Dict[str, Any] = {}  # session_id -> MasterAgent
+        # Agent 访问统计：session_id -> (hit_count, last_access_ts)，用于 v-LRU 淘汰
+        self._agent_stats: Dict[str, Tuple[int, float]] = {}
+        # 被 LRU 淘汰的 DirectAgent 对话历史：session_id -> conversation_history，
+        # 重建 DirectAgent 时恢复，保证普通模式淘汰后仍可追问
+        self._evicted_direct_history: Dict[str, List[Any]] = {}
+        # 正在执行任务的会话：session_id -> 进行中的任务流数量（由 run_task 维护）
+        # SessionInfo.status 在会话关闭前一直是 "active"，不能用来判断是否有任务在跑
+        self._running_tasks: Dict[str, int] = {}
         
         # 配置
         self._session_timeout_minutes: int = 60
         self._max_sessions: int = 100
+        self._max_agents: int = 32  # 常驻内存的 Agent 上限（Agent 远比 SessionInfo 占内存）
+        
+        # 空闲 MasterAgent 池：(provider, model) -> 已重置的实例，绑定新会话时复用
+        self._agent_pool: Dict[Tuple[str, Optional[str]], Deque[Any]] = defaultdict(deque)
+        self._agent_pool_size: int = 5
         
         # 清理任务
         self._cleanup_task: Optional[asyncio.Task] = None
@@ -183,13 +531,39 @@ class SessionManager:
         # 数据仓库（依赖注入）
         self._repository = None
         
-        # 【新增】订阅者管理
-        # session_id -> List[asyncio.Queue] - 每个订阅者一个 queue
-        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
-        # 订阅者锁，保证线程安全
-        self._subscriber_lock = asyncio.Lock() if asyncio.get_event_loop().is_running() else None
+        # 会话创建微批：窗口期内的并发创建合并为一次批量写入
+        self._pending_creates: List[Tuple[Any, asyncio.Future]] = []
+        self._create_batch_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._create_batch_window: float = 0.005  # 秒
+        
+        # Agent / 中继消息 / 消息写缓冲：窗口期内的写入合并为批量提交（同一 Agent 的多次更新合并为一次）
+        self._agent_writes = _WriteBuffer(self._flush_agent_writes, window=0.02, max_items=200)
+        self._relay_message_writes = _WriteBuffer(self._flush_relay_message_writes, window=0.02, max_items=200)
+        self._message_writes = _WriteBuffer(self._flush_message_writes, window=0.02, max_items=200)
+        
+        # 历史读取缓存：(session_id, 种类, limit) -> (写入版本号, 过期时刻, 结果)
+        # 写入时递增 (session_id, 种类) 的版本号使旧结果失效；TTL 兜底，LRU 限制条目数
+        self._read_cache: "OrderedDict[Tuple[str, str, int], Tuple[int, float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._read_versions: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._read_cache_ttl: float = 30.0  # 秒
+        self._read_cache_max: int = 1024
+        
+        # 【新增】订阅者管理（每会话独立 fan-out，发布路径无全局锁）
+        # session_id -> 广播源队列，由该会话唯一的 fan-out 任务消费
+        self._broadcast_queues: Dict[str, asyncio.Queue] = {}
+        # session_id -> 订阅者 queue 集合（copy-on-write，fan-out 直接迭代快照）
+        self._fanout: Dict[str, frozenset] = {}
+        # session_id -> fan-out 任务
+        self._fanout_tasks: Dict[str, asyncio.Task] = {}
+        # session_id -> 选择背压模式（block=True）的订阅者 queue 集合
+        self._blocking_fanout: Dict[str, frozenset] = {}
+        # 因队列已满而丢弃的事件数（订阅者 + 广播源）
+        self._dropped_events: int = 0
+        # 分段锁：只串行化同一分段内的 subscribe/unsubscribe
+        self._subscriber_locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(self._SUBSCRIBER_LOCK_STRIPES)]
+        # 闲置订阅者巡检任务（有订阅者时运行，全部退订后自动结束）
+        self._subscriber_sweep_task: Optional[asyncio.Task] = None
         
-        self._initialized = True
         logger.info("[SessionManager] Initialized (without repository)")
     
     def set_repository(self, repository):
@@ -204,11 +578,62 @@ class SessionManager:
     def get_repository(self):
         """获取数据仓库（延迟初始化）"""
         if self._repository is None:
-            from storage import get_repository
             self._repository = get_repository()
             logger.info(f"[SessionManager] Repository auto-initialized: {type(self._repository).__name__}")
         return self._repository
     
+    def _add_session_info(self, info: SessionInfo) -> SessionInfo:
+        """写入内存缓存并维护 user_id 索引"""
+        self._sessions[info.session_id] = info
+        info._expiry_token = next(self._expiry_tokens)
+        heapq.heappush(self._expiry_heap, (info._last_active_mono, info._expiry_token, info.session_id))
+        if info.user_id:
+            self._user_index[info.user_id][info.session_id] = None
+        return info
+    
+    def _remove_session_info(self, session_id: str) -> Optional[SessionInfo]:
+        """从内存缓存移除会话并维护 user_id 索引"""
+        info = self._sessions.pop(session_id, None)
+        self._drop_read_cache(session_id)
+        self._evicted_direct_history.pop(session_id, None)
+        if info is not None and info.user_id:
+            user_sessions = self._user_index.get(info.user_id)
+            if user_sessions is not None:
+                user_sessions.pop(session_id, None)
+                if not user_sessions:
+                    del self._user_index[info.user_id]
+        return info
+    
+    async def _cached_read(self, session_id: str, kind: str, limit: int, load) -> List[Dict[str, Any]]:
+        """带版本号校验的读取缓存；命中时返回结果列表的浅拷贝"""
+        key = (session_id, kind, limit)
+        version = self._read_versions.get((session_id, kind), 0)
+        now = time.monotonic()
+        cached = self._read_cache.get(key)
+        if cached is not None and cached[0] == version and cached[1] > now:
+            self._read_cache.move_to_end(key)
+            return list(cached[2])
+        
+        result = await load()
+        # 读取期间有新的写入则不缓存，避免存入过期结果
+        if self._read_versions.get((session_id, kind), 0) == version:
+            self._read_cache[key] = (version, now + self._read_cache_ttl, result)
+            self._read_cache.move_to_end(key)
+            while len(self._read_cache) > self._read_cache_max:
+                self._read_cache.popitem(last=False)
+        return list(result)
+    
+    def _invalidate_reads(self, session_id: str, kind: str):
+        """会话有新的写入，使该种类的读取缓存失效"""
+        self._read_versions[(session_id, kind)] += 1
+    
+    def _drop_read_cache(self, session_id: str):
+        """会话移出内存时清理其读取缓存和版本号"""
+        for kind in ("messages", "relay"):
+            self._read_versions.pop((session_id, kind), None)
+        for key in [key for key in self._read_cache if key[0] == session_id]:
+            del self._read_cache[key]
+    
     async def create_session(
         self,
         provider: str = "openai",
@@ -230,11 +655,9 @@ class SessionManager:
         Returns:
             新创建的 session_id
         """
-        # 检查是否超过最大会话数
-        if len(self._sessions) >= self._max_sessions:
-            await self._cleanup_expired_sessions()
-            if len(self._sessions) >= self._max_sessions:
-                raise RuntimeError(f"Maximum sessions ({self._max_sessions}) reached")
+        # 检查是否超过最大会话数（先淘汰过期/最久未用的空闲会话）
+        if not self._ensure_session_capacity():
+            raise RuntimeError(f"Maximum sessions ({self._max_sessions}) reached")
         
         session_id = str(uuid.uuid4())
         now = datetime.now()
@@ -251,12 +674,10 @@ class SessionManager:
         )
         
         # 保存到内存
-        self._sessions[session_id] = session_info
+        self._add_session_info(session_info)
         
         # 持久化到数据库
         try:
-            repo = self.get_repository()
-            from storage.base import SessionRecord
             record = SessionRecord(
                 session_id=session_id,
                 task=task or "",
@@ -269,7 +690,7 @@ class SessionManager:
                 updated_at=now,
                 last_active_at=now,
             )
-            await repo.create_session(record)
+            await self._submit_session_create(record)
             logger.info(f"[SessionManager] Session persisted to database: {session_id[:8]}...")
         except Exception as e:
             logger.error(f"[SessionManager] Failed to persist session: {e}")
@@ -291,7 +712,8 @@ class SessionManager:
         注意：当事件循环正在运行时，直接在内存中创建会话，
         并异步持久化到数据库。不会重复创建会话。
         """
-        import asyncio
+        if not self._ensure_session_capacity():
+            raise RuntimeError(f"Maximum sessions ({self._max_sessions}) reached")
         
         # 先生成唯一的 session_id
         session_id = str(uuid.uuid4())
@@ -309,7 +731,7 @@ class SessionManager:
         )
         
         # 保存到内存
-        self._sessions[session_id] = session_info
+        self._add_session_info(session_info)
         
         # 异步持久化到数据库
         try:
@@ -329,8 +751,6 @@ class SessionManager:
     async def _persist_session(self, session_info: SessionInfo):
         """异步持久化会话"""
         try:
-            repo = self.get_repository()
-            from storage.base import SessionRecord
             record = SessionRecord(
                 session_id=session_info.session_id,
                 task=session_info.task or "",
@@ -339,15 +759,59 @@ class SessionManager:
                 model=session_info.model,
                 mode=session_info.mode,
                 user_id=session_info.user_id,
-                plan_json=json.dumps(session_info.plan) if session_info.plan else None,
+                plan_json=session_info.plan_json() if session_info.plan else None,
                 created_at=session_info.created_at,
                 updated_at=session_info.last_active_at,
                 last_active_at=session_info.last_active_at,
             )
-            await repo.create_session(record)
+            await self._submit_session_create(record)
         except Exception as e:
             logger.error(f"[SessionManager] Async persist failed: {e}")
     
+    async def _submit_session_create(self, record) -> Any:
+        """提交会话创建到微批队列，等待所在批次写入完成
+        
+        同一事件循环中窗口期（5ms）内的创建合并为一次 bulk_create_sessions。
+        """
+        loop = asyncio.get_running_loop()
+        if self._pending_creates and self._create_batch_loop is not loop:
+            # 批次属于其他事件循环（同步创建路径），直接单条写入
+            return await self.get_repository().create_session(record)
+        
+        future = loop.create_future()
+        self._pending_creates.append((record, future))
+        if len(self._pending_creates) == 1:
+            self._create_batch_loop = loop
+            loop.call_later(self._create_batch_window, lambda: loop.create_task(self._flush_pending_creates()))
+        return await future
+    
+    async def _flush_pending_creates(self):
+        """批量写入当前批次；批量失败时回退为逐条写入，单条失败不影响其他会话"""
+        batch, self._pending_creates = self._pending_creates, []
+        self._create_batch_loop = None
+        if not batch:
+            return
+        
+        repo = self.get_repository()
+        records = [record for record, _ in batch]
+        try:
+            results = await repo.bulk_create_sessions(records)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            return
+        except Exception as e:
+            logger.warning(f"[SessionManager] Bulk session create failed, retrying one by one: {e}")
+        
+        for record, future in batch:
+            try:
+                result = await repo.create_session(record)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+    
     def get_or_create_agent(
         self,
         session_id: str,
@@ -367,40 +831,36 @@ class SessionManager:
         Returns:
             该会话专属的 MasterAgent 实例
         """
-        # 延迟导入，避免循环依赖
-        from core.master_agent import MasterAgent
-        
         # 如果会话不存在，先创建会话
-        if session_id not in self._sessions:
+        info = self._sessions.get(session_id)
+        if info is None:
+            if not self._ensure_session_capacity():
+                raise RuntimeError(f"Maximum sessions ({self._max_sessions}) reached")
             now = datetime.now()
-            self._sessions[session_id] = SessionInfo(
+            info = self._add_session_info(SessionInfo(
                 session_id=session_id,
                 created_at=now,
                 last_active_at=now,
                 provider=provider,
                 model=model
-            )
+            ))
             # 异步持久化
-            asyncio.create_task(self._persist_session(self._sessions[session_id]))
+            asyncio.create_task(self._persist_session(info))
             logger.info(f"[SessionManager] Auto-created session: {session_id[:8]}...")
         
         # 更新最后活跃时间
-        self._sessions[session_id].touch()
+        info.touch()
         asyncio.create_task(self._update_session_activity(session_id))
         
         # 如果 Agent 不存在，创建新的
-        if session_id not in self._agents:
+        agent = self._agents.get(session_id)
+        if agent is None:
+            self._evict_agents_if_needed()
             # 从 SessionInfo 中获取 user_id 传递给 MasterAgent
-            session_user_id = self._sessions[session_id].user_id if session_id in self._sessions else None
-            self._agents[session_id] = MasterAgent(
-                provider_type=provider,
-                model=model,
-                session_id=session_id,  # 传入 session_id 用于内部隔离
-                user_id=session_user_id,
-            )
-            logger.info(f"[SessionManager] Created MasterAgent for session: {session_id[:8]}...")
+            agent = self._agents[session_id] = self._checkout_master_agent(session_id, provider, model, info.user_id)
         
-        return self._agents[session_id]
+        self._record_agent_access(session_id)
+        return agent
     
     def get_or_create_direct_agent(
         self,
@@ -419,38 +879,46 @@ class SessionManager:
         Returns:
             该会话专属的 DirectAgent 实例
         """
-        from core.direct_agent import DirectAgent
+        DirectAgent = self._ensure_imports()[1]
         
         # 如果会话不存在，先创建
-        if session_id not in self._sessions:
+        info = self._sessions.get(session_id)
+        if info is None:
+            if not self._ensure_session_capacity():
+                raise RuntimeError(f"Maximum sessions ({self._max_sessions}) reached")
             now = datetime.now()
-            self._sessions[session_id] = SessionInfo(
+            info = self._add_session_info(SessionInfo(
                 session_id=session_id,
                 created_at=now,
                 last_active_at=now,
                 provider=provider,
                 model=model,
                 mode="direct"
-            )
-            asyncio.create_task(self._persist_session(self._sessions[session_id]))
+            ))
+            asyncio.create_task(self._persist_session(info))
             logger.info(f"[SessionManager] Auto-created session (direct): {session_id[:8]}...")
         
-        self._sessions[session_id].touch()
+        info.touch()
         asyncio.create_task(self._update_session_activity(session_id))
         
         # 如果 Agent 不存在或不是 DirectAgent，创建新的
-        existing = self._agents.get(session_id)
-        if existing is None or not isinstance(existing, DirectAgent):
-            session_user_id = self._sessions[session_id].user_id if session_id in self._sessions else None
-            self._agents[session_id] = DirectAgent(
+        agent = self._agents.get(session_id)
+        if agent is None or not isinstance(agent, DirectAgent):
+            self._evict_agents_if_needed()
+            agent = self._agents[session_id] = DirectAgent(
                 provider_type=provider,
                 model=model,
                 session_id=session_id,
-                user_id=session_user_id,
+                user_id=info.user_id,
             )
+            # 之前被淘汰过：恢复对话历史
+            history = self._evicted_direct_history.pop(session_id, None)
+            if history:
+                agent.conversation_history = history
             logger.info(f"[SessionManager] Created DirectAgent for session: {session_id[:8]}...")
         
-        return self._agents[session_id]
+        self._record_agent_access(session_id)
+        return agent
     
     async def _update_session_activity(self, session_id: str):
         """更新会话活跃时间到数据库"""
@@ -470,10 +938,159 @@ class SessionManager:
         Returns:
             MasterAgent 实例，如果不存在返回 None
         """
-        if session_id in self._sessions:
-            self._sessions[session_id].touch()
+        info = self._sessions.get(session_id)
+        if info is not None:
+            info.touch()
+        
+        agent = self._agents.get(session_id)
+        if agent is not None:
+            self._record_agent_access(session_id)
+        return agent
+    
+    def get_or_restore_agent(self, session_id: str) -> Optional[Any]:
+        """
+        获取指定会话的 Agent；会话仍在内存但 Agent 已被淘汰时按会话配置重建
         
-        return self._agents.get(session_id)
+        Args:
+            session_id: 会话 ID
+            
+        Returns:
+            Agent 实例，会话不存在时返回 None
+        """
+        agent = self.get_agent(session_id)
+        if agent is not None:
+            return agent
+        
+        info = self._sessions.get(session_id)
+        if info is None:
+            return None
+        if info.mode == "direct":
+            return self.get_or_create_direct_agent(session_id, info.provider, info.model)
+        return self.get_or_create_agent(session_id, info.provider, info.model)
+    
+    async def run_task(self, session_id: str, task_stream: AsyncGenerator[Any, None]) -> AsyncGenerator[Any, None]:
+        """透传 Agent 的任务事件流，迭代期间会话计为运行中
+        
+        运行中的会话不会被 Agent 淘汰、会话 LRU 淘汰，其 Agent 也不会被回收到空闲池。
+        """
+        self._running_tasks[session_id] = self._running_tasks.get(session_id, 0) + 1
+        try:
+            async for event in task_stream:
+                yield event
+        finally:
+            remaining = self._running_tasks.get(session_id, 0) - 1
+            if remaining > 0:
+                self._running_tasks[session_id] = remaining
+            else:
+                self._running_tasks.pop(session_id, None)
+            await task_stream.aclose()
+    
+    def _is_session_running(self, session_id: str) -> bool:
+        """会话是否有正在执行的任务（run_task 迭代中）"""
+        return session_id in self._running_tasks
+    
+    def _record_agent_access(self, session_id: str):
+        """记录 Agent 访问（命中次数 + 最近访问时间）"""
+        hits, _ = self._agent_stats.get(session_id, (0, 0.0))
+        self._agent_stats[session_id] = (hits + 1, time.monotonic())
+    
+    def _release_agent(self, session_id: str, reason: str = "close", recycle: bool = False) -> Optional[Any]:
+        """cleanup 并移除会话的 Agent 实例（SessionInfo 不受影响）
+        
+        Args:
+            session_id: 会话 ID
+            reason: 释放原因（日志用）
+            recycle: 是否将 MasterAgent 重置后放回空闲池。
+                仅当 Agent 已没有正在运行的任务时才能回收。
+        
+        Returns:
+            被移除的 Agent 实例，不存在时返回 None
+        """
+        self._agent_stats.pop(session_id, None)
+        agent = self._agents.pop(session_id, None)
+        if agent is None:
+            return None
+        
+        if recycle and hasattr(agent, 'reset_session_state'):
+            pool = self._agent_pool[(agent.provider_type, agent.model)]
+            if len(pool) < self._agent_pool_size:
+                try:
+                    agent.reset_session_state()
+                    pool.append(agent)
+                    return agent
+                except Exception as e:
+                    logger.error(f"[SessionManager] Error resetting agent for pool ({reason}): {e}")
+                    return agent
+        
+        if hasattr(agent, 'cleanup'):
+            try:
+                agent.cleanup()
+            except Exception as e:
+                logger.error(f"[SessionManager] Error cleaning up agent ({reason}): {e}")
+        return agent
+    
+    def _checkout_master_agent(
+        self,
+        session_id: str,
+        provider: str,
+        model: Optional[str],
+        user_id: Optional[str],
+    ) -> Any:
+        """从空闲池取出 MasterAgent 并绑定会话，池为空时新建"""
+        pool = self._agent_pool.get((provider, model))
+        if pool:
+            agent = pool.popleft()
+            agent.bind_session(session_id, user_id)
+            logger.info(f"[SessionManager] Reused pooled MasterAgent for session: {session_id[:8]}...")
+            return agent
+        
+        MasterAgent = self._ensure_imports()[0]
+        
+        agent = MasterAgent(
+            provider_type=provider,
+            model=model,
+            session_id=session_id,  # 传入 session_id 用于内部隔离
+            user_id=user_id,
+        )
+        logger.info(f"[SessionManager] Created MasterAgent for session: {session_id[:8]}...")
+        return agent
+    
+    def _evict_agents_if_needed(self):
+        """Agent 数量达到上限时按 v-LRU 淘汰一个空闲 Agent
+        
+        只淘汰没有任务在执行（不在 run_task 迭代中）的 Agent：
+        1. 取空闲 Agent 中最久未访问的 10%（至少 1 个）作为候选尾部
+        2. 在尾部中按价值 log(hits + has_report) 取最低者淘汰
+        
+        淘汰只释放 Agent，保留 SessionInfo，下次请求时可低成本重建。
+        """
+        if len(self._agents) < self._max_agents:
+            return
+        
+        idle = [
+            (session_id, self._agent_stats.get(session_id, (0, 0.0)))
+            for session_id in self._agents
+            if not self._is_session_running(session_id)
+        ]
+        if not idle:
+            return
+        
+        recency_tail = heapq.nsmallest(max(1, len(idle) // 10), idle, key=lambda kv: kv[1][1])
+        
+        def value(kv) -> float:
+            session_id, (hits, _) = kv
+            info = self._sessions.get(session_id)
+            has_report = 1 if info is not None and info.final_report else 0
+            return math.log(hits + has_report + 1e-6)
+        
+        victim, _ = min(recency_tail, key=value)
+        # DirectAgent 的对话历史只在内存中（cleanup 会清空），淘汰前先保存副本
+        history = getattr(self._agents.get(victim), "conversation_history", None)
+        if history:
+            self._evicted_direct_history[victim] = list(history)
+        self._release_agent(victim, reason="evict", recycle=True)
+        logger.info(f"[SessionManager] Evicted idle agent for session: {victim[:8]}... "
+                    f"(agents={len(self._agents)}/{self._max_agents})")
     
     def get_session_info(self, session_id: str) -> Optional[SessionInfo]:
         """获取会话信息（从内存缓存）"""
@@ -499,21 +1116,11 @@ class SessionManager:
         """
         if not user_id:
             return []
-        sessions = [info for info in self._sessions.values() if info.user_id == user_id]
+        session_ids = self._user_index.get(user_id, ())
         return [
-            {
-                "session_id": info.session_id,
-                "created_at": info.created_at.isoformat() if info.created_at else None,
-                "last_active_at": info.last_active_at.isoformat() if info.last_active_at else None,
-                "provider": info.provider,
-                "model": info.model,
-                "task": info.task[:100] if info.task else None,
-                "status": info.status,
-                "mode": info.mode,
-                "has_agent": info.session_id in self._agents,
-                "user_id": info.user_id,
-            }
-            for info in sessions
+            self._sessions[session_id].to_list_item(session_id in self._agents)
+            for session_id in session_ids
+            if session_id in self._sessions
         ]
     
     async def list_sessions_from_db(
@@ -563,11 +1170,15 @@ class SessionManager:
         同时更新内存缓存和数据库
         """
         # 更新内存缓存
-        if session_id in self._sessions:
-            session = self._sessions[session_id]
+        session = self._sessions.get(session_id)
+        if session is not None:
+            previous_user_id = session.user_id
             for key, value in updates.items():
                 if hasattr(session, key):
                     setattr(session, key, value)
+            if session.user_id != previous_user_id:
+                self._remove_session_info(session_id)
+                self._add_session_info(session)
             session.touch()
         
         # 更新数据库
@@ -578,7 +1189,12 @@ class SessionManager:
             db_updates = {}
             for key, value in updates.items():
                 if key == "plan" and value is not None:
-                    db_updates["plan_json"] = json.dumps(value)
+                    # 内存中已有同一 plan 时复用其序列化缓存
+                    session = self._sessions.get(session_id)
+                    if session is not None and session.plan is value:
+                        db_updates["plan_json"] = session.plan_json()
+                    else:
+                        db_updates["plan_json"] = _dumps(value)
                 else:
                     db_updates[key] = value
             
@@ -601,21 +1217,13 @@ class SessionManager:
         Returns:
             是否成功关闭
         """
-        # 清理 MasterAgent
-        if session_id in self._agents:
-            agent = self._agents[session_id]
-            # 清理 Agent 内部资源
-            if hasattr(agent, 'cleanup'):
-                try:
-                    agent.cleanup()
-                except Exception as e:
-                    logger.error(f"[SessionManager] Error cleaning up agent: {e}")
-            del self._agents[session_id]
+        # 清理 MasterAgent（没有运行中任务时回收到空闲池）
+        self._release_agent(session_id, recycle=not self._is_session_running(session_id))
         
         # 更新状态
-        if session_id in self._sessions:
-            self._sessions[session_id].status = "completed"
-            del self._sessions[session_id]
+        info = self._remove_session_info(session_id)
+        if info is not None:
+            info.status = "completed"
         
         # 更新数据库状态（不删除，保留历史）
         try:
@@ -636,20 +1244,13 @@ class SessionManager:
         if session_id not in self._sessions and session_id not in self._agents:
             return False
         
-        # 清理 MasterAgent
-        if session_id in self._agents:
-            agent = self._agents[session_id]
-            if hasattr(agent, 'cleanup'):
-                try:
-                    agent.cleanup()
-                except Exception as e:
-                    logger.error(f"[SessionManager] Error cleaning up agent: {e}")
-            del self._agents[session_id]
+        # 清理 MasterAgent（没有运行中任务时回收到空闲池）
+        self._release_agent(session_id, recycle=not self._is_session_running(session_id))
         
         # 更新内存状态
-        if session_id in self._sessions:
-            self._sessions[session_id].status = "completed"
-            del self._sessions[session_id]
+        info = self._remove_session_info(session_id)
+        if info is not None:
+            info.status = "completed"
         
         # 异步更新数据库
         asyncio.create_task(self._update_session_status_in_db(session_id, "completed"))
@@ -663,9 +1264,11 @@ class SessionManager:
         provider: str = "openai",
         model: Optional[str] = None
     ) -> Any:
-        """准备追问：cleanup 旧 Agent、保留 SessionInfo、创建新 MasterAgent。
+        """准备追问：回收旧 Agent、保留 SessionInfo、绑定新 MasterAgent。
         
-        关键：不删除 SessionInfo（保留历史数据），只 cleanup 并替换 Agent 实例。
+        关键：不删除 SessionInfo（保留历史数据），只重置并替换 Agent 实例。
+        新实例优先从空闲池复用，避免重复构造。
+        上一轮任务仍在执行时旧 Agent 直接 cleanup 而不回收，避免同一实例被重新绑定后两轮并发修改。
         
         Args:
             session_id: 会话 ID
@@ -673,36 +1276,25 @@ class SessionManager:
             model: 模型名称
             
         Returns:
-            新创建的 MasterAgent 实例
+            绑定到该会话的 MasterAgent 实例
         """
-        from core.master_agent import MasterAgent
-        
-        # 1. Cleanup 旧 Agent（如果存在）
-        if session_id in self._agents:
-            agent = self._agents[session_id]
-            if hasattr(agent, 'cleanup'):
-                try:
-                    agent.cleanup()
-                except Exception as e:
-                    logger.error(f"[SessionManager] Error cleaning up agent for followup: {e}")
-            del self._agents[session_id]
+        # 1. 释放旧 Agent（如果存在）：上一轮已结束才重置后放回空闲池
+        self._release_agent(session_id, reason="followup", recycle=not self._is_session_running(session_id))
+        self._evict_agents_if_needed()
         
         # 2. 更新 SessionInfo 状态为 active（重新激活）
-        if session_id in self._sessions:
-            self._sessions[session_id].status = "active"
-            self._sessions[session_id].touch()
-        
-        # 3. 创建新 MasterAgent
-        session_user_id = self._sessions[session_id].user_id if session_id in self._sessions else None
-        new_agent = MasterAgent(
-            provider_type=provider,
-            model=model,
-            session_id=session_id,
-            user_id=session_user_id,
-        )
+        info = self._sessions.get(session_id)
+        if info is not None:
+            info.status = "active"
+            info.touch()
+        
+        # 3. 绑定新 MasterAgent（优先复用空闲池中的实例）
+        session_user_id = info.user_id if info is not None else None
+        new_agent = self._checkout_master_agent(session_id, provider, model, session_user_id)
         self._agents[session_id] = new_agent
+        self._record_agent_access(session_id)
         
-        logger.info(f"[SessionManager] Prepared followup for session: {session_id[:8]}... (new MasterAgent created)")
+        logger.info(f"[SessionManager] Prepared followup for session: {session_id[:8]}... (new MasterAgent bound)")
         return new_agent
     
     def save_task_completion(
@@ -722,12 +1314,13 @@ class SessionManager:
             intervention_summary: 人工干预摘要
             roles: 角色配置列表
         """
-        if session_id not in self._sessions:
+        session = self._sessions.get(session_id)
+        if session is None:
             logger.warning(f"[SessionManager] Session not found for save_task_completion: {session_id[:8]}")
             return
         
-        session = self._sessions[session_id]
         session.final_report = final_report
+        session._final_report_excerpt()  # 预生成摘录，追问时直接复用
         if plan:
             session.plan = plan
         session.intervention_summary = intervention_summary
@@ -739,12 +1332,12 @@ class SessionManager:
         
         # 生成当前轮次的摘要条目
         summary = final_report[:500] if final_report else ""
-        session.task_history.append({
-            "task": session.task or "未知任务",
-            "summary": summary,
-            "roles": [r.get("name", "") for r in (roles or [])],
-            "timestamp": datetime.now().isoformat(),
-        })
+        session.task_history.append(TaskHistoryEntry(
+            task=session.task or "未知任务",
+            summary=summary,
+            roles=[r.get("name", "") for r in (roles or [])],
+            timestamp=datetime.now().isoformat(),
+        ))
         
         # 只保留最近 3 轮
         if len(session.task_history) > 3:
@@ -777,14 +1370,90 @@ class SessionManager:
             logger.error(f"[SessionManager] Failed to delete session: {e}")
             return False
     
+    def _pop_expired_session_ids(self) -> List[str]:
+        """从过期堆中弹出所有已过期会话
+        
+        堆顶未过期即停止，无需扫描全部会话：
+        - 会话已移除或条目 token 不匹配：丢弃失效条目
+        - 会话期间被 touch 过：按最新活跃时间重新入堆
+        """
+        timeout_seconds = self._session_timeout_minutes * 60
+        deadline = time.monotonic() - timeout_seconds
+        heap = self._expiry_heap
+        expired: List[str] = []
+        
+        while heap and heap[0][0] < deadline:
+            _, token, session_id = heapq.heappop(heap)
+            info = self._sessions.get(session_id)
+            if info is None or info._expiry_token != token:
+                continue
+            if info.is_expired(self._session_timeout_minutes):
+                expired.append(session_id)
+            else:
+                heapq.heappush(heap, (info._last_active_mono, token, session_id))
+        
+        return expired
+    
+    def _pop_lru_idle_session_id(self) -> Optional[str]:
+        """从过期堆中取出最久未活跃的空闲会话（跳过运行中的会话）"""
+        heap = self._expiry_heap
+        running: List[Tuple[float, int, str]] = []
+        victim: Optional[str] = None
+        
+        while heap:
+            entry = heapq.heappop(heap)
+            ts, token, session_id = entry
+            info = self._sessions.get(session_id)
+            if info is None or info._expiry_token != token:
+                continue
+            if info._last_active_mono != ts:
+                # 条目已过时（期间被 touch 过），按最新时间重新入堆
+                heapq.heappush(heap, (info._last_active_mono, token, session_id))
+                continue
+            if self._is_session_running(session_id):
+                running.append(entry)
+                continue
+            victim = session_id
+            break
+        
+        for entry in running:
+            heapq.heappush(heap, entry)
+        return victim
+    
+    def _evict_session(self, session_id: str, reason: str):
+        """从内存缓存淘汰会话（数据库记录保留，可再从数据库加载历史）"""
+        self._release_agent(session_id, reason=reason, recycle=not self._is_session_running(session_id))
+        self._remove_session_info(session_id)
+        logger.info(f"[SessionManager] Evicted session ({reason}): {session_id[:8]}...")
+    
+    def _ensure_session_capacity(self) -> bool:
+        """确保内存缓存还有空位
+        
+        达到 _max_sessions 时依次淘汰：过期会话 → 最久未活跃的空闲会话。
+        运行中的会话不会被淘汰。
+        
+        Returns:
+            是否有空位
+        """
+        if len(self._sessions) < self._max_sessions:
+            return True
+        
+        for session_id in self._pop_expired_session_ids():
+            self._evict_session(session_id, reason="expired")
+        
+        while len(self._sessions) >= self._max_sessions:
+            victim = self._pop_lru_idle_session_id()
+            if victim is None:
+                logger.warning(f"[SessionManager] Session cache full ({self._max_sessions}), all sessions running")
+                return False
+            self._evict_session(victim, reason="lru")
+        
+        return True
+    
     async def _cleanup_expired_sessions(self):
         """清理过期会话"""
         # 清理内存中的过期会话
-        expired_sessions = [
-            session_id
-            for session_id, info in self._sessions.items()
-            if info.is_expired(self._session_timeout_minutes)
-        ]
+        expired_sessions = self._pop_expired_session_ids()
         
         for session_id in expired_sessions:
             logger.info(f"[SessionManager] Cleaning up expired session: {session_id[:8]}...")
@@ -802,21 +1471,6 @@ class SessionManager:
         if expired_sessions:
             logger.info(f"[SessionManager] Cleaned up {len(expired_sessions)} expired sessions")
     
-    def _cleanup_expired_sessions_sync(self):
-        """同步清理过期会话"""
-        expired_sessions = [
-            session_id
-            for session_id, info in self._sessions.items()
-            if info.is_expired(self._session_timeout_minutes)
-        ]
-        
-        for session_id in expired_sessions:
-            logger.info(f"[SessionManager] Cleaning up expired session: {session_id[:8]}...")
-            self.close_session_sync(session_id)
-        
-        if expired_sessions:
-            logger.info(f"[SessionManager] Cleaned up {len(expired_sessions)} expired sessions")
-    
     async def start_cleanup_task(self, interval_minutes: int = 10):
         """启动定期清理任务"""
         if self._cleanup_task is not None:
@@ -847,6 +1501,9 @@ class SessionManager:
             "active_sessions": len(self._sessions),
             "active_agents": len(self._agents),
             "max_sessions": self._max_sessions,
+            "max_agents": self._max_agents,
+            "pooled_agents": sum(len(pool) for pool in self._agent_pool.values()),
+            "dropped_events": self._dropped_events,
             "timeout_minutes": self._session_timeout_minutes,
             "has_repository": self._repository is not None,
         }
@@ -878,49 +1535,48 @@ class SessionManager:
         agent_id: str,
         agent_data: Dict[str, Any]
     ) -> bool:
-        """保存 Agent 数据到数据库"""
+        """保存 Agent 数据到数据库（写缓冲合并，同一 Agent 窗口期内的多次保存只写一次）"""
+        return await self._agent_writes.submit((session_id, agent_id), agent_data, merge=True)
+    
+    async def _flush_agent_writes(self, batch: Dict[Tuple[str, str], Dict[str, Any]]) -> Dict[Tuple[str, str], bool]:
+        """写入一批合并后的 Agent 数据：一次 upsert，已存在的 Agent 只更新本批次出现过的字段"""
+        repo = self.get_repository()
+        items = []
+        for key, agent_data in batch.items():
+            session_id, agent_id = key
+            items.append((key, (_agent_record_from_data(session_id, agent_id, agent_data), frozenset(agent_data))))
+        return await self._bulk_insert(items, repo.upsert_agents, lambda item: repo.upsert_agents([item]), "agent")
+    
+    async def _bulk_insert(self, items: List[Tuple[Any, Any]], bulk_create, create, kind: str) -> Dict[Any, bool]:
+        """批量插入一批记录；批量失败时回退为逐条插入，单条失败不影响其他记录"""
+        if not items:
+            return {}
         try:
-            repo = self.get_repository()
-            from storage.base import AgentRecord
-            
-            # 检查是否已存在
-            existing = await repo.get_agent(agent_id, session_id)
-            
-            if existing:
-                # 更新
-                await repo.update_agent(agent_id, session_id, agent_data)
-            else:
-                # 创建
-                record = AgentRecord(
-                    agent_id=agent_id,
-                    session_id=session_id,
-                    name=agent_data.get("name", ""),
-                    role_name=agent_data.get("role_name", ""),
-                    role_description=agent_data.get("role_description", ""),
-                    capabilities=json.dumps(agent_data.get("capabilities", [])),
-                    task_segment=agent_data.get("task_segment", ""),
-                    status=agent_data.get("status", "pending"),
-                    progress=agent_data.get("progress", 0),
-                    current_step=agent_data.get("current_step", ""),
-                    iterations=agent_data.get("iterations", 0),
-                    thinking=agent_data.get("thinking", ""),
-                    work_objective=agent_data.get("work_objective"),
-                    deliverables=json.dumps(agent_data.get("deliverables", [])),
-                    methodology=agent_data.get("methodology"),
-                    assigned_skills=json.dumps(agent_data.get("assigned_skills", [])),
-                    expertise_level=agent_data.get("expertise_level"),
-                    focus_areas=json.dumps(agent_data.get("focus_areas", [])),
-                )
-                await repo.create_agent(record)
-            
-            return True
+            await bulk_create([record for _, record in items])
+            return {key: True for key, _ in items}
         except Exception as e:
-            logger.error(f"[SessionManager] Failed to save agent: {e}")
-            return False
+            logger.warning(f"[SessionManager] Bulk {kind} insert failed, retrying one by one: {e}")
+        
+        results: Dict[Any, bool] = {}
+        for key, record in items:
+            try:
+                await create(record)
+                results[key] = True
+            except Exception as e:
+                logger.error(f"[SessionManager] Failed to save {kind}: {e}")
+                results[key] = False
+        return results
+    
+    async def flush_pending_writes(self):
+        """立即写入所有缓冲中的 Agent / 中继消息 / 消息（读取前调用，保证读到自己的写入）"""
+        await self._agent_writes.flush()
+        await self._relay_message_writes.flush()
+        await self._message_writes.flush()
     
     async def get_session_agents(self, session_id: str) -> List[Dict[str, Any]]:
         """获取会话的所有 Agent"""
         try:
+            await self._agent_writes.flush()
             repo = self.get_repository()
             records = await repo.list_agents_by_session(session_id)
             return [r.to_dict() for r in records]
@@ -938,23 +1594,16 @@ class SessionManager:
         """保存中继站数据"""
         try:
             repo = self.get_repository()
-            from storage.base import RelayStationRecord
-            
-            station_id = station_data.get("station_id") or station_data.get("id")
-            existing = await repo.get_station(station_id, session_id)
             
-            if existing:
-                await repo.update_station(station_id, session_id, station_data)
-            else:
-                record = RelayStationRecord(
-                    station_id=station_id,
-                    session_id=session_id,
-                    name=station_data.get("name", ""),
-                    phase=station_data.get("phase", 0),
-                    participating_agents=json.dumps(station_data.get("participating_agents", [])),
-                    is_active=station_data.get("is_active", True),
-                )
-                await repo.create_station(record)
+            record = RelayStationRecord(
+                station_id=station_data.get("station_id") or station_data.get("id"),
+                session_id=session_id,
+                name=station_data.get("name", ""),
+                phase=station_data.get("phase", 0),
+                participating_agents=_dumps(station_data.get("participating_agents", [])),
+                is_active=station_data.get("is_active", True),
+            )
+            await repo.upsert_station(record, station_data.keys())
             
             return True
         except Exception as e:
@@ -966,41 +1615,34 @@ class SessionManager:
         session_id: str,
         message_data: Dict[str, Any]
     ) -> bool:
-        """保存中继消息"""
+        """保存中继消息（写缓冲，窗口期内批量插入）"""
         try:
-            repo = self.get_repository()
-            from storage.base import RelayMessageRecord
-            
-            record = RelayMessageRecord(
-                message_id=message_data.get("message_id") or message_data.get("id"),
-                station_id=message_data.get("station_id"),
-                session_id=session_id,
-                relay_type=message_data.get("relay_type", ""),
-                source_agent_id=message_data.get("source_agent_id", ""),
-                source_agent_name=message_data.get("source_agent_name", ""),
-                target_agent_ids=json.dumps(message_data.get("target_agent_ids", [])),
-                content=message_data.get("content", ""),
-                importance=message_data.get("importance", 5),
-                viewed_by=json.dumps(message_data.get("viewed_by", [])),
-                acknowledged_by=json.dumps(message_data.get("acknowledged_by", [])),
-                viewed_timestamps=json.dumps(message_data.get("viewed_timestamps", {})),
-            )
-            await repo.create_relay_message(record)
-            return True
+            record = _relay_message_record_from_data(session_id, message_data)
         except Exception as e:
             logger.error(f"[SessionManager] Failed to save relay message: {e}")
             return False
+        self._invalidate_reads(session_id, "relay")
+        return await self._relay_message_writes.submit((session_id, record.message_id), record)
+    
+    async def _flush_relay_message_writes(self, batch: Dict[Tuple[str, str], RelayMessageRecord]) -> Dict[Tuple[str, str], bool]:
+        repo = self.get_repository()
+        return await self._bulk_insert(
+            list(batch.items()), repo.bulk_create_relay_messages, repo.create_relay_message, "relay message"
+        )
     
     async def get_session_relay_history(
         self,
         session_id: str,
         limit: int = 100
     ) -> List[Dict[str, Any]]:
-        """获取会话的中继消息历史"""
-        try:
-            repo = self.get_repository()
-            records = await repo.get_relay_messages_by_session(session_id, limit)
+        """获取会话的中继消息历史（短时缓存，写入后失效）"""
+        async def load():
+            await self._relay_message_writes.flush()
+            records = await self.get_repository().get_relay_messages_by_session(session_id, limit)
             return [r.to_dict() for r in records]
+        
+        try:
+            return await self._cached_read(session_id, "relay", limit, load)
         except Exception as e:
             logger.error(f"[SessionManager] Failed to get relay history: {e}")
             return []
@@ -1015,19 +1657,8 @@ class SessionManager:
         """保存干预记录"""
         try:
             repo = self.get_repository()
-            from storage.base import InterventionRecord
             
-            record = InterventionRecord(
-                intervention_id=intervention_data.get("id", str(uuid.uuid4())),
-                session_id=session_id,
-                intervention_type=intervention_data.get("type", ""),
-                scope=intervention_data.get("scope", "single"),
-                target_agent_id=intervention_data.get("target_agent_id"),
-                target_agent_ids=json.dumps(intervention_data.get("target_agent_ids", [])),
-                payload_json=json.dumps(intervention_data.get("payload")) if intervention_data.get("payload") else None,
-                reason=intervention_data.get("reason", ""),
-                priority=intervention_data.get("priority", 5),
-            )
+            record = _intervention_record_from_data(session_id, intervention_data)
             await repo.create_intervention(record)
             return True
         except Exception as e:
@@ -1055,23 +1686,20 @@ class SessionManager:
         session_id: str,
         message_data: Dict[str, Any]
     ) -> bool:
-        """保存消息（Master Agent 的任务分析、思考过程等）"""
+        """保存消息（Master Agent 的任务分析、思考过程等；写缓冲，窗口期内批量插入）"""
         try:
-            repo = self.get_repository()
-            from storage.base import MessageRecord
-            
-            record = MessageRecord(
-                message_id=message_data.get("message_id") or message_data.get("id") or str(uuid.uuid4()),
-                session_id=session_id,
-                role=message_data.get("role", "assistant"),
-                content=message_data.get("content", ""),
-                metadata_json=json.dumps(message_data.get("metadata")) if message_data.get("metadata") else None,
-            )
-            await repo.create_message(record)
-            return True
+            record = _message_record_from_data(session_id, message_data)
         except Exception as e:
             logger.error(f"[SessionManager] Failed to save message: {e}")
             return False
+        self._invalidate_reads(session_id, "messages")
+        return await self._message_writes.submit((session_id, record.message_id), record)
+    
+    async def _flush_message_writes(self, batch: Dict[Tuple[str, str], MessageRecord]) -> Dict[Tuple[str, str], bool]:
+        repo = self.get_repository()
+        return await self._bulk_insert(
+            list(batch.items()), repo.bulk_create_messages, repo.create_message, "message"
+        )
     
     async def update_message(
         self,
@@ -1079,167 +1707,231 @@ class SessionManager:
         message_id: str,
         content: str
     ) -> bool:
-        """更新消息内容（用于流式消息追加）"""
+        """更新消息内容（用于流式消息追加）
+        
+        写入前后各使读取缓存失效一次：写入完成前开始的读取可能读到追加前的内容，
+        写入后的失效保证这类结果不会以最新版本号留在缓存里。
+        """
+        self._invalidate_reads(session_id, "messages")
         try:
-            repo = self.get_repository()
-            # 获取现有消息
-            messages = await repo.get_messages_by_session(session_id, limit=1000)
-            for msg in messages:
-                if msg.message_id == message_id:
-                    # 追加内容而不是替换
-                    new_content = msg.content + content
-                    # 使用底层 SQL 更新
-                    from storage.sqlalchemy_repository import MessageModel
-                    with repo.get_db_session() as session:
-                        model = session.query(MessageModel).filter_by(
-                            session_id=session_id,
-                            message_id=message_id
-                        ).first()
-                        if model:
-                            model.content = new_content
-                            return True
-            return False
+            if self._message_writes:
+                # 消息可能仍在写缓冲中，先落库再追加
+                await self._message_writes.flush()
+            return await self.get_repository().append_message_content(session_id, message_id, content) > 0
         except Exception as e:
             logger.error(f"[SessionManager] Failed to update message: {e}")
             return False
+        finally:
+            self._invalidate_reads(session_id, "messages")
     
     async def get_session_messages(
         self,
         session_id: str,
         limit: int = 100
     ) -> List[Dict[str, Any]]:
-        """获取会话的消息历史"""
-        try:
-            repo = self.get_repository()
-            records = await repo.get_messages_by_session(session_id, limit)
+        """获取会话的消息历史（短时缓存，写入后失效）"""
+        async def load():
+            await self._message_writes.flush()
+            records = await self.get_repository().get_messages_by_session(session_id, limit)
             return [r.to_dict() for r in records]
+        
+        try:
+            return await self._cached_read(session_id, "messages", limit, load)
         except Exception as e:
             logger.error(f"[SessionManager] Failed to get messages: {e}")
             return []
     
     # ========== 订阅者管理 (新增 - 支持多客户端订阅) ==========
     
-    def _ensure_subscriber_lock(self):
-        """确保订阅者锁已初始化"""
-        if self._subscriber_lock is None:
+    def _subscriber_lock_for(self, session_id: str) -> asyncio.Lock:
+        """获取会话所在分段的订阅者锁"""
+        return self._subscriber_locks[hash(session_id) % len(self._subscriber_locks)]
+    
+    @staticmethod
+    def _put_drop_oldest(queue: Any, event: Any) -> bool:
+        """非阻塞入队；队列已满时丢弃最旧的事件腾出位置
+        
+        Returns:
+            是否发生了丢弃
+        """
+        try:
+            queue.put_nowait(event)
+            return False
+        except asyncio.QueueFull:
             try:
-                self._subscriber_lock = asyncio.Lock()
-            except RuntimeError:
-                # 如果没有事件循环，先不初始化
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
                 pass
+            queue.put_nowait(event)
+            return True
     
-    async def subscribe(self, session_id: str, maxsize: int = 100) -> asyncio.Queue:
+    async def subscribe(self, session_id: str, maxsize: int = 256, block: bool = False) -> _SubscriberQueue:
         """订阅会话事件流
         
         创建一个 Queue 用于接收该会话的所有事件。
         支持多个客户端同时订阅同一会话。
+        首个订阅者会为该会话启动 fan-out 任务。
         
         Args:
             session_id: 会话 ID
-            maxsize: Queue 最大容量，防止内存溢出
+            maxsize: Queue 最大容量，防止内存溢出（满时丢弃最旧事件）
+            block: 背压模式 - 队列满时不丢事件，而是阻塞 fan-out 直至消费，
+                并使该会话的 broadcast_event 等待广播源队列腾出空间
             
         Returns:
-            asyncio.Queue - 用于接收事件的队列
+            _SubscriberQueue - 用于接收事件的队列（get / get_nowait 接口与 asyncio.Queue 一致）
         """
-        self._ensure_subscriber_lock()
-        
-        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
-        
-        if self._subscriber_lock:
-            async with self._subscriber_lock:
-                if session_id not in self._subscribers:
-                    self._subscribers[session_id] = []
-                self._subscribers[session_id].append(queue)
-        else:
-            if session_id not in self._subscribers:
-                self._subscribers[session_id] = []
-            self._subscribers[session_id].append(queue)
-        
-        subscriber_count = len(self._subscribers.get(session_id, []))
+        queue = _SubscriberQueue(maxsize=maxsize)
+        
+        async with self._subscriber_lock_for(session_id):
+            self._fanout[session_id] = self._fanout.get(session_id, frozenset()) | {queue}
+            if block:
+                self._blocking_fanout[session_id] = self._blocking_fanout.get(session_id, frozenset()) | {queue}
+            if session_id not in self._fanout_tasks:
+                self._broadcast_queues[session_id] = asyncio.Queue(maxsize=self._BROADCAST_QUEUE_MAXSIZE)
+                self._fanout_tasks[session_id] = asyncio.create_task(self._fanout_loop(session_id))
+        if self._subscriber_sweep_task is None:
+            self._subscriber_sweep_task = asyncio.create_task(self._subscriber_sweep_loop())
+        
+        subscriber_count = len(self._fanout.get(session_id, ()))
         logger.info(f"[SessionManager] Client subscribed to session {session_id[:8]}... (total: {subscriber_count})")
         
         return queue
     
-    async def unsubscribe(self, session_id: str, queue: asyncio.Queue) -> None:
+    async def unsubscribe(self, session_id: str, queue: _SubscriberQueue) -> None:
         """取消订阅会话事件流
         
+        最后一个订阅者离开时停止该会话的 fan-out 任务。
+        
         Args:
             session_id: 会话 ID
             queue: 要移除的 Queue
         """
-        self._ensure_subscriber_lock()
-        
-        if self._subscriber_lock:
-            async with self._subscriber_lock:
-                if session_id in self._subscribers:
-                    try:
-                        self._subscribers[session_id].remove(queue)
-                        if not self._subscribers[session_id]:
-                            del self._subscribers[session_id]
-                    except ValueError:
-                        pass  # Queue 不在列表中
-        else:
-            if session_id in self._subscribers:
-                try:
-                    self._subscribers[session_id].remove(queue)
-                    if not self._subscribers[session_id]:
-                        del self._subscribers[session_id]
-                except ValueError:
-                    pass
+        async with self._subscriber_lock_for(session_id):
+            if queue in self._blocking_fanout.get(session_id, ()):
+                blocking = self._blocking_fanout[session_id] - {queue}
+                if blocking:
+                    self._blocking_fanout[session_id] = blocking
+                else:
+                    del self._blocking_fanout[session_id]
+                # 清空队列，唤醒可能正阻塞在该队列 put 上的 fan-out 任务
+                while not queue.empty():
+                    queue.get_nowait()
+            
+            remaining = self._fanout.get(session_id, frozenset()) - {queue}
+            if remaining:
+                self._fanout[session_id] = remaining
+            else:
+                self._fanout.pop(session_id, None)
+                self._broadcast_queues.pop(session_id, None)
+                task = self._fanout_tasks.pop(session_id, None)
+                if task is not None:
+                    task.cancel()
         
-        subscriber_count = len(self._subscribers.get(session_id, []))
+        subscriber_count = len(self._fanout.get(session_id, ()))
         logger.info(f"[SessionManager] Client unsubscribed from session {session_id[:8]}... (remaining: {subscriber_count})")
     
+    async def _subscriber_sweep_loop(self):
+        """定期移除闲置订阅者；没有任何订阅者时结束"""
+        try:
+            while self._fanout:
+                await asyncio.sleep(self._SUBSCRIBER_SWEEP_INTERVAL)
+                await self._sweep_idle_subscribers()
+        finally:
+            self._subscriber_sweep_task = None
+    
+    async def _sweep_idle_subscribers(self) -> int:
+        """取消订阅连接已断开但未退订的客户端（无人等待且长时间没有取事件）
+        
+        Returns:
+            移除的订阅者数量
+        """
+        now = time.monotonic()
+        idle = [
+            (session_id, queue)
+            for session_id, queues in self._fanout.items()
+            for queue in queues
+            if isinstance(queue, _SubscriberQueue) and queue.is_idle(now, self._SUBSCRIBER_IDLE_TIMEOUT)
+        ]
+        for session_id, queue in idle:
+            await self.unsubscribe(session_id, queue)
+        if idle:
+            logger.info(f"[SessionManager] Swept {len(idle)} idle subscriber(s)")
+        return len(idle)
+    
+    async def _fanout_loop(self, session_id: str):
+        """会话级 fan-out 任务：从广播源队列取事件，分发给当前所有订阅者
+        
+        慢订阅者的队列满时丢弃其最旧事件，不影响其他订阅者；
+        背压模式的订阅者则等待其消费。
+        """
+        source = self._broadcast_queues[session_id]
+        while True:
+            event = await source.get()
+            blocking = self._blocking_fanout.get(session_id, frozenset())
+            waiting: List[_SubscriberQueue] = []
+            for queue in self._fanout.get(session_id, ()):
+                if queue in blocking:
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        waiting.append(queue)
+                elif self._put_drop_oldest(queue, event):
+                    self._dropped_events += 1
+                    if logger.isEnabledFor(logging.WARNING):
+                        logger.warning(f"[SessionManager] Queue full for session {session_id[:8]}..., oldest event dropped")
+            if waiting:
+                await self._put_blocking(session_id, waiting, event)
+    
+    async def _put_blocking(self, session_id: str, queues: List[_SubscriberQueue], event: Any):
+        """并行等待多个已满的背压队列腾出空间，超时的队列本次事件计为丢弃"""
+        puts = [asyncio.ensure_future(queue.put(event)) for queue in queues]
+        _, timed_out = await asyncio.wait(puts, timeout=self._BLOCKING_PUT_TIMEOUT)
+        if timed_out:
+            for put in timed_out:
+                put.cancel()
+            self._dropped_events += len(timed_out)
+            if logger.isEnabledFor(logging.WARNING):
+                logger.warning(f"[SessionManager] {len(timed_out)} blocking subscriber(s) timed out "
+                               f"for session {session_id[:8]}..., event dropped")
+    
     async def broadcast_event(self, session_id: str, event: Any) -> int:
         """广播事件到所有订阅该会话的客户端
         
-        使用非阻塞方式发送，如果某个 Queue 已满则跳过（避免一个慢客户端阻塞其他客户端）
+        只向该会话的广播源队列投递，由 fan-out 任务分发，
+        发布路径不加锁、不遍历订阅者。广播源已满时丢弃最旧事件；
+        若该会话存在背压模式订阅者，则等待广播源腾出空间。
+        
+        BaseEvent 在投递前序列化为 SSE 文本（每次广播只序列化一次），
+        订阅者收到的是广播时刻的文本，之后再修改事件对象不会影响已广播的内容。
         
         Args:
             session_id: 会话 ID
-            event: 要广播的事件（BaseEvent 实例）
+            event: 要广播的事件（BaseEvent 实例、已序列化的 SSE 文本或普通字典）
             
         Returns:
-            成功发送的客户端数量
+            当前订阅该会话的客户端数量
         """
-        if session_id not in self._subscribers:
+        source = self._broadcast_queues.get(session_id)
+        if source is None:
             return 0
         
-        sent_count = 0
-        failed_queues = []
+        to_sse = getattr(event, "to_sse", None)
+        payload = to_sse() if to_sse is not None else event
         
-        # 复制列表避免迭代时修改
-        queues = self._subscribers.get(session_id, [])[:]
+        if session_id in self._blocking_fanout:
+            await source.put(payload)
+        elif self._put_drop_oldest(source, payload):
+            self._dropped_events += 1
+            if logger.isEnabledFor(logging.WARNING):
+                logger.warning(f"[SessionManager] Broadcast queue full for session {session_id[:8]}..., oldest event dropped")
         
-        for queue in queues:
-            try:
-                # 非阻塞发送
-                queue.put_nowait(event)
-                sent_count += 1
-            except asyncio.QueueFull:
-                # Queue 已满，记录但不移除（客户端可能只是暂时慢）
-                logger.warning(f"[SessionManager] Queue full for session {session_id[:8]}..., event dropped")
-            except Exception as e:
-                # 其他错误，标记为需要移除
-                logger.error(f"[SessionManager] Failed to broadcast to queue: {e}")
-                failed_queues.append(queue)
-        
-        # 清理失败的 queues
-        if failed_queues:
-            self._ensure_subscriber_lock()
-            if self._subscriber_lock:
-                async with self._subscriber_lock:
-                    for queue in failed_queues:
-                        try:
-                            self._subscribers[session_id].remove(queue)
-                        except (ValueError, KeyError):
-                            pass
-        
-        if sent_count > 0:
+        subscriber_count = len(self._fanout.get(session_id, ()))
+        if logger.isEnabledFor(logging.DEBUG):
             event_type = getattr(event, 'type', type(event).__name__)
-            logger.debug(f"[SessionManager] Broadcasted {event_type} to {sent_count} subscribers for session {session_id[:8]}...")
+            logger.debug(f"[SessionManager] Published {event_type} to {subscriber_count} subscribers for session {session_id[:8]}...")
         
-        return sent_count
+        return subscriber_count
     
     async def broadcast_state_changed(
         self,
@@ -1259,7 +1951,9 @@ class SessionManager:
         Returns:
             成功发送的客户端数量
         """
-        from agui.events import SessionStateChangedEvent
+        if session_id not in self._broadcast_queues:
+            # 无人订阅时不构造事件模型
+            return 0
         
         event = SessionStateChangedEvent(
             session_id=session_id,
@@ -1271,23 +1965,26 @@ class SessionManager:
     
     def get_subscriber_count(self, session_id: str) -> int:
         """获取会话的订阅者数量"""
-        return len(self._subscribers.get(session_id, []))
+        return len(self._fanout.get(session_id, ()))
     
     def get_all_subscriber_stats(self) -> Dict[str, int]:
         """获取所有会话的订阅者统计"""
         return {
             session_id: len(queues)
-            for session_id, queues in self._subscribers.items()
+            for session_id, queues in self._fanout.items()
         }
 
 
 # 全局会话管理器实例
 _session_manager: Optional[SessionManager] = None
+_session_manager_lock = Lock()
 
 
 def get_session_manager() -> SessionManager:
-    """获取全局会话管理器实例"""
+    """获取全局会话管理器实例（仅首次创建时加锁）"""
     global _session_manager
     if _session_manager is None:
-        _session_manager = SessionManager()
+        with _session_manager_lock:
+            if _session_manager is None:
+                _session_manager = SessionManager()
     return _session_manager
@@ -10,9 +10,12 @@ Subagent 运行时
 
 import asyncio
 import json
+import re
 import uuid
 import logging
-from typing import Optional, Dict, Any, List, Callable, AsyncGenerator
+from collections import deque, namedtuple
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Callable, AsyncGenerator, Tuple, Deque
 from datetime import datetime
 
 from core.models import (
@@ -25,10 +28,485 @@ from core.models import (
     InterventionType,
 )
 from llm.provider import LLMProviderFactory, LLMMessage, LLMConfig
+from utils.jsonfast import json_dumps as _dumps, json_loads as _loads
 
 
 logger = logging.getLogger(__name__)
 
+try:
+    from skills import AgentSkillSet, get_global_registry, init_skills
+    _SKILLS_IMPORT_ERROR: Optional[ImportError] = None
+except ImportError as e:
+    AgentSkillSet = None
+    _SKILLS_IMPORT_ERROR = e
+
+# 技能库全局只需加载一次（入口通常已加载），避免每个 Subagent 构造时清空并重新扫描技能目录
+_SKILLS_INITIALIZED = False
+
+
+def _ensure_skills_initialized() -> None:
+    """确保技能库已加载（进程内只执行一次）"""
+    global _SKILLS_INITIALIZED
+    if _SKILLS_INITIALIZED:
+        return
+    if get_global_registry().count() == 0:
+        init_skills()
+    _SKILLS_INITIALIZED = True
+
+# 技能组合 -> (tool 定义, 技能说明注入)，供相同角色的 Subagent 复用
+_TOOL_DEF_CACHE: Dict[Tuple[Any, ...], Tuple[List[Dict[str, Any]], str]] = {}
+_TOOL_DEF_CACHE_MAXSIZE = 128
+
+# run_stream 内部事件队列：生产者（LLM 流）与消费者（调用方）解耦，
+# 消费者短暂变慢时生产者继续读取 LLM 流；积压满 256 个事件后 put 阻塞，形成反压
+_STREAM_QUEUE_MAXSIZE = 256
+_STREAM_END = object()  # 生产者结束标记
+
+# thinking 增量合并：攒够字符数或距上次推送超过间隔才向上游推送一次
+_THINKING_FLUSH_CHARS = 128
+_THINKING_FLUSH_INTERVAL = 0.02
+
+# 检测轮的文本已推送但流被中断时，最终流从已推送内容处续写，避免客户端收到重复文本
+_RESUME_PARTIAL_PROMPT = "（输出被中断）请从上面中断处直接继续输出，不要重复已经输出的内容。"
+
+# 解析后的 tool call：arguments 已反序列化并规整为 dict
+ParsedToolCall = namedtuple("ParsedToolCall", "id name args")
+
+# 待处理人工干预的摘要条目（中继站待处理摘要中的 interventions 列表元素）
+PendingIntervention = namedtuple("PendingIntervention", "type priority content_preview")
+
+
+@dataclass
+class CompletionVerdict:
+    """单轮响应的完成判定结果（一次性汇总完成标记与中继站待处理状态）"""
+    done: bool                        # 确认完成
+    blocked: bool                     # 有完成标记，但待处理中继消息阻止完成
+    has_pending: bool                 # 中继站是否有待处理消息
+    pending_summary: Dict[str, Any] = field(default_factory=dict)
+    final_result: Optional[str] = None
+
+
+def _parse_tool_call(tc: Dict[str, Any]) -> ParsedToolCall:
+    """一次性解析 LLM 返回的 tool call（id / 函数名 / 参数）"""
+    function = tc.get("function") or {}
+    args_raw = function.get("arguments", "{}")
+    try:
+        args = _loads(args_raw) if isinstance(args_raw, str) else args_raw
+    except (ValueError, json.JSONDecodeError):
+        args = {"task": args_raw}
+    if not isinstance(args, dict):
+        args = {"task": str(args)}
+    return ParsedToolCall(tc.get("id") or str(uuid.uuid4()), function.get("name", ""), args)
+
+
+class _StreamBudget:
+    """_aiter_with_budget 的剩余等待预算（秒），迭代途中调用方可调整 remaining"""
+
+    __slots__ = ("remaining",)
+
+    def __init__(self, remaining: float):
+        self.remaining = remaining
+
+
+async def _aiter_with_budget(agen: AsyncGenerator, budget: _StreamBudget) -> AsyncGenerator:
+    """逐项迭代异步生成器，等待上游的累计耗时超过 budget.remaining 秒时抛出 asyncio.TimeoutError
+
+    只计等待上游产出的时间，调用方处理每一项的时间不计入。
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            if budget.remaining <= 0:
+                raise asyncio.TimeoutError()
+            started = loop.time()
+            try:
+                item = await asyncio.wait_for(agen.__anext__(), budget.remaining)
+            except StopAsyncIteration:
+                return
+            budget.remaining -= loop.time() - started
+            yield item
+    finally:
+        await agen.aclose()
+
+# 历史裁剪缓冲：超出窗口该数量后才批量裁剪，使消息前缀在多轮之间保持不变，利于提供方前缀缓存
+_HISTORY_CACHE_BUFFER = 4
+
+# 稳定系统提示的缓存标记（Anthropic 风格 cache_control，其余提供方忽略）
+_PROMPT_CACHE_CONTROL = {"type": "ephemeral"}
+
+# 系统提示模板（稳定部分）：可选章节以 *_block 形式预先渲染后整体填入
+# 当前时间、用户记忆等易变信息不放在这里，见 _build_volatile_system_prompt
+_SYSTEM_PROMPT_TMPL = """{system_prompt}
+
+## 🎭 你的身份
+- **角色名称**：{name}
+- **专业描述**：{description}
+- **专业水平**：{expertise_level}{objective_block}{deliverables_block}{methodology_block}{capabilities_block}{focus_block}{skills_block}
+
+## 📝 工作规范
+1. 深入分析你被分配的任务，发挥你的专业能力
+2. 按照你的工作方法论系统性地开展工作
+3. 当你有重要发现时，明确标注 **[关键发现]**
+4. 当你完成任务时，用 **[任务完成]** 标记，并给出完整的分析结果
+5. **引用与来源**：如果你使用了搜索工具获取信息，必须在回复末尾的 **参考来源** 章节中列出所引用的链接。格式如下：
+   ```
+   ## 参考来源
+   - [标题](URL)
+   - [标题](URL)
+   ```
+   确保每个引用的事实都能追溯到具体来源，不要遗漏搜索结果中的 URL。{relay_block}"""
+
+# 中继协作章节（触发条件之后的固定部分）
+_RELAY_FORMAT_GUIDE = """### 中继消息格式
+**1. 请求对齐（向其他Agent请求协助）**：
+```
+[请求中继: 简短说明请求原因]
+具体描述你需要什么信息或确认，例如：
+- 需要哪个角色确认什么内容
+- 你目前的分析发现是什么
+- 具体的问题或疑问
+```
+
+**2. 响应对齐（回复其他Agent的请求）**：
+```
+[响应对齐: 针对XXX的请求]
+你的具体回复内容：
+- 对问题的直接回答
+- 你的相关发现或分析
+- 补充信息或建议
+```
+
+**3. 分享发现（主动分享重要信息）**：
+```
+[关键发现]
+详细描述你的发现内容，确保信息完整有意义。
+```
+
+⚠️ **重要**：所有中继消息必须包含完整、具体的内容，不要只写称呼或空泛的确认。"""
+
+_TASK_PROMPT_TMPL = """## 🎯 你的任务
+{task_segment}
+
+{deliverables_block}## 📝 工作流程说明
+1. 你需要进行深入、多轮的分析，不要急于给出最终结论
+2. 每轮分析后，我会询问你是否需要继续深入或有新的发现
+3. 当你认为分析已经完整且深入时，使用 **[任务完成]** 标记，并给出完整的分析结果
+4. 如果发现重要信息需要与其他 Agent 共享，请使用 **[关键发现]** 标记
+
+请开始你的第一轮分析，先从整体框架入手，逐步深入。"""
+
+
+# 继续迭代引导：按迭代轮次（1/2/3）选择，之后统一使用默认引导
+_CONTINUATION_STAGE_PROMPTS = {
+    # 第一轮后，引导深入细节
+    1: """你的初步分析很好。现在请：
+1. 针对你提到的关键点，进行更深入的分析
+2. 考虑是否有遗漏的角度或维度
+3. 如果有重要发现，请用 **[关键发现]** 标记
+
+继续深入分析：""",
+    # 第二轮后，引导发现关联
+    2: """分析正在深入。请：
+1. 思考你的发现之间有什么关联或模式
+2. 是否有需要与其他专家角色协作确认的问题？如有，请用 **[请求中继: 原因]** 标记
+3. 继续挖掘潜在的洞察
+
+继续分析：""",
+    # 第三轮后，引导整合
+    3: """分析已经比较深入。请：
+1. 尝试整合你的各项发现
+2. 形成初步的结论框架
+3. 如果你认为分析已经完整，可以用 **[任务完成]** 标记并给出完整结论
+
+继续：""",
+}
+
+# 后续轮次，给予更大自由度
+_CONTINUATION_DEFAULT_PROMPT = """请继续你的分析，如果你认为已经足够深入和完整，请用 **[任务完成]** 标记并给出最终分析结果。
+
+继续："""
+
+# 有待处理中继消息时，在引导语前追加提醒
+_CONTINUATION_PENDING_TMPL = """⚠️ **注意：中继站有待处理的消息**
+
+{details}
+
+请先处理这些消息后再继续你的分析。
+
+---
+
+{stage_prompt}"""
+
+
+# 普通中继消息按类型注入的响应提示（{source} 来源 Agent 名称，{content} 消息内容）
+_RELAY_PROMPT_TEMPLATES: Dict[RelayType, str] = {
+    # 对齐请求 - 需要响应
+    RelayType.ALIGNMENT_REQUEST: """[来自 {source} 的对齐请求 🔄]
+内容: {content}
+
+**这是一个需要响应的请求！** 请：
+1. 考虑你的分析是否与此请求相关
+2. 如果相关，请使用以下格式进行响应：
+
+[响应对齐: 针对XXX的回复]
+这里写你的实际响应内容，包括：
+- 你的相关发现或分析结论
+- 对请求问题的直接回答
+- 你认为重要的补充信息
+
+**注意**：响应内容要完整具体，不要只写称呼或空泛的确认。
+""",
+    # 问题/求助 - 需要回答
+    RelayType.QUESTION: """[来自 {source} 的求助 ❓]
+内容: {content}
+
+**这是一个求助请求！** 如果你有相关知识或见解：
+请使用以下格式进行回复：
+
+[回复: 针对XXX问题的解答]
+这里写你的具体回答内容，包括：
+- 对问题的直接回答
+- 相关的分析或依据
+- 如有必要，附上你的建议
+
+**注意**：回复内容要具体有帮助，不要只写"已收到"或空泛确认。
+""",
+    # 建议 - 可选采纳
+    RelayType.SUGGESTION: """[来自 {source} 的建议 💡]
+内容: {content}
+
+这是一个建议，你可以：
+1. 如果认为有价值，整合到你的分析中
+2. 使用 [确认: 原因] 表示采纳
+3. 忽略如果与你的任务无关
+""",
+    # 对齐响应 - 仅供参考
+    RelayType.ALIGNMENT_RESPONSE: """[来自 {source} 的对齐响应 ✅]
+内容: {content}
+
+这是对之前对齐请求的响应，请参考整合。
+""",
+    # 确认 - 仅供参考
+    RelayType.CONFIRMATION: """[来自 {source} 的确认 ✔️]
+内容: {content}
+
+其他 Agent 确认了你的发现/建议。
+""",
+    # 洞察 - 高价值信息
+    RelayType.INSIGHT: """[来自 {source} 的核心洞察 🎯]
+内容: {content}
+
+这是一个重要的洞察，请仔细考虑是否能整合到你的分析中。
+""",
+}
+
+# 其他类型（discovery 等）的默认提示
+_RELAY_PROMPT_DEFAULT_TMPL = """[来自 {source} 的中继消息]
+类型: {msg_type}
+内容: {content}
+
+请考虑这个信息，如果它与你的分析相关，请进行整合和调整。
+"""
+
+
+# 人工干预提示：通用头部（{priority} 优先级，{source} 来源）
+_INTERVENTION_HEADER_TMPL = """⚠️ **[重要：人工干预通知 - 优先级 {priority}/10]**
+
+来自: {source}
+
+"""
+
+# 按干预类型的指导正文（{info} 注入内容，{adjustments} 调整条目，{content} 消息内容）
+_INTERVENTION_BODY_TEMPLATES: Dict[str, str] = {
+    InterventionType.INJECT.value: """**类型**: 信息注入
+
+**注入内容**:
+{info}
+
+**请执行以下操作**:
+1. 仔细阅读上述注入的信息
+2. 评估这些信息与你当前任务的相关性
+3. 如果相关，将其整合到你的分析中
+4. 如果需要调整方向，说明调整原因
+5. 在下一轮输出中体现对这些信息的考虑""",
+    InterventionType.ADJUST.value: """**类型**: 行为调整指令
+
+**调整要求**:{adjustments}
+
+**请执行以下操作**:
+1. 理解上述调整要求
+2. 评估如何在保持任务目标的前提下融入这些调整
+3. 在后续工作中体现这些调整
+4. 如果某些调整与当前任务冲突，请说明原因""",
+    InterventionType.PAUSE.value: """**类型**: 暂停通知
+
+{content}
+
+**注意**: 你可能即将被暂停，请在当前响应中总结进度。""",
+    InterventionType.RESUME.value: """**类型**: 恢复通知
+
+{content}
+
+**请执行以下操作**:
+1. 回顾之前的工作进度
+2. 继续未完成的任务
+3. 如有新的信息需要考虑，请整合进来""",
+    InterventionType.CANCEL.value: """**类型**: 取消通知
+
+{content}
+
+**注意**: 另一个 Agent 的任务已被取消。如果这影响到你的工作，请相应调整。""",
+}
+
+# 未知干预类型的通用处理
+_INTERVENTION_DEFAULT_TMPL = """{content}
+
+请根据上述人工干预信息，适当调整你的工作。"""
+
+_INTERVENTION_ACK_SUFFIX = """
+
+---
+📝 请在你的下一轮响应开头确认收到此干预通知。"""
+
+# 任务完成被阻止时的提示：固定头部与处理指导
+_PENDING_BLOCKED_HEADER = """⚠️ **任务完成被阻止**
+
+在标记任务完成之前，你需要先处理中继站中的待处理消息：
+"""
+
+_PENDING_BLOCKED_GUIDE = """---
+
+**请按以下步骤处理**：
+1. 仔细阅读上述待处理消息的内容
+2. 根据消息内容调整你的分析或结论
+3. 如果收到人工干预，请明确确认：「已收到干预通知，内容是...」
+4. 如果干预要求你调整方向，请说明你的调整
+5. 处理完所有消息后，再考虑是否可以完成任务
+
+请处理这些消息并给出你的响应："""
+
+def _bullets(items, fmt: str = "- {}") -> str:
+    """将列表渲染为逐行条目，空列表返回空串"""
+    return "\n".join(fmt.format(x) for x in items) if items else ""
+
+
+# RelayType -> 字符串值（RelayType 继承 str，原始字符串也能命中同一键）
+_RELAY_TYPE_VALUES: Dict[str, str] = {t: t.value for t in RelayType}
+
+
+# ==================== 中继检测正则（模块加载时预编译） ====================
+
+# 无意义内容：只包含符号/标点、只包含 markdown 格式符号、只有括号内容，合并为一个交替
+# （只有星号/井号/横线/点/空白等模式都是前两类的子集）
+_MEANINGLESS_RE = re.compile(
+    r'^(?:'
+    r'[\s\*\#\-\=\_\.\,\。\，\、\；\：\"\"\'\'\（\）\【\】\《\》\！\？]+'
+    r'|[\*\#\-\>\s]+'
+    r'|\(.*\)'
+    r')$'
+)
+
+# 语义不完整：提到了"以下/如下"但内容太短
+_INCOMPLETE_INDICATORS = tuple(re.compile(p) for p in (
+    r'以下[问题|内容|分析|要点|建议]',
+    r'如下[问题|内容|分析|要点|建议]',
+    r'下列[问题|内容|分析|要点|建议]',
+    r'以下是',
+    r'如下：',
+    r'包括：$',
+    r'分别是：$',
+))
+
+# 称呼检查：响应类型只看首行，非响应类型为严格模式
+_GREETING_FIRST_LINE_RE = re.compile(r'^(致|向|@)[^\s\n]{2,15}[：:]?\s*$')
+_SHORT_PUNCT_ONLY_RE = re.compile(r'^[\s\*\#\-\=\_\.\,\。\，]+$')
+# 先用首字符做快速过滤，命中后再用合并的锚定正则校验形状
+_GREETING_PREFIXES = ("致", "向", "请", "@")
+_GREETING_RE = re.compile(
+    r'^(?:'
+    r'致[^\s]{2,10}'                       # "致XXX" 只有称呼
+    r'|向[^\s]{2,10}'                      # "向XXX"
+    r'|请[^\s]{2,10}[确认|注意|查看]?'     # "请XXX确认"
+    r'|@[^\s]+'                            # "@某人"
+    r')$'
+)
+
+# 显式中继标记
+_TAG_ALIGNMENT_RESPONSE_RE = re.compile(r'\[响应对齐:\s*([^\]]+)\]')
+_TAG_REPLY_RE = re.compile(r'\[回复:\s*([^\]]+)\]')
+_TAG_CONFIRMATION_RE = re.compile(r'\[确认:\s*([^\]]+)\]')
+_TAG_RELAY_REQUEST_RE = re.compile(r'\[请求中继:\s*([^\]]+)\]')
+_TAG_HELP_RE = re.compile(r'\[(求助|疑问):\s*([^\]]+)\]')
+_TAG_SUGGESTION_RE = re.compile(r'\[建议:\s*([^\]]+)\]')
+_TAG_DISCOVERY_RE = re.compile(r'\[关键发现\]\s*(.+?)(?:\n\n|\n-|$)', re.DOTALL)
+_TAG_INSIGHT_RE = re.compile(r'\[(核心)?洞察\]\s*(.+?)(?:\n\n|\n-|$)', re.DOTALL)
+_GREETING_TAG_RE = re.compile(r'^(致|向|针对)[^\s]{2,15}')
+
+# 标记后续内容的结束位置：新的标记、分隔线、加粗的标记、标题
+_FOLLOWING_END_PATTERNS = tuple(re.compile(p) for p in (
+    r'\n\[',
+    r'\n---',
+    r'\n\*\*\[',
+    r'\n##',
+))
+_HELP_FOLLOWING_END_RE = re.compile(r'\n\[|\n---|\n##')
+
+# 基于内容模式的重要发现检测：(正则, 原因, 中继类型)
+_IMPORTANT_PATTERNS: Tuple[Tuple["re.Pattern[str]", str, RelayType], ...] = (
+    (re.compile(r'值得注意的是[：:]\s*(.{20,200})'), "值得注意的发现", RelayType.DISCOVERY),
+    (re.compile(r'重要发现[：:]\s*(.{20,200})'), "重要发现", RelayType.DISCOVERY),
+    (re.compile(r'关键点[：:]\s*(.{20,200})'), "关键点", RelayType.DISCOVERY),
+    (re.compile(r'核心洞察[：:]\s*(.{20,200})'), "核心洞察", RelayType.INSIGHT),
+    (re.compile(r'重大影响[：:]\s*(.{20,200})'), "重大影响", RelayType.DISCOVERY),
+    (re.compile(r'需要其他.*?(?:配合|协作|确认)'), "跨域协作需求", RelayType.ALIGNMENT_REQUEST),
+    (re.compile(r'建议.*?(?:考虑|采用|使用)'), "协作建议", RelayType.SUGGESTION),
+)
+# 上述模式的并集：一次扫描判断是否有任一模式命中，未命中时跳过逐个匹配
+# （逐个匹配仍按优先级顺序进行，保证命中结果不变）
+_IMPORTANT_ANY_RE = re.compile("|".join(f"(?:{p.pattern})" for p, _, _ in _IMPORTANT_PATTERNS))
+
+# ==================== 字面标记一次扫描 ====================
+
+# 完成标记（严格模式）与结论性词汇（宽松模式）
+_COMPLETION_MARKERS = ("[任务完成]", "[TASK_COMPLETE]", "**任务完成**", "## 任务完成")
+_CONCLUSION_MARKERS = ("综上所述", "总结如下", "最终结论", "分析报告", "完整分析结果")
+# 响应中明确表示已处理中继消息
+_ACKNOWLEDGEMENT_MARKERS = (
+    "已收到中继消息",
+    "已整合中继信息",
+    "已考虑人工干预",
+    "已根据干预调整",
+    "收到干预通知",
+    "已确认收到",
+)
+# 显式中继标记（"**[关键发现]**" 已包含 "[关键发现]"）
+_RELAY_TAG_MARKERS = (
+    "[响应对齐:", "[回复:", "[确认:", "[请求中继:", "[求助:", "[疑问:", "[建议:",
+    "[关键发现]", "[洞察]", "[核心洞察]",
+)
+_ALL_MARKERS = _COMPLETION_MARKERS + _CONCLUSION_MARKERS + _ACKNOWLEDGEMENT_MARKERS + _RELAY_TAG_MARKERS
+
+try:
+    import ahocorasick
+    
+    _MARKER_AUTOMATON = ahocorasick.Automaton()
+    for _marker in _ALL_MARKERS:
+        _MARKER_AUTOMATON.add_word(_marker, _marker)
+    _MARKER_AUTOMATON.make_automaton()
+    
+    def _scan_markers(text: str) -> frozenset:
+        """一次遍历返回文本中出现的全部字面标记（Aho-Corasick 自动机）"""
+        return frozenset(marker for _, marker in _MARKER_AUTOMATON.iter(text))
+except ImportError:
+    # 各标记之间互不重叠，单个交替正则即可一次扫描找全
+    _MARKER_SCAN_RE = re.compile(
+        "|".join(re.escape(m) for m in sorted(_ALL_MARKERS, key=len, reverse=True))
+    )
+    
+    def _scan_markers(text: str) -> frozenset:
+        """一次遍历返回文本中出现的全部字面标记（未安装 pyahocorasick 时回退到正则）"""
+        return frozenset(_MARKER_SCAN_RE.findall(text))
+
 
 class SubagentRuntime:
     """Subagent 运行时"""
@@ -82,19 +560,37 @@ class SubagentRuntime:
         self.runtime_budget = None
         self._init_skill_set()
         
+        # 角色配置与技能集在构造后不再变化，稳定系统提示只需拼装一次
+        self._system_prompt_stable = self._build_system_prompt_template()
+        
         # 对话历史
         self.messages: List[LLMMessage] = []
+        self._history_window = self.config.history_window or 12
+        self._history_head = 2  # 裁剪时始终保留的开头消息数（系统提示 + 任务）
         
         # 控制标志
-        self._paused = False
+        self._not_paused = asyncio.Event()  # 置位表示可继续执行，暂停时清除
+        self._not_paused.set()
         self._cancelled = False
         
         # 人工干预相关
-        self._pending_acknowledgements: List[str] = []  # 待确认的干预消息ID
-        self._intervention_history: List[Dict[str, Any]] = []  # 干预历史
-        
-        # 中继消息队列
-        self.relay_inbox: asyncio.Queue = asyncio.Queue()
+        # 长时间运行的蜂群中两者都会持续增长，使用有界 deque
+        self._pending_acknowledgements: Deque[str] = deque(maxlen=1024)  # 待确认的干预消息ID
+        self._intervention_history: Deque[Dict[str, Any]] = deque(maxlen=256)  # 干预历史（只记元数据）
+        
+        # 中继消息收件箱：只有非阻塞的追加/窥视/取空操作，用 deque 即可；
+        # relay_event 在有新消息时置位，供需要等待新消息的调用方使用
+        self.relay_inbox: Deque[RelayMessage] = deque()
+        self.relay_event = asyncio.Event()
+        # 收件箱/待确认列表每次变动递增版本号，待处理摘要按版本号缓存
+        self._inbox_rev = 0
+        self._pending_summary_cache: Optional[Tuple[int, bool, Dict[str, Any]]] = None
+        
+        # 滚动缓存断点：始终只标记最近一轮工具结果，后续工具轮次复用此前全部前缀
+        self._rolling_cache_message: Optional[LLMMessage] = None
+        
+        # 最近一次响应的标记扫描结果（完成判定与中继检测共用）
+        self._marker_scan: Tuple[Optional[str], frozenset] = (None, frozenset())
     
     def _init_skill_set(self):
         """初始化技能集 (v2 架构 - SKILL.md 格式)
@@ -103,13 +599,14 @@ class SubagentRuntime:
         无法访问未授权的能力。
         """
         self._tool_definitions: List[Dict[str, Any]] = []  # 仅已分配技能的 tool 定义
-        self._skill_name_map: Dict[str, str] = {}  # tool function name -> skill name 映射
+        self._skill_injection_cached: str = ""  # 技能使用说明（分配完成后不再变化）
         
         try:
-            from skills import AgentSkillSet, SkillExecutor, init_skills
+            if _SKILLS_IMPORT_ERROR is not None:
+                raise _SKILLS_IMPORT_ERROR
             
             # 初始化技能库（如果尚未初始化）
-            init_skills()
+            _ensure_skills_initialized()
             
             # 创建技能集
             if self.skill_executor is None:
@@ -134,19 +631,27 @@ class SubagentRuntime:
                 )
             
             # 从已分配技能生成 tool 定义（仅限已分配技能）
-            self._tool_definitions = self.skill_set.get_tool_definitions()
-            for td in self._tool_definitions:
-                func_name = td.get("function", {}).get("name", "")
-                if func_name:
-                    self._skill_name_map[func_name] = func_name  # skill name == function name
-            
+            # 同一组技能的定义是纯数据，按技能名 + 注册表更新时间缓存，重复角色直接复用
             assigned = self.skill_set.list_skills()
+            registry = self.skill_set.executor.registry
+            cache_key = (id(registry), registry.get_last_update_timestamp(), tuple(assigned))
+            cached = _TOOL_DEF_CACHE.get(cache_key)
+            if cached is None:
+                cached = (self.skill_set.get_tool_definitions(), self.skill_set.get_system_prompt_injection())
+                if len(_TOOL_DEF_CACHE) >= _TOOL_DEF_CACHE_MAXSIZE:
+                    _TOOL_DEF_CACHE.pop(next(iter(_TOOL_DEF_CACHE)))
+                _TOOL_DEF_CACHE[cache_key] = cached
+            
+            # 列表做浅拷贝，内部定义 dict 只读共享（tool 函数名即技能名）
+            self._tool_definitions = list(cached[0])
+            self._skill_injection_cached = cached[1]
+            
             logger.info(
                 "Subagent %s skills initialized: assigned=%s, tools=%d",
                 self.agent_name, assigned, len(self._tool_definitions),
             )
         except ImportError as e:
-            logger.warning(f"技能系统初始化失败: {e}")
+            logger.warning("技能系统初始化失败: %s", e)
             self.skill_set = None
             self.runtime_budget = None
     
@@ -168,9 +673,10 @@ class SubagentRuntime:
             max_iterations = self.config.max_iterations
             
             while iteration < max_iterations and not self._cancelled:
-                if self._paused:
+                if not self._not_paused.is_set():
                     self._update_status(AgentStatus.PAUSED)
-                    await asyncio.sleep(0.5)
+                    await self._not_paused.wait()
+                    self._update_status(AgentStatus.RUNNING)
                     continue
                 
                 iteration += 1
@@ -186,23 +692,20 @@ class SubagentRuntime:
                 # 执行一次 LLM 调用
                 response = await self._execute_iteration()
                 
-                # 检查是否完成（升级版：先检查中继站状态）
-                task_complete = self._is_task_complete(response)
+                # 检查是否完成（升级版：结合中继站状态一次性判定）
+                verdict = self._evaluate_completion(response)
                 
-                if task_complete:
-                    # 再次确认中继站状态
-                    has_pending, pending_summary = self._check_pending_relay_messages()
-                    
-                    if has_pending and not self._can_complete_with_pending_messages(response, pending_summary):
-                        # 有待处理消息，注入提示让 Agent 处理
-                        self.messages.append(LLMMessage(
-                            role="user",
-                            content=self._build_pending_message_prompt(pending_summary)
-                        ))
-                        continue
-                    
+                if verdict.blocked:
+                    # 有待处理消息，注入提示让 Agent 处理
+                    self.messages.append(LLMMessage(
+                        role="user",
+                        content=self._build_pending_message_prompt(verdict.pending_summary)
+                    ))
+                    continue
+                
+                if verdict.done:
                     # 确认完成
-                    self.state.final_result = self._extract_final_result(response)
+                    self.state.final_result = verdict.final_result
                     break
                 
                 # 检查是否需要触发中继
@@ -211,13 +714,12 @@ class SubagentRuntime:
                 
                 # 添加继续迭代的引导消息
                 if iteration < max_iterations - 1:
-                    has_pending, pending_summary = self._check_pending_relay_messages()
                     self.messages.append(LLMMessage(
                         role="user",
                         content=self._build_continuation_prompt(
                             iteration, 
                             response,
-                            pending_summary if has_pending else None
+                            verdict.pending_summary if verdict.has_pending else None
                         )
                     ))
             
@@ -251,25 +753,24 @@ class SubagentRuntime:
             max_iterations = self.config.max_iterations
             
             while iteration < max_iterations and not self._cancelled:
-                if self._paused:
+                if not self._not_paused.is_set():
                     self._update_status(AgentStatus.PAUSED)
                     yield {"type": "status", "status": AgentStatus.PAUSED.value}
-                    await asyncio.sleep(0.5)
+                    await self._not_paused.wait()
+                    self._update_status(AgentStatus.RUNNING)
+                    yield {"type": "status", "status": AgentStatus.RUNNING.value}
                     continue
                 
                 iteration += 1
                 self.state.iterations = iteration
                 
                 # 处理中继消息
-                processed_relay = await self._process_relay_inbox()
+                processed_relay, has_intervention = await self._process_relay_inbox()
                 if processed_relay:
                     yield {
                         "type": "relay_processed",
                         "count": len(processed_relay),
-                        "has_intervention": any(
-                            m.type == RelayType.HUMAN_INTERVENTION 
-                            for m in processed_relay
-                        )
+                        "has_intervention": has_intervention,
                     }
                 
                 # 更新进度
@@ -282,55 +783,108 @@ class SubagentRuntime:
                     "iterations": iteration
                 }
                 
-                # 流式执行（支持 tool calling）—— 实时 yield 所有事件
+                # 流式执行（支持 tool calling）—— 后台任务写入有界队列，这里取出后实时 yield
                 full_response = ""
-                accumulated_thinking = ""
-                async for event in self._stream_iteration_with_tools():
-                    event_type = event["type"]
-                    
-                    if event_type == "thinking":
-                        # 实时推送 thinking chunks 给前端
-                        chunk = event["delta"]
-                        accumulated_thinking += chunk
-                        self.state.thinking = accumulated_thinking
-                        yield event
-                        if self.on_thinking:
-                            self.on_thinking(self.agent_id, chunk)
-                    elif event_type == "final_content":
-                        # 最终完整内容（用于完成判断）
-                        full_response = event["content"]
-                    else:
-                        # tool_call_start, tool_call_result 等事件直接转发
-                        yield event
+                thinking_chunks: List[str] = []   # 本轮全部 thinking，推送时才 join
+                pending_chunks: List[str] = []    # 尚未推送的增量
+                pending_chars = 0
+                loop = asyncio.get_running_loop()
+                last_flush = loop.time()
                 
-                # 检查是否完成（升级版：先检查中继站状态）
-                task_complete = self._is_task_complete(full_response)
+                def flush_thinking() -> Optional[Dict[str, Any]]:
+                    """合并未推送的 thinking 增量，同步 state 并回调，返回待 yield 的事件"""
+                    nonlocal pending_chars, last_flush
+                    if not pending_chunks:
+                        return None
+                    delta = "".join(pending_chunks)
+                    pending_chunks.clear()
+                    pending_chars = 0
+                    last_flush = loop.time()
+                    self.state.thinking = "".join(thinking_chunks)
+                    if self.on_thinking:
+                        self.on_thinking(self.agent_id, delta)
+                    return {"type": "thinking", "delta": delta}
                 
-                if task_complete:
-                    # 再次确认中继站状态
-                    has_pending, pending_summary = self._check_pending_relay_messages()
-                    
-                    if has_pending and not self._can_complete_with_pending_messages(full_response, pending_summary):
-                        # 有待处理消息，通知 Agent 需要先处理
-                        yield {
-                            "type": "completion_blocked",
-                            "reason": "pending_relay_messages",
-                            "pending_summary": pending_summary
-                        }
+                event_queue: asyncio.Queue = asyncio.Queue(maxsize=_STREAM_QUEUE_MAXSIZE)
+                producer = asyncio.create_task(self._drive_iteration_into_queue(event_queue))
+                try:
+                    while True:
+                        if pending_chunks:
+                            # 有积压的 thinking 时限时等待下一个事件，上游停顿也能按时推送
+                            try:
+                                event = await asyncio.wait_for(
+                                    event_queue.get(),
+                                    max(_THINKING_FLUSH_INTERVAL - (loop.time() - last_flush), 0),
+                                )
+                            except asyncio.TimeoutError:
+                                yield flush_thinking()
+                                continue
+                        else:
+                            event = await event_queue.get()
+                        if event is _STREAM_END:
+                            break
+                        event_type = event["type"]
                         
-                        # 注入提示让 Agent 知道需要先处理消息
-                        self.messages.append(LLMMessage(
-                            role="user",
-                            content=self._build_pending_message_prompt(pending_summary)
-                        ))
-                        continue
+                        if event_type == "thinking":
+                            # thinking chunks 合并后推送给前端
+                            chunk = event["delta"]
+                            thinking_chunks.append(chunk)
+                            pending_chunks.append(chunk)
+                            pending_chars += len(chunk)
+                            if (
+                                pending_chars >= _THINKING_FLUSH_CHARS
+                                or loop.time() - last_flush >= _THINKING_FLUSH_INTERVAL
+                            ):
+                                yield flush_thinking()
+                            continue
+                        
+                        # 其他事件前先推送积压的 thinking，保持事件顺序
+                        merged = flush_thinking()
+                        if merged:
+                            yield merged
+                        if event_type == "final_content":
+                            # 最终完整内容（用于完成判断）
+                            full_response = event["content"]
+                        else:
+                            # tool_call_start, tool_call_result 等事件直接转发
+                            yield event
+                    merged = flush_thinking()
+                    if merged:
+                        yield merged
+                finally:
+                    if not producer.done():
+                        producer.cancel()
+                # 生产者异常在此重新抛出
+                await producer
+                
+                # 检查是否完成（升级版：结合中继站状态一次性判定）
+                verdict = self._evaluate_completion(full_response)
+                
+                if verdict.blocked:
+                    # 有待处理消息，通知 Agent 需要先处理
+                    yield {
+                        "type": "completion_blocked",
+                        "reason": "pending_relay_messages",
+                        # 对外事件保持原有的 dict 结构（内部摘要的干预条目为 namedtuple）
+                        "pending_summary": {
+                            **verdict.pending_summary,
+                            "interventions": [i._asdict() for i in verdict.pending_summary["interventions"]],
+                        },
+                    }
                     
-                    # 确认完成 - 先更新状态并 yield，再提取结果
-                    # 这样前端能立即看到 completed 状态，不用等 _extract_final_result 完成
+                    # 注入提示让 Agent 知道需要先处理消息
+                    self.messages.append(LLMMessage(
+                        role="user",
+                        content=self._build_pending_message_prompt(verdict.pending_summary)
+                    ))
+                    continue
+                
+                if verdict.done:
+                    # 确认完成
                     self._update_status(AgentStatus.COMPLETED)
                     yield {"type": "status", "status": AgentStatus.COMPLETED.value}
                     
-                    self.state.final_result = self._extract_final_result(full_response)
+                    self.state.final_result = verdict.final_result
                     yield {"type": "result", "result": self.state.final_result}
                     break
                 
@@ -342,12 +896,11 @@ class SubagentRuntime:
                 
                 # 添加继续迭代的引导消息（如果还没完成）
                 if iteration < max_iterations - 1:
-                    # 检查是否有待处理消息需要提醒
-                    has_pending, pending_summary = self._check_pending_relay_messages()
+                    # 复用本轮判定时的待处理消息摘要进行提醒
                     continuation_prompt = self._build_continuation_prompt(
                         iteration, 
                         full_response,
-                        pending_summary if has_pending else None
+                        verdict.pending_summary if verdict.has_pending else None
                     )
                     self.messages.append(LLMMessage(
                         role="user",
@@ -377,23 +930,31 @@ class SubagentRuntime:
     
     def pause(self):
         """暂停执行"""
-        self._paused = True
+        self._not_paused.clear()
     
     def resume(self):
         """恢复执行"""
-        self._paused = False
+        self._not_paused.set()
     
     def cancel(self):
         """取消执行"""
         self._cancelled = True
+        # 唤醒可能处于暂停等待中的主循环，使其检查取消标志后退出
+        self._not_paused.set()
     
     async def receive_relay_message(self, message: RelayMessage):
         """接收中继消息"""
         # 标记消息被此 Agent 查看
         message.mark_viewed(self.agent_id)
         
-        await self.relay_inbox.put(message)
-        self.state.relay_messages_received.append(message.model_dump())
+        self._put_relay_inbox(message)
+        self.state.relay_messages_received.append(message)
+    
+    def _put_relay_inbox(self, message: RelayMessage):
+        """放入收件箱、递增版本号并唤醒等待方"""
+        self.relay_inbox.append(message)
+        self._inbox_rev += 1
+        self.relay_event.set()
     
     async def receive_intervention(self, message: RelayMessage, intervention=None):
         """接收人工干预消息 - 特殊处理通道
@@ -408,11 +969,12 @@ class SubagentRuntime:
         message.mark_viewed(self.agent_id)
         
         # 记录到收到的消息中
-        self.state.relay_messages_received.append(message.model_dump())
+        self.state.relay_messages_received.append(message)
         
         # 标记需要确认
         if message.metadata.get("requires_acknowledgement"):
             self._pending_acknowledgements.append(message.id)
+            self._inbox_rev += 1
         
         # 记录干预历史
         self._intervention_history.append({
@@ -420,7 +982,6 @@ class SubagentRuntime:
             "intervention_type": message.metadata.get("intervention_type", "unknown"),
             "priority": message.metadata.get("priority", 5),
             "timestamp": datetime.now().isoformat(),
-            "content_preview": message.content[:100]
         })
         
         # 根据干预类型决定处理方式
@@ -428,15 +989,15 @@ class SubagentRuntime:
         
         if intervention_type == InterventionType.INJECT.value:
             # 注入信息 - 放入收件箱让下次迭代处理
-            await self.relay_inbox.put(message)
+            self._put_relay_inbox(message)
         elif intervention_type == InterventionType.ADJUST.value:
             # 调整指令 - 也放入收件箱，但标记优先级
             message.importance = max(message.importance, 0.9)
-            await self.relay_inbox.put(message)
+            self._put_relay_inbox(message)
         else:
             # 其他类型（暂停/恢复/取消等已在 MasterAgent 层处理）
             # 仍然放入收件箱让 Agent 知道发生了什么
-            await self.relay_inbox.put(message)
+            self._put_relay_inbox(message)
     
     def inject_information(self, information: str):
         """人工注入信息 - 增强版
@@ -468,220 +1029,134 @@ class SubagentRuntime:
         
         # 记录注入次数
         self._injected_info_count = getattr(self, '_injected_info_count', 0) + 1
-        print(f"[Subagent {self.agent_id}] Information injected (total: {self._injected_info_count})")
+        logger.debug("Subagent %s information injected (total: %s)", self.agent_id, self._injected_info_count)
     
     def _init_messages(self):
-        """初始化消息"""
+        """初始化消息
+        
+        稳定的角色系统提示在最前并标记为可缓存，时间、用户记忆等易变信息
+        单独放在其后的系统消息中，使同一角色的请求共享相同的前缀。
+        """
         self.messages = [
             LLMMessage(
                 role="system",
-                content=self._build_system_prompt()
+                content=self._build_system_prompt(),
+                cache_control=_PROMPT_CACHE_CONTROL,
+            ),
+            LLMMessage(
+                role="system",
+                content=self._build_volatile_system_prompt()
             ),
             LLMMessage(
                 role="user",
                 content=self._build_task_prompt()
             )
         ]
+        self._history_head = len(self.messages)
     
     def _build_system_prompt(self) -> str:
-        """构建系统提示 - 增强版，包含完整角色信息和技能"""
-        role = self.config.role
+        """构建系统提示（稳定部分，构造时已缓存）"""
+        return self._system_prompt_stable
+    
+    def _build_volatile_system_prompt(self) -> str:
+        """构建易变的系统信息：当前时间与用户偏好记忆"""
+        parts = [f"## 🕐 当前时间\n{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S（%A）')}"]
         
-        # 基础身份
-        prompt_parts = [
-            role.system_prompt,
-            "",
-            f"## 🕐 当前时间",
-            f"{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S（%A）')}",
-            "",
-            "## 🎭 你的身份",
-            f"- **角色名称**：{role.name}",
-            f"- **专业描述**：{role.description}",
-            f"- **专业水平**：{role.expertise_level}",
-        ]
+        # 注入用户记忆偏好
+        if self.user_memory:
+            parts.append(
+                "## 👤 用户偏好与记忆\n"
+                f"以下是关于当前用户的偏好和历史记忆信息，请在执行任务时充分考虑这些信息：\n{self.user_memory}"
+            )
+        return "\n\n".join(parts)
+    
+    def _build_system_prompt_template(self) -> str:
+        """构建稳定的系统提示 - 增强版，包含完整角色信息和技能
+        
+        只依赖角色配置与已分配技能，不含时间等易变信息，便于提供方前缀缓存。
+        """
+        role = self.config.role
         
         # 工作目标
-        if role.work_objective:
-            prompt_parts.extend([
-                "",
-                "## 🎯 你的工作目标",
-                role.work_objective,
-            ])
+        objective_block = (
+            f"\n\n## 🎯 你的工作目标\n{role.work_objective}" if role.work_objective else ""
+        )
         
         # 预期交付物
-        if role.deliverables:
-            prompt_parts.extend([
-                "",
-                "## 📦 预期交付物",
-            ])
-            for deliverable in role.deliverables:
-                prompt_parts.append(f"- {deliverable}")
+        deliverables_block = (
+            f"\n\n## 📦 预期交付物\n{_bullets(role.deliverables)}" if role.deliverables else ""
+        )
         
         # 工作方法论
-        if role.methodology:
-            methodology = role.methodology
-            prompt_parts.extend([
-                "",
-                "## 📋 工作方法论",
-                f"**总体方法**：{methodology.approach}",
-            ])
-            
+        methodology_block = ""
+        methodology = role.methodology
+        if methodology:
+            methodology_block = f"\n\n## 📋 工作方法论\n**总体方法**：{methodology.approach}"
             if methodology.steps:
-                prompt_parts.append("")
-                prompt_parts.append("**工作步骤**：")
-                for i, step in enumerate(methodology.steps, 1):
-                    prompt_parts.append(f"{i}. {step}")
-            
+                steps = "\n".join(f"{i}. {step}" for i, step in enumerate(methodology.steps, 1))
+                methodology_block += f"\n\n**工作步骤**：\n{steps}"
             if methodology.tools_and_frameworks:
-                prompt_parts.append("")
-                prompt_parts.append("**使用的工具和框架**：")
-                for tool in methodology.tools_and_frameworks:
-                    prompt_parts.append(f"- {tool}")
-            
+                methodology_block += f"\n\n**使用的工具和框架**：\n{_bullets(methodology.tools_and_frameworks)}"
             if methodology.success_criteria:
-                prompt_parts.append("")
-                prompt_parts.append("**成功标准**：")
-                for criteria in methodology.success_criteria:
-                    prompt_parts.append(f"- {criteria}")
-        
-        # 核心能力
-        if role.capabilities:
-            prompt_parts.extend([
-                "",
-                "## 💪 你的核心能力",
-            ])
-            for cap in role.capabilities:
-                prompt_parts.append(f"- {cap}")
-        
-        # 关注领域
-        if role.focus_areas:
-            prompt_parts.extend([
-                "",
-                "## 🔍 关注领域",
-            ])
-            for area in role.focus_areas:
-                prompt_parts.append(f"- {area}")
+                methodology_block += f"\n\n**成功标准**：\n{_bullets(methodology.success_criteria)}"
+        
+        # 核心能力 / 关注领域
+        capabilities_block = (
+            f"\n\n## 💪 你的核心能力\n{_bullets(role.capabilities)}" if role.capabilities else ""
+        )
+        focus_block = (
+            f"\n\n## 🔍 关注领域\n{_bullets(role.focus_areas)}" if role.focus_areas else ""
+        )
         
         # 技能说明
+        skills_block = ""
         if role.assigned_skills:
-            prompt_parts.extend([
-                "",
-                "## 🛠️ 你拥有的技能",
-            ])
-            for skill in role.assigned_skills:
-                prompt_parts.append(f"- **{skill.skill_display_name}** ({skill.skill_name})")
-                if skill.reason:
-                    prompt_parts.append(f"  用途：{skill.reason}")
-            
-            prompt_parts.append("")
-            prompt_parts.append("⚠️ **技能限制**：你只能使用以上已分配的技能，不得调用或假设未分配的技能能力。")
-            
+            skill_lines = "\n".join(
+                f"- **{skill.skill_display_name}** ({skill.skill_name})"
+                + (f"\n  用途：{skill.reason}" if skill.reason else "")
+                for skill in role.assigned_skills
+            )
+            skills_block = (
+                f"\n\n## 🛠️ 你拥有的技能\n{skill_lines}"
+                "\n\n⚠️ **技能限制**：你只能使用以上已分配的技能，不得调用或假设未分配的技能能力。"
+            )
             # 添加技能使用说明
-            if self.skill_set:
-                skill_injection = self.skill_set.get_system_prompt_injection()
-                if skill_injection:
-                    prompt_parts.append("")
-                    prompt_parts.append(skill_injection)
-        
-        # 工作方式
-        prompt_parts.extend([
-            "",
-            "## 📝 工作规范",
-            "1. 深入分析你被分配的任务，发挥你的专业能力",
-            "2. 按照你的工作方法论系统性地开展工作",
-            "3. 当你有重要发现时，明确标注 **[关键发现]**",
-            "4. 当你完成任务时，用 **[任务完成]** 标记，并给出完整的分析结果",
-            "5. **引用与来源**：如果你使用了搜索工具获取信息，必须在回复末尾的 **参考来源** 章节中列出所引用的链接。格式如下：",
-            "   ```",
-            "   ## 参考来源",
-            "   - [标题](URL)",
-            "   - [标题](URL)",
-            "   ```",
-            "   确保每个引用的事实都能追溯到具体来源，不要遗漏搜索结果中的 URL。",
-        ])
+            if self.skill_set and self._skill_injection_cached:
+                skills_block += f"\n\n{self._skill_injection_cached}"
         
         # 中继触发条件
+        relay_block = ""
         if role.relay_triggers:
-            prompt_parts.extend([
-                "",
-                "## 🔄 中继协作机制",
-                "### 触发中继的条件",
-                "当出现以下情况时，你应该与其他 Agent 交换信息：",
-            ])
-            for trigger in role.relay_triggers:
-                prompt_parts.append(f"- {trigger}")
-            
-            prompt_parts.extend([
-                "",
-                "### 中继消息格式",
-                "**1. 请求对齐（向其他Agent请求协助）**：",
-                "```",
-                "[请求中继: 简短说明请求原因]",
-                "具体描述你需要什么信息或确认，例如：",
-                "- 需要哪个角色确认什么内容",
-                "- 你目前的分析发现是什么",
-                "- 具体的问题或疑问",
-                "```",
-                "",
-                "**2. 响应对齐（回复其他Agent的请求）**：",
-                "```",
-                "[响应对齐: 针对XXX的请求]",
-                "你的具体回复内容：",
-                "- 对问题的直接回答",
-                "- 你的相关发现或分析",
-                "- 补充信息或建议",
-                "```",
-                "",
-                "**3. 分享发现（主动分享重要信息）**：",
-                "```",
-                "[关键发现]",
-                "详细描述你的发现内容，确保信息完整有意义。",
-                "```",
-                "",
-                "⚠️ **重要**：所有中继消息必须包含完整、具体的内容，不要只写称呼或空泛的确认。",
-            ])
-        
-        # 注入用户记忆偏好
-        if self.user_memory:
-            prompt_parts.extend([
-                "",
-                "## 👤 用户偏好与记忆",
-                "以下是关于当前用户的偏好和历史记忆信息，请在执行任务时充分考虑这些信息：",
-                self.user_memory,
-            ])
+            relay_block = (
+                "\n\n## 🔄 中继协作机制\n### 触发中继的条件\n当出现以下情况时，你应该与其他 Agent 交换信息：\n"
+                f"{_bullets(role.relay_triggers)}\n\n{_RELAY_FORMAT_GUIDE}"
+            )
         
-        return "\n".join(prompt_parts)
+        return _SYSTEM_PROMPT_TMPL.format(
+            system_prompt=role.system_prompt,
+            name=role.name,
+            description=role.description,
+            expertise_level=role.expertise_level,
+            objective_block=objective_block,
+            deliverables_block=deliverables_block,
+            methodology_block=methodology_block,
+            capabilities_block=capabilities_block,
+            focus_block=focus_block,
+            skills_block=skills_block,
+            relay_block=relay_block,
+        )
     
     def _build_task_prompt(self) -> str:
         """构建任务提示"""
-        role = self.config.role
-        
-        prompt_parts = [
-            "## 🎯 你的任务",
-            self.config.task_segment,
-            "",
-        ]
-        
+        deliverables = self.config.role.deliverables
         # 如果有交付物要求，提醒
-        if role.deliverables:
-            prompt_parts.extend([
-                "## 📦 请确保你的输出包含",
-            ])
-            for deliverable in role.deliverables:
-                prompt_parts.append(f"- {deliverable}")
-            prompt_parts.append("")
-        
-        prompt_parts.extend([
-            "## 📝 工作流程说明",
-            "1. 你需要进行深入、多轮的分析，不要急于给出最终结论",
-            "2. 每轮分析后，我会询问你是否需要继续深入或有新的发现",
-            "3. 当你认为分析已经完整且深入时，使用 **[任务完成]** 标记，并给出完整的分析结果",
-            "4. 如果发现重要信息需要与其他 Agent 共享，请使用 **[关键发现]** 标记",
-            "",
-            "请开始你的第一轮分析，先从整体框架入手，逐步深入。",
-        ])
-        
-        return "\n".join(prompt_parts)
+        deliverables_block = (
+            f"## 📦 请确保你的输出包含\n{_bullets(deliverables)}\n\n" if deliverables else ""
+        )
+        return _TASK_PROMPT_TMPL.format(
+            task_segment=self.config.task_segment,
+            deliverables_block=deliverables_block,
+        )
 
     def _budget_value(self, name: str, default: int) -> int:
         budget = getattr(self, "runtime_budget", None)
@@ -693,12 +1168,12 @@ class SubagentRuntime:
         return default
 
     def _compact_tool_result_content(self, success: bool, summary: str, result_text: str, error: str) -> str:
-        return json.dumps({
+        return _dumps({
             "success": success,
             "summary": summary,
             "result_preview": (result_text or "")[:1200],
             "error": error,
-        }, ensure_ascii=False)
+        })
 
     async def _execute_skill_with_guard(
         self,
@@ -768,8 +1243,70 @@ class SubagentRuntime:
                 "tool_message_content": self._compact_tool_result_content(False, f"Error: {err}", "", err),
             }
     
+    async def _run_single_tool_call(
+        self,
+        tc: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+    ) -> Tuple[str, str, Dict[str, Any]]:
+        """解析并执行单个 tool call，返回 (tool_call_id, 函数名, 执行结果)"""
+        ptc = _parse_tool_call(tc)
+
+        if self.on_tool_call:
+            self.on_tool_call(self.agent_id, ToolCall(id=ptc.id, name=ptc.name, arguments=ptc.args))
+
+        ptc, tool_result = await self._execute_parsed_tool_call(ptc, semaphore)
+        return ptc.id, ptc.name, tool_result
+
+    async def _execute_parsed_tool_call(
+        self,
+        ptc: ParsedToolCall,
+        semaphore: asyncio.Semaphore,
+    ) -> Tuple[ParsedToolCall, Dict[str, Any]]:
+        """在并发上限内执行已解析的 tool call，返回 (tool call, 执行结果)"""
+        task_desc = ptc.args.get("task", ptc.args.get("query", str(ptc.args)))
+        async with semaphore:
+            tool_result = await self._execute_skill_with_guard(
+                skill_name=ptc.name,
+                task_desc=task_desc,
+                func_args=ptc.args,
+            )
+        return ptc, tool_result
+
+    def _move_cache_breakpoint(self, message: LLMMessage):
+        """把滚动缓存断点移到指定消息（系统提示上的固定断点不受影响）"""
+        previous = self._rolling_cache_message
+        if previous is not None and previous is not message:
+            previous.cache_control = None
+        message.cache_control = _PROMPT_CACHE_CONTROL
+        self._rolling_cache_message = message
+
+    def _trim_history(self, messages: List[LLMMessage]) -> List[LLMMessage]:
+        """滚动窗口裁剪对话历史
+        
+        保留开头的 system + 任务消息以及最近 _history_window 条消息，
+        避免每轮 LLM 调用重发全部历史。窗口起点不会落在 tool 消息上，
+        保证 assistant(tool_calls) 与其 tool 结果成对保留或成对丢弃。
+        超出窗口 _HISTORY_CACHE_BUFFER 条后才批量裁剪，两次裁剪之间消息前缀不变。
+        """
+        head = self._history_head
+        if len(messages) <= head + self._history_window + _HISTORY_CACHE_BUFFER:
+            return messages
+        
+        start = len(messages) - self._history_window
+        while start < len(messages) and messages[start].role == "tool":
+            start += 1
+        
+        logger.debug(
+            "Subagent %s history trimmed: dropped=%s kept=%s",
+            self.agent_name,
+            start - head,
+            len(messages) - start,
+        )
+        return messages[:head] + messages[start:]
+    
     async def _execute_iteration(self) -> str:
         """执行一次迭代（支持 tool calling）"""
+        self.messages = self._trim_history(self.messages)
         tools = self._tool_definitions if self._tool_definitions else None
         max_tool_rounds = self._budget_value("max_tool_rounds", 4)
         detect_timeout = self._budget_value("tool_detect_timeout_sec", 60)
@@ -790,15 +1327,16 @@ class SubagentRuntime:
                 )
                 break
 
-            context_chars = sum(len(m.content or "") for m in self.messages)
-            logger.info(
-                "Subagent %s tool round %s/%s detect start: context_chars=%s timeout=%ss",
-                self.agent_name,
-                tool_round + 1,
-                max_tool_rounds,
-                context_chars,
-                detect_timeout,
-            )
+            if logger.isEnabledFor(logging.INFO):
+                # 统计上下文长度需遍历全部消息，仅在日志开启时计算
+                logger.info(
+                    "Subagent %s tool round %s/%s detect start: context_chars=%s timeout=%ss",
+                    self.agent_name,
+                    tool_round + 1,
+                    max_tool_rounds,
+                    sum(len(m.content or "") for m in self.messages),
+                    detect_timeout,
+                )
 
             detect_task = asyncio.create_task(
                 self.provider.chat_detect_tools_stream(self.messages, self.llm_config, tools=tools)
@@ -850,38 +1388,19 @@ class SubagentRuntime:
                 tool_calls=tool_calls,
             ))
 
-            for tc in tool_calls:
-                tc_id = tc.get("id", str(uuid.uuid4()))
-                func_name = tc.get("function", {}).get("name", "")
-                func_args_str = tc.get("function", {}).get("arguments", "{}")
-
-                try:
-                    func_args = json.loads(func_args_str) if isinstance(func_args_str, str) else func_args_str
-                except json.JSONDecodeError:
-                    func_args = {"task": func_args_str}
-
-                skill_name = self._skill_name_map.get(func_name, func_name)
-                task_desc = func_args.get("task", func_args.get("query", str(func_args)))
-
-                if self.on_tool_call:
-                    self.on_tool_call(self.agent_id, ToolCall(
-                        id=tc_id,
-                        name=func_name,
-                        arguments=func_args if isinstance(func_args, dict) else {"task": str(func_args)},
-                    ))
-
-                tool_result = await self._execute_skill_with_guard(
-                    skill_name=skill_name or func_name,
-                    task_desc=task_desc,
-                    func_args=func_args if isinstance(func_args, dict) else {"task": str(func_args)},
-                )
-
+            # 同一轮内的工具调用彼此独立：并发执行，按原始顺序回填 tool 消息
+            semaphore = asyncio.Semaphore(self._budget_value("max_tool_parallelism", 4))
+            results = await asyncio.gather(*(
+                self._run_single_tool_call(tc, semaphore) for tc in tool_calls
+            ))
+            for tc_id, func_name, tool_result in results:
                 self.messages.append(LLMMessage(
                     role="tool",
                     content=tool_result["tool_message_content"],
                     tool_call_id=tc_id,
                     name=func_name,
                 ))
+            self._move_cache_breakpoint(self.messages[-1])
 
         # 工具轮次结束后，回到纯文本总结
         response = await self.provider.chat_complete(self.messages, self.llm_config)
@@ -924,152 +1443,210 @@ class SubagentRuntime:
         
         return args
     
+    async def _drive_iteration_into_queue(self, queue: asyncio.Queue) -> None:
+        """后台运行一轮流式迭代，把事件依次放入队列，结束（含异常）时放入 _STREAM_END
+        
+        队列有界，已满时 put 会等待消费者取走事件。
+        """
+        try:
+            async for event in self._stream_iteration_with_tools():
+                await queue.put(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await queue.put(_STREAM_END)
+            raise
+        await queue.put(_STREAM_END)
+    
     async def _stream_iteration_with_tools(self) -> AsyncGenerator[Dict[str, Any], None]:
         """流式迭代 + tool calling 支持"""
+        self.messages = self._trim_history(self.messages)
+        # 循环内反复用到的属性一次性绑定为局部变量（本方法内不会重新赋值 self.messages）
+        messages = self.messages
+        provider = self.provider
+        llm_config = self.llm_config
+        agent_name = self.agent_name
+        agent_id = self.agent_id
+        on_tool_call = self.on_tool_call
+        skill_set = self.skill_set
         tools = self._tool_definitions if self._tool_definitions else None
-        max_tool_rounds = self._budget_value("max_tool_rounds", 4)
-        detect_timeout = self._budget_value("tool_detect_timeout_sec", 60)
-        total_tool_budget = self._budget_value("max_total_tool_time_sec", 180)
-        tool_started_at = datetime.now().timestamp()
-
-        for tool_round in range(max_tool_rounds):
-            if not tools or not self.skill_set:
-                break
+        streamed_answer = ""
+        # 当前检测轮已推送但尚未以 done 收尾的文本（检测中断时用于续写）
+        partial_chunks: List[str] = []
+
+        # 未分配技能的 agent 直接走最终流式回复，不进入工具轮次
+        if tools and skill_set:
+            max_tool_rounds = self._budget_value("max_tool_rounds", 4)
+            detect_timeout = self._budget_value("tool_detect_timeout_sec", 60)
+            total_tool_budget = self._budget_value("max_total_tool_time_sec", 180)
+            tool_started_at = datetime.now().timestamp()
+
+            for tool_round in range(max_tool_rounds):
+                elapsed = datetime.now().timestamp() - tool_started_at
+                if elapsed >= total_tool_budget:
+                    logger.warning(
+                        "Stream subagent %s tool budget exhausted (%.2fs/%ss), fallback to final stream",
+                        agent_name,
+                        elapsed,
+                        total_tool_budget,
+                    )
+                    break
 
-            elapsed = datetime.now().timestamp() - tool_started_at
-            if elapsed >= total_tool_budget:
-                logger.warning(
-                    "Stream subagent %s tool budget exhausted (%.2fs/%ss), fallback to final stream",
-                    self.agent_name,
-                    elapsed,
-                    total_tool_budget,
-                )
-                break
+                if logger.isEnabledFor(logging.INFO):
+                    # 统计上下文长度需遍历全部消息，仅在日志开启时计算
+                    logger.info(
+                        "Stream subagent %s tool round %s/%s detect start: context_chars=%s timeout=%ss",
+                        agent_name,
+                        tool_round + 1,
+                        max_tool_rounds,
+                        sum(len(m.content or "") for m in messages),
+                        detect_timeout,
+                    )
 
-            context_chars = sum(len(m.content or "") for m in self.messages)
-            logger.info(
-                "Stream subagent %s tool round %s/%s detect start: context_chars=%s timeout=%ss",
-                self.agent_name,
-                tool_round + 1,
-                max_tool_rounds,
-                context_chars,
-                detect_timeout,
-            )
+                # 边检测边推送：文本增量实时作为 thinking 下发，tool_calls 在流结束时一并给出
+                response: Optional[Dict[str, Any]] = None
+                budget = _StreamBudget(detect_timeout)
+                seen_tool_delta = False
+                try:
+                    async for event in _aiter_with_budget(
+                        provider.chat_stream_with_tools(messages, llm_config, tools=tools),
+                        budget,
+                    ):
+                        event_type = event["type"]
+                        if event_type == "content":
+                            if not seen_tool_delta and not partial_chunks:
+                                # 已开始输出正文且尚无工具调用：检测流即最终回复，改用剩余总预算
+                                budget.remaining = max(
+                                    budget.remaining,
+                                    total_tool_budget - (datetime.now().timestamp() - tool_started_at),
+                                )
+                            partial_chunks.append(event["delta"])
+                            yield {"type": "thinking", "delta": event["delta"]}
+                        elif event_type == "tool_call_delta":
+                            seen_tool_delta = True
+                        elif event_type == "done":
+                            response = event
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        "Stream subagent %s tool round %s hard-timeout (%ss), fallback to final stream",
+                        agent_name,
+                        tool_round + 1,
+                        detect_timeout,
+                    )
+                    break
+                except Exception as e:
+                    logger.warning(
+                        "Stream subagent %s tool round %s detect error: %s, fallback to final stream",
+                        agent_name,
+                        tool_round + 1,
+                        str(e),
+                    )
+                    break
 
-            detect_task = asyncio.create_task(
-                self.provider.chat_detect_tools_stream(self.messages, self.llm_config, tools=tools)
-            )
-            done, _ = await asyncio.wait({detect_task}, timeout=detect_timeout)
-            if not done:
-                detect_task.cancel()
-                logger.warning(
-                    "Stream subagent %s tool round %s hard-timeout (%ss), fallback to final stream",
-                    self.agent_name,
-                    tool_round + 1,
-                    detect_timeout,
-                )
-                break
+                if response is None:
+                    logger.warning(
+                        "Stream subagent %s tool round %s stream ended without result, fallback to final stream",
+                        agent_name,
+                        tool_round + 1,
+                    )
+                    break
 
-            try:
-                response = detect_task.result()
-            except Exception as e:
-                logger.warning(
-                    "Stream subagent %s tool round %s detect error: %s, fallback to final stream",
-                    self.agent_name,
+                content = response.get("content") or ""
+                tool_calls = response.get("tool_calls")
+                logger.info(
+                    "Stream subagent %s tool round %s detect done: finish_reason=%s content_len=%s tool_calls=%s",
+                    agent_name,
                     tool_round + 1,
-                    str(e),
+                    response.get("finish_reason"),
+                    len(content),
+                    len(tool_calls) if tool_calls else 0,
                 )
-                break
 
-            content = response.get("content", "")
-            tool_calls = response.get("tool_calls")
-            logger.info(
-                "Stream subagent %s tool round %s detect done: finish_reason=%s content_len=%s tool_calls=%s",
-                self.agent_name,
-                tool_round + 1,
-                response.get("finish_reason"),
-                len(content),
-                len(tool_calls) if tool_calls else 0,
-            )
-
-            if not tool_calls:
-                break
+                partial_chunks.clear()
+                if not tool_calls:
+                    # 没有 tool call 时，已推送的文本就是本轮最终回复，无需再发起一轮 chat()
+                    streamed_answer = content
+                    break
 
-            if content:
-                yield {"type": "thinking", "delta": content}
+                messages.append(LLMMessage(
+                    role="assistant",
+                    content=content or "",
+                    tool_calls=tool_calls,
+                ))
 
-            self.messages.append(LLMMessage(
-                role="assistant",
-                content=content or "",
-                tool_calls=tool_calls,
-            ))
+                parsed_calls = list(map(_parse_tool_call, tool_calls))
+                for ptc in parsed_calls:
+                    yield {
+                        "type": "tool_call_start",
+                        "tool_call_id": ptc.id,
+                        "tool_name": ptc.name,
+                        "skill_name": ptc.name,
+                        "arguments": ptc.args,
+                    }
 
-            for tc in tool_calls:
-                tc_id = tc.get("id", str(uuid.uuid4()))
-                func_name = tc.get("function", {}).get("name", "")
-                func_args_str = tc.get("function", {}).get("arguments", "{}")
+                    if on_tool_call:
+                        on_tool_call(agent_id, ToolCall(id=ptc.id, name=ptc.name, arguments=ptc.args))
 
+                # 同一轮内的工具调用彼此独立：并发执行，结果按完成顺序推送，tool 消息按原始顺序回填
+                semaphore = asyncio.Semaphore(self._budget_value("max_tool_parallelism", 4))
+                tool_tasks = [
+                    asyncio.create_task(self._execute_parsed_tool_call(ptc, semaphore))
+                    for ptc in parsed_calls
+                ]
                 try:
-                    func_args = json.loads(func_args_str) if isinstance(func_args_str, str) else func_args_str
-                except json.JSONDecodeError:
-                    func_args = {"task": func_args_str}
-
-                skill_name = self._skill_name_map.get(func_name, func_name)
-                task_desc = func_args.get("task", func_args.get("query", str(func_args)))
-
-                yield {
-                    "type": "tool_call_start",
-                    "tool_call_id": tc_id,
-                    "tool_name": func_name,
-                    "skill_name": skill_name or func_name,
-                    "arguments": func_args if isinstance(func_args, dict) else {"task": str(func_args)},
-                }
-
-                if self.on_tool_call:
-                    self.on_tool_call(self.agent_id, ToolCall(
-                        id=tc_id,
-                        name=func_name,
-                        arguments=func_args if isinstance(func_args, dict) else {"task": str(func_args)},
+                    for next_done in asyncio.as_completed(tool_tasks):
+                        ptc, tool_result = await next_done
+                        yield {
+                            "type": "tool_call_result",
+                            "tool_call_id": ptc.id,
+                            "tool_name": ptc.name,
+                            "skill_name": ptc.name,
+                            "success": tool_result["success"],
+                            "summary": tool_result["summary"],
+                            "result_preview": tool_result["result_preview"],
+                        }
+                finally:
+                    # 迭代被中断（取消/异常）时不遗留后台工具任务
+                    for task in tool_tasks:
+                        if not task.done():
+                            task.cancel()
+
+                for task in tool_tasks:
+                    ptc, tool_result = task.result()
+                    messages.append(LLMMessage(
+                        role="tool",
+                        content=tool_result["tool_message_content"],
+                        tool_call_id=ptc.id,
+                        name=ptc.name,
                     ))
+                self._move_cache_breakpoint(messages[-1])
 
-                tool_result = await self._execute_skill_with_guard(
-                    skill_name=skill_name or func_name,
-                    task_desc=task_desc,
-                    func_args=func_args if isinstance(func_args, dict) else {"task": str(func_args)},
-                )
-
-                yield {
-                    "type": "tool_call_result",
-                    "tool_call_id": tc_id,
-                    "tool_name": func_name,
-                    "skill_name": skill_name or func_name,
-                    "success": tool_result["success"],
-                    "summary": tool_result["summary"],
-                    "result_preview": tool_result["result_preview"],
-                }
-
-                self.messages.append(LLMMessage(
-                    role="tool",
-                    content=tool_result["tool_message_content"],
-                    tool_call_id=tc_id,
-                    name=func_name,
-                ))
-
-        # 最终回复：走流式 chat()，实时推送 thinking chunks
-        full_response = ""
+        # 最终回复：检测轮已流式给出时直接使用，否则走流式 chat()，实时推送 thinking chunks
+        full_response = streamed_answer
         final_chunk_count = 0
-        async for chunk in self.provider.chat(self.messages, self.llm_config):
-            final_chunk_count += 1
-            full_response += chunk
-            yield {"type": "thinking", "delta": chunk}
+        if not full_response.strip():
+            chunks: List[str] = []
+            final_messages = messages
+            if partial_chunks:
+                # 检测流中断前已推送过文本：保留已推送部分并从中断处续写，而不是重新生成一遍
+                chunks.append("".join(partial_chunks))
+                final_messages = messages + [
+                    LLMMessage(role="assistant", content=chunks[0]),
+                    LLMMessage(role="user", content=_RESUME_PARTIAL_PROMPT),
+                ]
+            async for chunk in provider.chat(final_messages, llm_config):
+                chunks.append(chunk)
+                yield {"type": "thinking", "delta": chunk}
+            final_chunk_count = len(chunks)
+            full_response = "".join(chunks)
 
         # 极端兜底：最终流为空时补一次非流式总结
         if not full_response.strip():
-            logger.warning("Stream subagent %s final stream empty, fallback to chat_complete", self.agent_name)
+            logger.warning("Stream subagent %s final stream empty, fallback to chat_complete", agent_name)
             try:
-                fallback_config = self.llm_config.model_copy(deep=True)
+                fallback_config = llm_config.model_copy(deep=True)
                 fallback_config.max_tokens = min(fallback_config.max_tokens, 2048)
-                fallback_resp = await self.provider.chat_complete(self.messages, fallback_config)
+                fallback_resp = await provider.chat_complete(messages, fallback_config)
                 fallback_text = (fallback_resp.get("content") or "").strip()
                 if fallback_text:
                     full_response = fallback_text
@@ -1078,22 +1655,42 @@ class SubagentRuntime:
                     full_response = "（已完成工具调用，但当前角色未返回最终文本。）"
                     yield {"type": "thinking", "delta": full_response}
             except Exception as e:
-                logger.warning("Stream subagent %s fallback final summary error: %s", self.agent_name, str(e))
+                logger.warning("Stream subagent %s fallback final summary error: %s", agent_name, str(e))
                 full_response = "（已完成工具调用，但最终总结生成失败。）"
                 yield {"type": "thinking", "delta": full_response}
 
         logger.info(
             "Stream subagent %s final stream done: chunks=%s response_len=%s",
-            self.agent_name,
+            agent_name,
             final_chunk_count,
             len(full_response),
         )
 
-        self.messages.append(LLMMessage(role="assistant", content=full_response))
+        messages.append(LLMMessage(role="assistant", content=full_response))
 
         # 标记最终内容（供 run_stream 判断完成和提取结果）
         yield {"type": "final_content", "content": full_response}
     
+    def _evaluate_completion(self, response: str) -> CompletionVerdict:
+        """一次性判定本轮响应是否完成
+        
+        中继站状态只检查一次，完成标记只扫描一次，结果供完成、阻塞、
+        续写提示三条分支共用。
+        """
+        has_pending, pending_summary = self._check_pending_relay_messages()
+        
+        if not self._has_completion_marker(response):
+            return CompletionVerdict(False, False, has_pending, pending_summary)
+        
+        # 有待处理的中继消息时，需要根据消息类型和内容决定是否可以完成
+        if has_pending and not self._can_complete_with_pending_messages(response, pending_summary):
+            return CompletionVerdict(False, True, has_pending, pending_summary)
+        
+        return CompletionVerdict(
+            True, False, has_pending, pending_summary,
+            final_result=self._extract_final_result(response),
+        )
+    
     def _is_task_complete(self, response: str) -> bool:
         """检查任务是否完成
         
@@ -1102,36 +1699,30 @@ class SubagentRuntime:
         2. 必须先检查中继站是否有待处理的消息
         3. 结合消息内容和指令来决定是否真正完成
         """
-        # 首先检查中继站是否有待处理的消息
-        has_pending, pending_summary = self._check_pending_relay_messages()
-        
-        if has_pending:
-            # 有待处理的中继消息，不能直接完成
-            # 需要根据消息类型和内容决定是否可以完成
-            can_complete = self._can_complete_with_pending_messages(response, pending_summary)
-            if not can_complete:
-                return False
+        return self._evaluate_completion(response).done
+    
+    def _markers_in(self, response: str) -> frozenset:
+        """返回响应中出现的字面标记，同一响应只扫描一次"""
+        text, markers = self._marker_scan
+        if text is not response:
+            markers = _scan_markers(response)
+            self._marker_scan = (response, markers)
+        return markers
+    
+    def _has_completion_marker(self, response: str) -> bool:
+        """检查响应中是否有完成标记（不考虑中继站状态）"""
+        markers = self._markers_in(response)
         
         # 严格模式：必须是明确的完成标记
-        strict_markers = ["[任务完成]", "[TASK_COMPLETE]", "**任务完成**", "## 任务完成"]
-        
-        # 检查严格标记
-        if any(marker in response for marker in strict_markers):
+        if not markers.isdisjoint(_COMPLETION_MARKERS):
             return True
         
         # 宽松检查：只有在迭代次数达到一定阈值后才生效
         # 这确保 Agent 至少进行了足够的思考
         if self.state.iterations >= 3:
             # 检查是否有完整的分析结论
-            conclusion_patterns = [
-                "综上所述",
-                "总结如下", 
-                "最终结论",
-                "分析报告",
-                "完整分析结果"
-            ]
             # 需要同时满足：有结论性词汇 + 内容足够长（表示完整分析）
-            has_conclusion = any(p in response for p in conclusion_patterns)
+            has_conclusion = not markers.isdisjoint(_CONCLUSION_MARKERS)
             is_substantial = len(response) > 800  # 确保是实质性的内容
             if has_conclusion and is_substantial:
                 return True
@@ -1143,7 +1734,12 @@ class SubagentRuntime:
         
         Returns:
             (has_pending, summary): 是否有待处理消息，以及消息摘要
+            （收件箱未变动时直接复用上次结果，调用方只读）
         """
+        cached = self._pending_summary_cache
+        if cached is not None and cached[0] == self._inbox_rev:
+            return cached[1], cached[2]
+        
         summary = {
             "total_count": 0,
             "intervention_count": 0,
@@ -1155,41 +1751,24 @@ class SubagentRuntime:
         }
         
         # 检查队列中的消息（不取出，只窥视）
-        pending_messages = []
-        temp_queue = asyncio.Queue()
-        
-        while not self.relay_inbox.empty():
-            try:
-                message = self.relay_inbox.get_nowait()
-                pending_messages.append(message)
-                temp_queue.put_nowait(message)
-            except asyncio.QueueEmpty:
-                break
-        
-        # 将消息放回原队列
-        while not temp_queue.empty():
-            try:
-                message = temp_queue.get_nowait()
-                self.relay_inbox.put_nowait(message)
-            except asyncio.QueueEmpty:
-                break
+        pending_messages = list(self.relay_inbox)
         
         summary["total_count"] = len(pending_messages)
         
         for msg in pending_messages:
-            msg_type = msg.type.value if hasattr(msg.type, 'value') else str(msg.type)
+            msg_type = _RELAY_TYPE_VALUES[msg.type]
             summary["message_types"].append(msg_type)
             
             # 统计人工干预
             if msg.type == RelayType.HUMAN_INTERVENTION:
                 summary["intervention_count"] += 1
-                intervention_type = msg.metadata.get("intervention_type", "unknown")
-                priority = msg.metadata.get("priority", 5)
-                summary["interventions"].append({
-                    "type": intervention_type,
-                    "priority": priority,
-                    "content_preview": msg.content[:100]
-                })
+                meta = msg.metadata
+                priority = meta.get("priority", 5)
+                summary["interventions"].append(PendingIntervention(
+                    meta.get("intervention_type", "unknown"),
+                    priority,
+                    msg.content[:100],
+                ))
                 
                 # 高优先级干预需要响应
                 if priority >= 7:
@@ -1206,6 +1785,7 @@ class SubagentRuntime:
             summary["unacknowledged_count"] > 0
         )
         
+        self._pending_summary_cache = (self._inbox_rev, has_pending, summary)
         return has_pending, summary
     
     def _can_complete_with_pending_messages(
@@ -1245,19 +1825,11 @@ class SubagentRuntime:
             InterventionType.ADJUST.value,
         ]
         for intervention in pending_summary.get("interventions", []):
-            if intervention["type"] in blocking_intervention_types:
+            if intervention.type in blocking_intervention_types:
                 return False
         
         # 规则5: 如果响应中明确表示已处理中继消息，则可以完成
-        acknowledgement_patterns = [
-            "已收到中继消息",
-            "已整合中继信息",
-            "已考虑人工干预",
-            "已根据干预调整",
-            "收到干预通知",
-            "已确认收到",
-        ]
-        if any(pattern in response for pattern in acknowledgement_patterns):
+        if not self._markers_in(response).isdisjoint(_ACKNOWLEDGEMENT_MARKERS):
             return True
         
         # 规则6: 只有普通低优先级消息，且响应足够完整，可以完成
@@ -1275,10 +1847,9 @@ class SubagentRuntime:
     def _extract_final_result(self, response: str) -> str:
         """提取最终结果"""
         # 尝试提取 [任务完成] 之后的内容
-        markers = ["[任务完成]", "[TASK_COMPLETE]"]
-        for marker in markers:
-            if marker in response:
-                idx = response.index(marker)
+        for marker in ("[任务完成]", "[TASK_COMPLETE]"):
+            idx = response.find(marker)
+            if idx != -1:
                 return response[idx:].strip()
         
         # 如果没有标记，返回整个响应
@@ -1299,30 +1870,8 @@ class SubagentRuntime:
         if len(cleaned) < 5:
             return True
         
-        # 只包含符号/标点
-        import re
-        if re.match(r'^[\s\*\#\-\=\_\.\,\。\，\、\；\：\"\"\'\'\（\）\【\】\《\》\！\？]+$', cleaned):
-            return True
-        
-        # 只包含 markdown 格式符号
-        if re.match(r'^[\*\#\-\>\s]+$', cleaned):
-            return True
-        
-        # 常见无意义模式
-        meaningless_patterns = [
-            r'^\*+$',           # 只有星号
-            r'^#+$',            # 只有井号
-            r'^-+$',            # 只有横线
-            r'^\s*$',           # 只有空白
-            r'^\.+$',           # 只有点
-            r'^\(.*\)$',        # 只有括号内容且很短
-        ]
-        
-        for pattern in meaningless_patterns:
-            if re.match(pattern, cleaned):
-                return True
-        
-        return False
+        # 只包含符号/标点、markdown 格式符号或括号内容
+        return _MEANINGLESS_RE.match(cleaned) is not None
     
     def _is_semantically_incomplete(self, content: str, is_response_type: bool = False) -> bool:
         """检查内容是否语义不完整
@@ -1338,27 +1887,14 @@ class SubagentRuntime:
         if not content:
             return True
         
-        import re
-        
         # 如果内容足够长（超过80字），通常是完整的
         if len(content) > 80:
             return False
         
-        # 语义不完整的模式：提到了"以下/如下"但内容太短
-        incomplete_indicators = [
-            r'以下[问题|内容|分析|要点|建议]',
-            r'如下[问题|内容|分析|要点|建议]',
-            r'下列[问题|内容|分析|要点|建议]',
-            r'以下是',
-            r'如下：',
-            r'包括：$',
-            r'分别是：$',
-        ]
-        
-        # 如果内容很短（少于50字）且包含这些指示词，可能是不完整的
+        # 如果内容很短（少于50字）且包含"以下/如下"等指示词，可能是不完整的
         if len(content) < 50:
-            for pattern in incomplete_indicators:
-                if re.search(pattern, content):
+            for pattern in _INCOMPLETE_INDICATORS:
+                if pattern.search(content):
                     return True
         
         # 检查是否只是一个称呼/问候（但要区分响应类型）
@@ -1372,12 +1908,12 @@ class SubagentRuntime:
             first_line = lines[0].strip() if lines else ""
             
             # 如果第一行是称呼，检查后续是否有内容
-            greeting_first_line = re.match(r'^(致|向|@)[^\s\n]{2,15}[：:]?\s*$', first_line)
+            greeting_first_line = _GREETING_FIRST_LINE_RE.match(first_line)
             if greeting_first_line:
                 # 检查后续内容
                 remaining_content = '\n'.join(lines[1:]).strip()
                 # 后续有实质内容（超过10字符且不只是标点）
-                if len(remaining_content) > 10 and not re.match(r'^[\s\*\#\-\=\_\.\,\。\，]+$', remaining_content):
+                if len(remaining_content) > 10 and not _SHORT_PUNCT_ONLY_RE.match(remaining_content):
                     return False  # 有实质内容，不是不完整的
                 else:
                     return True  # 没有实质后续内容
@@ -1386,18 +1922,10 @@ class SubagentRuntime:
                 return False
         
         # 非响应类型的称呼检查（严格模式）
-        greeting_patterns = [
-            r'^致[^\s]{2,10}$',                    # "致XXX" 只有称呼
-            r'^向[^\s]{2,10}$',                    # "向XXX"
-            r'^请[^\s]{2,10}[确认|注意|查看]?$',   # "请XXX确认"
-            r'^@[^\s]+$',                          # "@某人"
-        ]
-        
-        for pattern in greeting_patterns:
-            if re.match(pattern, content_stripped):
-                return True
-        
-        return False
+        return (
+            content_stripped.startswith(_GREETING_PREFIXES)
+            and _GREETING_RE.match(content_stripped) is not None
+        )
     
     async def _check_relay_trigger(self, response: str) -> Optional[RelayMessage]:
         """检查是否需要触发中继
@@ -1405,7 +1933,11 @@ class SubagentRuntime:
         智能检测：除了显式标记外，也检测内容中的关键发现模式
         支持：发现、请求、响应、建议、确认等多种类型
         """
-        import re
+        markers = self._markers_in(response)
+        
+        # 快速路径：没有任何显式中继标记，且尚未到启用内容模式检测的迭代数
+        if self.state.iterations < 2 and markers.isdisjoint(_RELAY_TAG_MARKERS):
+            return None
         
         relay_type = None
         reason = ""
@@ -1413,17 +1945,15 @@ class SubagentRuntime:
         target_agent_ids = []  # 支持指定目标
         
         # === 辅助函数：提取标记后的完整内容 ===
-        def extract_full_content(response: str, tag_pattern: str, tag_end: str = "]") -> tuple[str, str]:
+        def extract_full_content(response: str, tag_pattern: "re.Pattern[str]") -> tuple[str, str]:
             """
             提取标记内容 + 标记后的相关内容
             
             例如：[响应对齐: 致影评整合专家]\n\n以下是我的分析...
             返回：("致影评整合专家", "以下是我的分析...")
             """
-            import re
-            
             # 找到标记位置
-            tag_match = re.search(tag_pattern, response)
+            tag_match = tag_pattern.search(response)
             if not tag_match:
                 return "", ""
             
@@ -1435,16 +1965,9 @@ class SubagentRuntime:
             
             # 查找后续内容的结束位置
             # 遇到新的标记、分隔线、或超过500字符时停止
-            end_patterns = [
-                r'\n\[',           # 新的标记
-                r'\n---',          # 分隔线
-                r'\n\*\*\[',       # 加粗的标记
-                r'\n##',           # 标题
-            ]
-            
             end_pos = len(remaining)
-            for end_pat in end_patterns:
-                match = re.search(end_pat, remaining)
+            for end_pat in _FOLLOWING_END_PATTERNS:
+                match = end_pat.search(remaining)
                 if match and match.start() < end_pos:
                     end_pos = match.start()
             
@@ -1457,12 +1980,12 @@ class SubagentRuntime:
         # === 响应类消息检测（优先级最高）===
         
         # 检查响应对齐
-        if "[响应对齐:" in response:
-            tag_content, following = extract_full_content(response, r'\[响应对齐:\s*([^\]]+)\]')
+        if "[响应对齐:" in markers:
+            tag_content, following = extract_full_content(response, _TAG_ALIGNMENT_RESPONSE_RE)
             if tag_content:
                 # 响应对齐需要有实质内容
                 # 如果标记内容是称呼形式（致XXX），必须有后续内容
-                is_greeting_format = re.match(r'^(致|向|针对)[^\s]{2,15}', tag_content.strip())
+                is_greeting_format = _GREETING_TAG_RE.match(tag_content.strip())
                 
                 if following and len(following) > 10:
                     # 有后续内容，合并
@@ -1476,14 +1999,18 @@ class SubagentRuntime:
                     reason = "响应对齐请求"
                 else:
                     # 是称呼格式但没有实质后续内容，记录日志但不发送
-                    print(f"[SubAgent {self.agent_name}] 响应对齐内容不完整，跳过: tag='{tag_content[:30]}', following='{following[:30] if following else 'None'}'")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(
+                            "Subagent %s 响应对齐内容不完整，跳过: tag='%s', following='%s'",
+                            self.agent_name, tag_content[:30], following[:30] if following else None,
+                        )
         
         # 检查回复
-        elif "[回复:" in response:
-            tag_content, following = extract_full_content(response, r'\[回复:\s*([^\]]+)\]')
+        elif "[回复:" in markers:
+            tag_content, following = extract_full_content(response, _TAG_REPLY_RE)
             if tag_content:
                 # 同样的逻辑
-                is_greeting_format = re.match(r'^(致|向|针对)[^\s]{2,15}', tag_content.strip())
+                is_greeting_format = _GREETING_TAG_RE.match(tag_content.strip())
                 
                 if following and len(following) > 10:
                     content = f"{tag_content}\n\n{following}"
@@ -1494,11 +2021,15 @@ class SubagentRuntime:
                     relay_type = RelayType.ALIGNMENT_RESPONSE
                     reason = "回复求助"
                 else:
-                    print(f"[SubAgent {self.agent_name}] 回复内容不完整，跳过: tag='{tag_content[:30]}', following='{following[:30] if following else 'None'}'")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(
+                            "Subagent %s 回复内容不完整，跳过: tag='%s', following='%s'",
+                            self.agent_name, tag_content[:30], following[:30] if following else None,
+                        )
         
         # 检查确认
-        elif "[确认:" in response:
-            tag_content, following = extract_full_content(response, r'\[确认:\s*([^\]]+)\]')
+        elif "[确认:" in markers:
+            tag_content, following = extract_full_content(response, _TAG_CONFIRMATION_RE)
             if tag_content:
                 if following and len(following) > 10:
                     content = f"{tag_content}\n\n{following}"
@@ -1510,8 +2041,8 @@ class SubagentRuntime:
         # === 请求类消息检测 ===
         
         # 检查显式中继请求（请求对齐）
-        elif "[请求中继:" in response:
-            tag_content, following = extract_full_content(response, r'\[请求中继:\s*([^\]]+)\]')
+        elif "[请求中继:" in markers:
+            tag_content, following = extract_full_content(response, _TAG_RELAY_REQUEST_RE)
             if tag_content:
                 # 请求对齐需要完整的上下文
                 if following and len(following) > 10:
@@ -1522,8 +2053,8 @@ class SubagentRuntime:
                 reason = tag_content
         
         # 检查疑问/求助
-        elif "[求助:" in response or "[疑问:" in response:
-            help_match = re.search(r'\[(求助|疑问):\s*([^\]]+)\]', response)
+        elif "[求助:" in markers or "[疑问:" in markers:
+            help_match = _TAG_HELP_RE.search(response)
             if help_match:
                 tag_type = help_match.group(1)
                 tag_content = help_match.group(2)
@@ -1531,7 +2062,7 @@ class SubagentRuntime:
                 tag_end_pos = help_match.end()
                 remaining = response[tag_end_pos:tag_end_pos + 500].strip()
                 # 简单截取到下一个标记
-                next_tag = re.search(r'\n\[|\n---|\n##', remaining)
+                next_tag = _HELP_FOLLOWING_END_RE.search(remaining)
                 following = remaining[:next_tag.start()].strip() if next_tag else remaining[:300].strip()
                 
                 if following and len(following) > 10:
@@ -1542,8 +2073,8 @@ class SubagentRuntime:
                 reason = tag_content
         
         # 检查建议
-        elif "[建议:" in response:
-            tag_content, following = extract_full_content(response, r'\[建议:\s*([^\]]+)\]')
+        elif "[建议:" in markers:
+            tag_content, following = extract_full_content(response, _TAG_SUGGESTION_RE)
             if tag_content:
                 if following and len(following) > 10:
                     content = f"建议: {tag_content}\n\n{following}"
@@ -1555,8 +2086,8 @@ class SubagentRuntime:
         # === 发现类消息检测 ===
         
         # 检查显式关键发现标记
-        elif "[关键发现]" in response or "**[关键发现]**" in response:
-            discovery_match = re.search(r'\[关键发现\]\s*(.+?)(?:\n\n|\n-|$)', response, re.DOTALL)
+        elif "[关键发现]" in markers:
+            discovery_match = _TAG_DISCOVERY_RE.search(response)
             if discovery_match:
                 content = discovery_match.group(1).strip()
                 # 验证内容有效性
@@ -1567,8 +2098,8 @@ class SubagentRuntime:
                     content = ""  # 无效内容，不发送
         
         # 检查洞察
-        elif "[洞察]" in response or "[核心洞察]" in response:
-            insight_match = re.search(r'\[(核心)?洞察\]\s*(.+?)(?:\n\n|\n-|$)', response, re.DOTALL)
+        elif "[洞察]" in markers or "[核心洞察]" in markers:
+            insight_match = _TAG_INSIGHT_RE.search(response)
             if insight_match:
                 content = insight_match.group(2).strip()
                 # 验证内容有效性
@@ -1580,19 +2111,9 @@ class SubagentRuntime:
         
         # 方式6: 智能检测重要发现（基于内容模式）
         # 只在迭代足够多时启用，避免过早触发
-        elif self.state.iterations >= 2:
-            important_patterns = [
-                (r'值得注意的是[：:]\s*(.{20,200})', "值得注意的发现", RelayType.DISCOVERY),
-                (r'重要发现[：:]\s*(.{20,200})', "重要发现", RelayType.DISCOVERY),
-                (r'关键点[：:]\s*(.{20,200})', "关键点", RelayType.DISCOVERY),
-                (r'核心洞察[：:]\s*(.{20,200})', "核心洞察", RelayType.INSIGHT),
-                (r'重大影响[：:]\s*(.{20,200})', "重大影响", RelayType.DISCOVERY),
-                (r'需要其他.*?(?:配合|协作|确认)', "跨域协作需求", RelayType.ALIGNMENT_REQUEST),
-                (r'建议.*?(?:考虑|采用|使用)', "协作建议", RelayType.SUGGESTION),
-            ]
-            
-            for pattern, pattern_reason, pattern_type in important_patterns:
-                match = re.search(pattern, response)
+        elif self.state.iterations >= 2 and _IMPORTANT_ANY_RE.search(response):
+            for pattern, pattern_reason, pattern_type in _IMPORTANT_PATTERNS:
+                match = pattern.search(response)
                 if match:
                     content = match.group(1) if match.lastindex else match.group(0)
                     relay_type = pattern_type
@@ -1612,16 +2133,19 @@ class SubagentRuntime:
             
             # 验证内容有效性（最小长度 + 非无意义内容 + 语义完整性）
             if len(content) < 5:
-                print(f"[SubAgent {self.agent_name}] Skipped too short relay content: '{content[:50]}...'")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Subagent %s skipped too short relay content: '%s...'", self.agent_name, content[:50])
                 return None
             
             if self._is_meaningless_content(content):
-                print(f"[SubAgent {self.agent_name}] Skipped meaningless relay content: '{content[:50]}...'")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Subagent %s skipped meaningless relay content: '%s...'", self.agent_name, content[:50])
                 return None
             
             # 对响应类型使用宽松的语义完整性检查
             if self._is_semantically_incomplete(content, is_response_type=is_response_type):
-                print(f"[SubAgent {self.agent_name}] Skipped semantically incomplete relay content: '{content[:50]}...'")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Subagent %s skipped semantically incomplete relay content: '%s...'", self.agent_name, content[:50])
                 return None
             
             relay_msg = RelayMessage(
@@ -1643,31 +2167,45 @@ class SubagentRuntime:
         
         return None
     
-    async def _process_relay_inbox(self):
-        """处理中继收件箱 - 升级版，智能处理人工干预"""
+    async def _process_relay_inbox(self) -> Tuple[List[RelayMessage], bool]:
+        """处理中继收件箱 - 升级版，智能处理人工干预
+        
+        Returns:
+            (已处理的消息列表, 其中是否包含人工干预)
+        """
         processed_messages = []
         intervention_messages = []
         regular_messages = []
+        seen_ids = set()
+        
+        # 一次性取空收件箱，按 id 去重并分类
+        inbox = self.relay_inbox
+        if inbox:
+            self._inbox_rev += 1
+            self.relay_event.clear()
+        while inbox:
+            message: RelayMessage = inbox.popleft()
+            if message.id in seen_ids:
+                continue
+            seen_ids.add(message.id)
+            if message.type == RelayType.HUMAN_INTERVENTION:
+                intervention_messages.append(message)
+            else:
+                regular_messages.append(message)
         
-        # 先收集所有消息并分类
-        while not self.relay_inbox.empty():
-            try:
-                message: RelayMessage = self.relay_inbox.get_nowait()
-                if message.type == RelayType.HUMAN_INTERVENTION:
-                    intervention_messages.append(message)
-                else:
-                    regular_messages.append(message)
-            except asyncio.QueueEmpty:
-                break
+        if not intervention_messages and not regular_messages:
+            return processed_messages, False
         
-        # 优先处理人工干预消息（按重要性排序）
+        # 按重要性排序：人工干预优先，其次是重要性更高的中继消息
         intervention_messages.sort(key=lambda m: m.importance, reverse=True)
+        regular_messages.sort(key=lambda m: m.importance, reverse=True)
+        new_messages: List[LLMMessage] = []
         
         for message in intervention_messages:
             # 构建增强的干预提示
             intervention_content = self._build_intervention_prompt(message)
             
-            self.messages.append(LLMMessage(
+            new_messages.append(LLMMessage(
                 role="user",
                 content=intervention_content
             ))
@@ -1676,89 +2214,23 @@ class SubagentRuntime:
         
         # 处理普通中继消息（根据类型给出不同的响应提示）
         for message in regular_messages:
-            msg_type = message.type.value if hasattr(message.type, 'value') else str(message.type)
-            
-            # 根据消息类型构建不同的响应提示
-            if message.type == RelayType.ALIGNMENT_REQUEST:
-                # 对齐请求 - 需要响应
-                prompt = f"""[来自 {message.source_agent_name} 的对齐请求 🔄]
-内容: {message.content}
-
-**这是一个需要响应的请求！** 请：
-1. 考虑你的分析是否与此请求相关
-2. 如果相关，请使用以下格式进行响应：
-
-[响应对齐: 针对XXX的回复]
-这里写你的实际响应内容，包括：
-- 你的相关发现或分析结论
-- 对请求问题的直接回答
-- 你认为重要的补充信息
-
-**注意**：响应内容要完整具体，不要只写称呼或空泛的确认。
-"""
-            elif message.type == RelayType.QUESTION:
-                # 问题/求助 - 需要回答
-                prompt = f"""[来自 {message.source_agent_name} 的求助 ❓]
-内容: {message.content}
-
-**这是一个求助请求！** 如果你有相关知识或见解：
-请使用以下格式进行回复：
-
-[回复: 针对XXX问题的解答]
-这里写你的具体回答内容，包括：
-- 对问题的直接回答
-- 相关的分析或依据
-- 如有必要，附上你的建议
-
-**注意**：回复内容要具体有帮助，不要只写"已收到"或空泛确认。
-"""
-            elif message.type == RelayType.SUGGESTION:
-                # 建议 - 可选采纳
-                prompt = f"""[来自 {message.source_agent_name} 的建议 💡]
-内容: {message.content}
-
-这是一个建议，你可以：
-1. 如果认为有价值，整合到你的分析中
-2. 使用 [确认: 原因] 表示采纳
-3. 忽略如果与你的任务无关
-"""
-            elif message.type == RelayType.ALIGNMENT_RESPONSE:
-                # 对齐响应 - 仅供参考
-                prompt = f"""[来自 {message.source_agent_name} 的对齐响应 ✅]
-内容: {message.content}
-
-这是对之前对齐请求的响应，请参考整合。
-"""
-            elif message.type == RelayType.CONFIRMATION:
-                # 确认 - 仅供参考
-                prompt = f"""[来自 {message.source_agent_name} 的确认 ✔️]
-内容: {message.content}
-
-其他 Agent 确认了你的发现/建议。
-"""
-            elif message.type == RelayType.INSIGHT:
-                # 洞察 - 高价值信息
-                prompt = f"""[来自 {message.source_agent_name} 的核心洞察 🎯]
-内容: {message.content}
-
-这是一个重要的洞察，请仔细考虑是否能整合到你的分析中。
-"""
-            else:
-                # 默认处理（discovery 等）
-                prompt = f"""[来自 {message.source_agent_name} 的中继消息]
-类型: {msg_type}
-内容: {message.content}
-
-请考虑这个信息，如果它与你的分析相关，请进行整合和调整。
-"""
+            # 根据消息类型选择对应的响应提示模板
+            template = _RELAY_PROMPT_TEMPLATES.get(message.type, _RELAY_PROMPT_DEFAULT_TMPL)
+            prompt = template.format(
+                source=message.source_agent_name,
+                content=message.content,
+                msg_type=_RELAY_TYPE_VALUES[message.type],
+            )
             
-            self.messages.append(LLMMessage(
+            new_messages.append(LLMMessage(
                 role="user",
                 content=prompt
             ))
             processed_messages.append(message)
         
-        return processed_messages
+        # 一次性追加到对话历史
+        self.messages.extend(new_messages)
+        return processed_messages, bool(intervention_messages)
     
     def _build_intervention_prompt(self, message: RelayMessage) -> str:
         """构建人工干预的智能提示
@@ -1769,96 +2241,25 @@ class SubagentRuntime:
         priority = message.metadata.get("priority", 5)
         payload = message.metadata.get("payload", {})
         
-        # 基础框架
-        prompt_parts = [
-            f"⚠️ **[重要：人工干预通知 - 优先级 {priority}/10]**",
-            f"",
-            f"来自: {message.source_agent_name}",
-            f"",
-        ]
-        
-        # 根据干预类型添加具体指导
+        template = _INTERVENTION_BODY_TEMPLATES.get(intervention_type, _INTERVENTION_DEFAULT_TMPL)
         if intervention_type == InterventionType.INJECT.value:
-            info = payload.get("information", message.content)
-            prompt_parts.extend([
-                "**类型**: 信息注入",
-                "",
-                "**注入内容**:",
-                info,
-                "",
-                "**请执行以下操作**:",
-                "1. 仔细阅读上述注入的信息",
-                "2. 评估这些信息与你当前任务的相关性",
-                "3. 如果相关，将其整合到你的分析中",
-                "4. 如果需要调整方向，说明调整原因",
-                "5. 在下一轮输出中体现对这些信息的考虑",
-            ])
-        
+            values = {"info": payload.get("information", message.content)}
         elif intervention_type == InterventionType.ADJUST.value:
-            adjustments = payload.get("adjustments", {})
-            prompt_parts.extend([
-                "**类型**: 行为调整指令",
-                "",
-                "**调整要求**:",
-            ])
-            for key, value in adjustments.items():
-                prompt_parts.append(f"- {key}: {value}")
-            prompt_parts.extend([
-                "",
-                "**请执行以下操作**:",
-                "1. 理解上述调整要求",
-                "2. 评估如何在保持任务目标的前提下融入这些调整",
-                "3. 在后续工作中体现这些调整",
-                "4. 如果某些调整与当前任务冲突，请说明原因",
-            ])
-        
-        elif intervention_type == InterventionType.PAUSE.value:
-            prompt_parts.extend([
-                "**类型**: 暂停通知",
-                "",
-                message.content,
-                "",
-                "**注意**: 你可能即将被暂停，请在当前响应中总结进度。",
-            ])
-        
-        elif intervention_type == InterventionType.RESUME.value:
-            prompt_parts.extend([
-                "**类型**: 恢复通知",
-                "",
-                message.content,
-                "",
-                "**请执行以下操作**:",
-                "1. 回顾之前的工作进度",
-                "2. 继续未完成的任务",
-                "3. 如有新的信息需要考虑，请整合进来",
-            ])
-        
-        elif intervention_type == InterventionType.CANCEL.value:
-            prompt_parts.extend([
-                "**类型**: 取消通知",
-                "",
-                message.content,
-                "",
-                "**注意**: 另一个 Agent 的任务已被取消。如果这影响到你的工作，请相应调整。",
-            ])
-        
+            values = {"adjustments": "".join(
+                f"\n- {key}: {value}" for key, value in payload.get("adjustments", {}).items()
+            )}
         else:
-            # 通用处理
-            prompt_parts.extend([
-                message.content,
-                "",
-                "请根据上述人工干预信息，适当调整你的工作。",
-            ])
+            values = {"content": message.content}
+        
+        prompt = _INTERVENTION_HEADER_TMPL.format(
+            priority=priority, source=message.source_agent_name
+        ) + template.format_map(values)
         
         # 添加确认要求
         if message.metadata.get("requires_acknowledgement"):
-            prompt_parts.extend([
-                "",
-                "---",
-                "📝 请在你的下一轮响应开头确认收到此干预通知。",
-            ])
+            prompt += _INTERVENTION_ACK_SUFFIX
         
-        return "\n".join(prompt_parts)
+        return prompt
     
     def _build_continuation_prompt(
         self, 
@@ -1875,68 +2276,28 @@ class SubagentRuntime:
             last_response: 上一轮响应
             pending_summary: 待处理消息摘要（如果有）
         """
-        prompt_parts = []
+        # 根据迭代阶段选择引导语
+        stage_prompt = _CONTINUATION_STAGE_PROMPTS.get(iteration, _CONTINUATION_DEFAULT_PROMPT)
         
         # 如果有待处理消息，优先提醒
-        if pending_summary and pending_summary.get("total_count", 0) > 0:
-            prompt_parts.append("⚠️ **注意：中继站有待处理的消息**")
-            prompt_parts.append("")
-            
-            if pending_summary.get("intervention_count", 0) > 0:
-                prompt_parts.append(f"- 人工干预消息: {pending_summary['intervention_count']} 条")
-                for intervention in pending_summary.get("interventions", []):
-                    prompt_parts.append(f"  - 类型: {intervention['type']}, 优先级: {intervention['priority']}")
-            
-            if pending_summary.get("total_count", 0) > pending_summary.get("intervention_count", 0):
-                other_count = pending_summary["total_count"] - pending_summary.get("intervention_count", 0)
-                prompt_parts.append(f"- 其他中继消息: {other_count} 条")
-            
-            prompt_parts.append("")
-            prompt_parts.append("请先处理这些消息后再继续你的分析。")
-            prompt_parts.append("")
-            prompt_parts.append("---")
-            prompt_parts.append("")
-        
-        # 根据迭代阶段添加引导
-        if iteration == 1:
-            # 第一轮后，引导深入细节
-            prompt_parts.extend([
-                "你的初步分析很好。现在请：",
-                "1. 针对你提到的关键点，进行更深入的分析",
-                "2. 考虑是否有遗漏的角度或维度",
-                "3. 如果有重要发现，请用 **[关键发现]** 标记",
-                "",
-                "继续深入分析："
-            ])
-        elif iteration == 2:
-            # 第二轮后，引导发现关联
-            prompt_parts.extend([
-                "分析正在深入。请：",
-                "1. 思考你的发现之间有什么关联或模式",
-                "2. 是否有需要与其他专家角色协作确认的问题？如有，请用 **[请求中继: 原因]** 标记",
-                "3. 继续挖掘潜在的洞察",
-                "",
-                "继续分析："
-            ])
-        elif iteration == 3:
-            # 第三轮后，引导整合
-            prompt_parts.extend([
-                "分析已经比较深入。请：",
-                "1. 尝试整合你的各项发现",
-                "2. 形成初步的结论框架",
-                "3. 如果你认为分析已经完整，可以用 **[任务完成]** 标记并给出完整结论",
-                "",
-                "继续："
-            ])
-        else:
-            # 后续轮次，给予更大自由度
-            prompt_parts.extend([
-                "请继续你的分析，如果你认为已经足够深入和完整，请用 **[任务完成]** 标记并给出最终分析结果。",
-                "",
-                "继续："
-            ])
+        if not pending_summary or pending_summary.get("total_count", 0) <= 0:
+            return stage_prompt
+        
+        intervention_count = pending_summary.get("intervention_count", 0)
+        detail_lines = []
+        if intervention_count > 0:
+            detail_lines.append(f"- 人工干预消息: {intervention_count} 条")
+            detail_lines.extend(
+                f"  - 类型: {intervention.type}, 优先级: {intervention.priority}"
+                for intervention in pending_summary.get("interventions", [])
+            )
+        if pending_summary["total_count"] > intervention_count:
+            detail_lines.append(f"- 其他中继消息: {pending_summary['total_count'] - intervention_count} 条")
         
-        return "\n".join(prompt_parts)
+        return _CONTINUATION_PENDING_TMPL.format(
+            details="\n".join(detail_lines),
+            stage_prompt=stage_prompt,
+        )
     
     def _build_pending_message_prompt(self, pending_summary: Dict[str, Any]) -> str:
         """构建待处理消息提示
@@ -1947,44 +2308,30 @@ class SubagentRuntime:
         Args:
             pending_summary: 待处理消息摘要
         """
-        prompt_parts = [
-            "⚠️ **任务完成被阻止**",
-            "",
-            "在标记任务完成之前，你需要先处理中继站中的待处理消息：",
-            "",
-        ]
+        prompt_parts = [_PENDING_BLOCKED_HEADER]
         
         # 详细列出待处理内容
-        if pending_summary.get("intervention_count", 0) > 0:
-            prompt_parts.append(f"📢 **人工干预消息** ({pending_summary['intervention_count']} 条):")
-            for i, intervention in enumerate(pending_summary.get("interventions", []), 1):
-                prompt_parts.append(f"  {i}. 类型: {intervention['type']}")
-                prompt_parts.append(f"     优先级: {intervention['priority']}/10")
-                prompt_parts.append(f"     内容预览: {intervention['content_preview'][:80]}...")
+        intervention_count = pending_summary.get("intervention_count", 0)
+        if intervention_count > 0:
+            prompt_parts.append(f"📢 **人工干预消息** ({intervention_count} 条):")
+            prompt_parts.extend(
+                f"  {i}. 类型: {intervention.type}\n"
+                f"     优先级: {intervention.priority}/10\n"
+                f"     内容预览: {intervention.content_preview[:80]}..."
+                for i, intervention in enumerate(pending_summary.get("interventions", []), 1)
+            )
             prompt_parts.append("")
         
-        if pending_summary.get("unacknowledged_count", 0) > 0:
-            prompt_parts.append(f"❗ **未确认的干预消息**: {pending_summary['unacknowledged_count']} 条")
-            prompt_parts.append("")
+        unacknowledged_count = pending_summary.get("unacknowledged_count", 0)
+        if unacknowledged_count > 0:
+            prompt_parts.append(f"❗ **未确认的干预消息**: {unacknowledged_count} 条\n")
         
-        other_count = pending_summary.get("total_count", 0) - pending_summary.get("intervention_count", 0)
+        other_count = pending_summary.get("total_count", 0) - intervention_count
         if other_count > 0:
-            prompt_parts.append(f"💬 **其他中继消息**: {other_count} 条")
-            prompt_parts.append("")
+            prompt_parts.append(f"💬 **其他中继消息**: {other_count} 条\n")
         
         # 添加处理指导
-        prompt_parts.extend([
-            "---",
-            "",
-            "**请按以下步骤处理**：",
-            "1. 仔细阅读上述待处理消息的内容",
-            "2. 根据消息内容调整你的分析或结论",
-            "3. 如果收到人工干预，请明确确认：「已收到干预通知，内容是...」",
-            "4. 如果干预要求你调整方向，请说明你的调整",
-            "5. 处理完所有消息后，再考虑是否可以完成任务",
-            "",
-            "请处理这些消息并给出你的响应："
-        ])
+        prompt_parts.append(_PENDING_BLOCKED_GUIDE)
         
         return "\n".join(prompt_parts)
     
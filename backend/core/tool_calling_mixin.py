@@ -14,14 +14,62 @@ Tool Calling Mixin for Subagent
 - 支持异步工具执行
 """
 
+import asyncio
 import json
 import logging
-from typing import Dict, Any, List, Optional
+from collections import defaultdict
+from itertools import chain
+from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
 
 from llm.provider import LLMMessage
+from utils.jsonfast import (
+    json_dumps as _json_dumps,
+    json_dumps_indent as _json_dumps_indent,
+    json_dumps_sorted as _json_dumps_sorted,
+    json_loads as _json_loads,
+)
 
 logger = logging.getLogger(__name__)
 
+# 工具结果 Prompt 渲染的固定片段
+_TOOL_RESULTS_HEADER = "\n## 🔧 工具执行结果\n"
+_RESULT_SUCCESS_LINE = "**状态**: ✅ 成功"
+_RESULT_FAILURE_TMPL = "**状态**: ❌ 失败\n**错误**: {error}"
+# 单条检索结果：标题行 + 可选的链接/摘要行，末尾空行分隔
+_RESULT_ITEM_TMPL = "**{i}. {title}**{url_line}{snippet_line}\n"
+
+
+def _format_result_item(i: int, res: Dict[str, Any]) -> str:
+    """渲染单条检索结果（摘要截断到 200 字）"""
+    url = res.get("url", "")
+    snippet = res.get("snippet", "")[:200]
+    return _RESULT_ITEM_TMPL.format(
+        i=i,
+        title=res.get("title", "无标题"),
+        url_line=f"\n   链接: {url}" if url else "",
+        snippet_line=f"\n   摘要: {snippet}" if snippet else "",
+    )
+
+
+def _tool_call_key(tool_call: Dict[str, Any]) -> Tuple[str, str]:
+    """工具调用的去重键：(函数名, 规范化参数)，参数键顺序不同视为同一调用"""
+    function = tool_call.get("function", {})
+    arguments = function.get("arguments") or "{}"
+    try:
+        arguments = _json_dumps_sorted(_json_loads(arguments))
+    except (TypeError, ValueError):
+        pass
+    return function.get("name", ""), arguments
+
+
+def _is_success_result(result: Dict[str, Any]) -> bool:
+    """工具处理器结果的 content 是否表示执行成功（{"success": true, ...}）"""
+    try:
+        parsed = _json_loads(result.get("content") or "{}")
+    except (TypeError, ValueError):
+        return False
+    return isinstance(parsed, dict) and parsed.get("success") is True
+
 
 class ToolCallingMixin:
     """
@@ -35,6 +83,9 @@ class ToolCallingMixin:
         self._tool_handler = None
         self._tool_definitions = []
         self._tool_call_history = []
+        # 技能名 -> 工具定义 的倒排索引，以及按已分配技能组合缓存的工具列表
+        self._tools_by_skill: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._skill_tools_cache: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
         
         # 尝试加载工具处理器
         try:
@@ -46,6 +97,12 @@ class ToolCallingMixin:
                 init_skill_tools()
             
             self._tool_definitions = self._tool_handler.get_tool_definitions()
+            handler_tools = self._tool_handler._tools
+            for tool in self._tool_definitions:
+                skill_name = handler_tools.get(
+                    tool.get("function", {}).get("name"), {}
+                ).get("skill_name")
+                self._tools_by_skill[skill_name].append(tool)
             logger.info(f"Tool calling initialized with {len(self._tool_definitions)} tools")
             
         except ImportError as e:
@@ -56,21 +113,21 @@ class ToolCallingMixin:
         if not self._tool_handler:
             return []
         
-        return [
-            tool for tool in self._tool_definitions
-            if self._tool_handler._tools.get(
-                tool.get("function", {}).get("name"), {}
-            ).get("skill_name") == skill_name
-        ]
+        return list(self._tools_by_skill.get(skill_name, ()))
     
     def _get_assigned_skill_tools(self) -> List[Dict[str, Any]]:
         """获取已分配技能的工具定义"""
         if not hasattr(self, 'skill_set') or not self.skill_set:
             return []
         
-        tools = []
-        for skill_name in self.skill_set.list_skills():
-            tools.extend(self._get_tools_for_skill(skill_name))
+        # 已分配技能在一轮对话内基本不变，按技能名组合（保持顺序）缓存结果
+        key = tuple(self.skill_set.list_skills())
+        tools = self._skill_tools_cache.get(key)
+        if tools is None:
+            tools = list(chain.from_iterable(
+                self._tools_by_skill.get(skill_name, ()) for skill_name in key
+            ))
+            self._skill_tools_cache[key] = tools
         
         return tools
     
@@ -107,18 +164,49 @@ class ToolCallingMixin:
         tool_calls_made = []
         iteration = 0
         
+        # 支持已序列化消息的 provider：增量维护 API 格式消息，每轮只序列化新追加的消息
+        stream_serialized = getattr(self.provider, "chat_stream_with_tools_serialized", None)
+        complete_serialized = getattr(self.provider, "chat_complete_serialized", None)
+        serialized_messages = (
+            [m.to_api_dict() for m in current_messages]
+            if stream_serialized or complete_serialized else None
+        )
+        semaphore = self._tool_semaphore()
+        # 本次调用内的工具结果缓存：模型重复发起相同调用时共享执行、复用成功结果
+        tool_result_cache: Dict[Tuple[str, str], "asyncio.Future[Dict[str, Any]]"] = {}
+        
         while iteration < max_tool_iterations:
             iteration += 1
             
-            # 调用 LLM，传入工具定义
-            response = await self.provider.chat_complete(
-                current_messages,
-                self.llm_config,
-                tools=tools
-            )
+            if serialized_messages is not None:
+                serialized_messages.extend(
+                    m.to_api_dict() for m in current_messages[len(serialized_messages):]
+                )
             
-            content = response.get("content", "")
-            tool_calls = response.get("tool_calls")
+            # 调用 LLM，传入工具定义
+            tool_results = None
+            if stream_serialized:
+                # 流式调用：参数完整的 tool_call 在生成过程中即开始执行
+                content, tool_calls, tool_results = await self._stream_tool_round(
+                    stream_serialized(serialized_messages, self.llm_config, tools=tools),
+                    semaphore,
+                    tool_result_cache
+                )
+            else:
+                if complete_serialized:
+                    response = await complete_serialized(
+                        serialized_messages,
+                        self.llm_config,
+                        tools=tools
+                    )
+                else:
+                    response = await self.provider.chat_complete(
+                        current_messages,
+                        self.llm_config,
+                        tools=tools
+                    )
+                content = response.get("content", "")
+                tool_calls = response.get("tool_calls")
             
             if not tool_calls:
                 # 没有工具调用，返回响应
@@ -137,8 +225,11 @@ class ToolCallingMixin:
                 tool_calls=tool_calls
             ))
             
-            # 执行工具调用
-            tool_results = await self._tool_handler.handle_tool_calls(tool_calls)
+            # 执行工具调用（同一轮的多个调用并发执行；流式轮次已在生成过程中执行）
+            if tool_results is None:
+                tool_results = await self._handle_tool_calls_parallel(
+                    tool_calls, semaphore, tool_result_cache
+                )
             
             # 记录工具执行
             for tc, result in zip(tool_calls, tool_results):
@@ -147,14 +238,16 @@ class ToolCallingMixin:
                     "result": result
                 })
             
-            # 添加工具结果消息
-            for result in tool_results:
-                current_messages.append(LLMMessage(
+            # 添加工具结果消息（字段来自内部工具处理器，跳过 pydantic 校验直接构造）
+            current_messages.extend(
+                LLMMessage.model_construct(
                     role="tool",
                     content=result.get("content", "{}"),
                     tool_call_id=result.get("tool_call_id"),
                     name=result.get("name")
-                ))
+                )
+                for result in tool_results
+            )
         
         # 达到最大迭代数
         logger.warning(f"Max tool iterations ({max_tool_iterations}) reached")
@@ -164,6 +257,162 @@ class ToolCallingMixin:
             "iterations": iteration
         }
     
+    def _tool_semaphore(self) -> asyncio.Semaphore:
+        """工具并发信号量：混入 SubagentRuntime 时沿用其运行预算中的工具并行度"""
+        budget_value = getattr(self, "_budget_value", None)
+        return asyncio.Semaphore(budget_value("max_tool_parallelism", 4) if budget_value else 4)
+    
+    async def _run_tool_call(
+        self,
+        tool_call: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+        cache: Optional[Dict[Tuple[str, str], "asyncio.Future[Dict[str, Any]]"]] = None
+    ) -> Dict[str, Any]:
+        """执行单个工具调用，异常转换为结构化失败结果，不影响同轮其它调用
+        
+        传入 cache 时，同名同参数的调用共享同一次执行（改写 tool_call_id）：
+        执行中的调用登记为 future，并发的重复调用等待其结果；
+        只有成功（content 中 success 为 true）的结果留在缓存里，失败结果不复用。
+        """
+        key = _tool_call_key(tool_call) if cache is not None else None
+        while key is not None:
+            pending = cache.get(key)
+            if pending is None:
+                break
+            try:
+                result = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                continue  # 执行方被取消（提前启动的调用被作废），由本调用重新执行
+            return {**result, "tool_call_id": tool_call.get("id")}
+        
+        future = None
+        if key is not None:
+            future = asyncio.get_running_loop().create_future()
+            cache[key] = future
+        try:
+            async with semaphore:
+                results = await self._tool_handler.handle_tool_calls([tool_call])
+            result = results[0]
+        except asyncio.CancelledError:
+            if future is not None:
+                # 被取消时作废登记，等待中的重复调用会自行重新执行
+                future.cancel()
+                if cache.get(key) is future:
+                    del cache[key]
+            raise
+        except Exception as e:
+            func_name = tool_call.get("function", {}).get("name")
+            logger.warning(f"Tool call {func_name} failed: {e}")
+            result = {
+                "tool_call_id": tool_call.get("id"),
+                "name": func_name,
+                "content": _json_dumps({"success": False, "error": str(e)}),
+            }
+        if future is not None:
+            future.set_result(result)
+            if not _is_success_result(result) and cache.get(key) is future:
+                del cache[key]
+        return result
+    
+    async def _handle_tool_calls_parallel(
+        self,
+        tool_calls: List[Dict[str, Any]],
+        semaphore: Optional[asyncio.Semaphore] = None,
+        cache: Optional[Dict[Tuple[str, str], "asyncio.Future[Dict[str, Any]]"]] = None
+    ) -> List[Dict[str, Any]]:
+        """并发执行同一轮的工具调用，结果顺序与 tool_calls 一致"""
+        if semaphore is None:
+            semaphore = self._tool_semaphore()
+        return list(await asyncio.gather(
+            *(self._run_tool_call(tc, semaphore, cache) for tc in tool_calls)
+        ))
+    
+    async def _stream_tool_round(
+        self,
+        events: AsyncGenerator[Dict[str, Any], None],
+        semaphore: asyncio.Semaphore,
+        cache: Optional[Dict[Tuple[str, str], "asyncio.Future[Dict[str, Any]]"]] = None
+    ) -> Tuple[str, Optional[List[Dict[str, Any]]], Optional[List[Dict[str, Any]]]]:
+        """消费一轮流式 tool calling，边生成边执行工具
+        
+        tool_calls 按 index 依次流出：出现更大的 index 时，之前的调用参数已经完整，
+        参数能解析为 JSON 即提前启动执行，让工具耗时与剩余生成时间重叠。
+        最终参数与提前启动时不一致（或流异常中断）的调用会被取消并按最终结果重跑；
+        取消前工具可能已经执行完或产生了副作用（请求已发出等），因此只适合幂等的检索类工具。
+        
+        Returns:
+            (content, tool_calls, tool_results)；没有工具调用时后两项为 None
+        """
+        partial: Dict[int, Dict[str, Any]] = {}
+        started: Dict[str, Tuple[str, asyncio.Task]] = {}  # tool_call_id -> (arguments, task)
+        
+        def launch_ready(before_index: int) -> None:
+            for idx, item in partial.items():
+                if idx >= before_index or item.get("launched"):
+                    continue
+                item["launched"] = True
+                tool_call = {
+                    "id": item["id"] or f"tool_call_{idx}",
+                    "type": "function",
+                    "function": {"name": item["name"], "arguments": item["arguments"] or "{}"},
+                }
+                try:
+                    _json_loads(tool_call["function"]["arguments"])
+                except ValueError:
+                    continue  # 参数不完整/非法，留到流结束后按最终结果执行
+                started[tool_call["id"]] = (
+                    tool_call["function"]["arguments"],
+                    asyncio.create_task(self._run_tool_call(tool_call, semaphore, cache)),
+                )
+        
+        done: Optional[Dict[str, Any]] = None
+        try:
+            try:
+                async for event in events:
+                    event_type = event["type"]
+                    if event_type == "tool_call_delta":
+                        idx = event["index"]
+                        launch_ready(idx)
+                        item = partial.setdefault(idx, {"id": "", "name": "", "arguments": ""})
+                        if event.get("id"):
+                            item["id"] = event["id"]
+                        if event.get("name"):
+                            item["name"] = event["name"]
+                        item["arguments"] += event.get("arguments_delta") or ""
+                    elif event_type == "done":
+                        done = event
+            finally:
+                await events.aclose()
+            
+            content = (done or {}).get("content", "")
+            tool_calls = (done or {}).get("tool_calls")
+            if not tool_calls:
+                return content, None, None
+            
+            # 复用参数一致的提前执行结果，其余调用此时再启动
+            tasks = []
+            for tc in tool_calls:
+                early = started.pop(tc.get("id"), None)
+                if early is not None and early[0] == tc["function"]["arguments"]:
+                    tasks.append(early[1])
+                else:
+                    if early is not None:
+                        early[1].cancel()
+                        logger.warning(
+                            f"Tool call {tc.get('function', {}).get('name')} arguments changed after early start, "
+                            f"cancelled and re-run (the early execution may already have taken effect)"
+                        )
+                    tasks.append(asyncio.create_task(self._run_tool_call(tc, semaphore, cache)))
+            return content, tool_calls, list(await asyncio.gather(*tasks))
+        finally:
+            # 流异常中断或被取消时，不留下孤立的工具任务（已发出的工具请求无法撤回）
+            for _, task in started.values():
+                if not task.done():
+                    task.cancel()
+                    logger.warning("Early-started tool call cancelled before completion (it may already have taken effect)")
+    
     def _format_tool_results_for_prompt(self, tool_results: List[Dict[str, Any]]) -> str:
         """
         将工具结果格式化为 Prompt 文本
@@ -173,7 +422,7 @@ class ToolCallingMixin:
         if not tool_results:
             return ""
         
-        parts = ["\n## 🔧 工具执行结果\n"]
+        parts = [_TOOL_RESULTS_HEADER]
         
         for item in tool_results:
             call = item.get("call", {})
@@ -183,41 +432,45 @@ class ToolCallingMixin:
             content = result.get("content", "{}")
             
             try:
-                data = json.loads(content) if isinstance(content, str) else content
+                data = _json_loads(content) if isinstance(content, str) else content
             except json.JSONDecodeError:
                 data = {"raw": content}
             
             parts.append(f"### {func_name}")
             
             if data.get("success"):
-                parts.append("**状态**: ✅ 成功")
+                parts.append(_RESULT_SUCCESS_LINE)
                 
                 if "results" in data:
                     parts.append(f"**结果数量**: {len(data['results'])}\n")
-                    for i, res in enumerate(data["results"][:5], 1):
-                        title = res.get("title", "无标题")
-                        url = res.get("url", "")
-                        snippet = res.get("snippet", "")[:200]
-                        parts.append(f"**{i}. {title}**")
-                        if url:
-                            parts.append(f"   链接: {url}")
-                        if snippet:
-                            parts.append(f"   摘要: {snippet}")
-                        parts.append("")
+                    parts.extend(
+                        _format_result_item(i, res) for i, res in enumerate(data["results"][:5], 1)
+                    )
                 elif "count" in data:
                     parts.append(f"**记录数**: {data['count']}")
                 else:
                     # 输出 JSON
-                    parts.append(f"```json\n{json.dumps(data, ensure_ascii=False, indent=2)}\n```")
+                    parts.append(f"```json\n{_json_dumps_indent(data)}\n```")
             else:
-                parts.append(f"**状态**: ❌ 失败")
-                parts.append(f"**错误**: {data.get('error', 'Unknown error')}")
+                parts.append(_RESULT_FAILURE_TMPL.format(error=data.get("error", "Unknown error")))
             
             parts.append("")
         
         return "\n".join(parts)
 
 
+_TOOL_CALLING_CLASSES: Dict[type, type] = {}
+
+
+def _tool_calling_class(cls: type) -> type:
+    """获取（按需创建）混入了 ToolCallingMixin 的子类"""
+    mixed = _TOOL_CALLING_CLASSES.get(cls)
+    if mixed is None:
+        mixed = type(f"ToolCalling{cls.__name__}", (ToolCallingMixin, cls), {})
+        _TOOL_CALLING_CLASSES[cls] = mixed
+    return mixed
+
+
 def enable_tool_calling(subagent_instance):
     """
     为 Subagent 实例启用 Tool Calling 能力
@@ -233,26 +486,11 @@ def enable_tool_calling(subagent_instance):
     result = await subagent._execute_with_tools(messages)
     ```
     """
-    # 动态添加方法
-    import types
-    
-    mixin = ToolCallingMixin()
-    
-    subagent_instance._init_tool_calling = types.MethodType(
-        mixin._init_tool_calling.__func__, subagent_instance
-    )
-    subagent_instance._get_tools_for_skill = types.MethodType(
-        mixin._get_tools_for_skill.__func__, subagent_instance
-    )
-    subagent_instance._get_assigned_skill_tools = types.MethodType(
-        mixin._get_assigned_skill_tools.__func__, subagent_instance
-    )
-    subagent_instance._execute_with_tools = types.MethodType(
-        mixin._execute_with_tools.__func__, subagent_instance
-    )
-    subagent_instance._format_tool_results_for_prompt = types.MethodType(
-        mixin._format_tool_results_for_prompt.__func__, subagent_instance
-    )
+    # 在类层面混入：每个原始类只生成一次 ToolCalling 子类，方法走类型方法缓存，
+    # 不再为每个实例分配 MethodType 绑定
+    cls = type(subagent_instance)
+    if not issubclass(cls, ToolCallingMixin):
+        subagent_instance.__class__ = _tool_calling_class(cls)
     
     # 初始化
     subagent_instance._init_tool_calling()
@@ -5,11 +5,48 @@ LLM Provider - 统一的 LLM 接口抽象
 """
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import AsyncGenerator, Optional, List, Dict, Any
 from pydantic import BaseModel
+import importlib.util
+import json
+import logging
 import os
+import threading
 import time
 
+from utils.jsonfast import json_dumps as _json_dumps
+
+logger = logging.getLogger(__name__)
+
+
+def _build_http_client():
+    """构建 OpenAI Provider 使用的 HTTP 客户端
+    
+    所有 Subagent 复用同一 Provider 实例，因此也复用这里的连接池：
+    延长 keep-alive，让迭代间隙中的连接保持温热，避免重复 TLS 握手；
+    安装了 h2 时启用 HTTP/2，并发请求在同一连接上多路复用。
+    """
+    import httpx
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=httpx.Timeout(120.0, connect=10.0),  # 总超时 120s，连接超时 10s
+        http2=importlib.util.find_spec("h2") is not None,
+        follow_redirects=True,
+    )
+
+
+# Anthropic 提示缓存断点（5 分钟 TTL）
+_EPHEMERAL_CACHE_CONTROL: Dict[str, str] = {"type": "ephemeral"}
+
+# Claude 工具格式转换缓存的最大条目数（约等于同时活跃的 tool 定义列表数）
+_TOOL_CACHE_MAX_ENTRIES = 64
+
 
 class LLMMessage(BaseModel):
     """LLM 消息"""
@@ -18,6 +55,7 @@ class LLMMessage(BaseModel):
     name: Optional[str] = None
     tool_calls: Optional[List[Dict[str, Any]]] = None
     tool_call_id: Optional[str] = None
+    cache_control: Optional[Dict[str, Any]] = None  # 前缀缓存标记（仅 Claude 使用）
 
     def to_api_dict(self) -> Dict[str, Any]:
         """序列化为 API 请求格式，处理空 content 兼容性问题。
@@ -26,11 +64,19 @@ class LLMMessage(BaseModel):
         当 assistant 消息有 tool_calls 但 content 为空时，
         需要填充一个占位文本以通过 API 校验。
         """
-        d = self.model_dump(exclude_none=True)
+        # 每次请求对每条消息都会调用，直接构造 dict，避免 model_dump 的 schema 遍历开销
+        content = self.content
         # assistant 消息有 tool_calls 时，确保 content 非空
         # Venus API 要求 content 字段必须存在且非空（不同于 OpenAI 原生 API 接受 null）
-        if self.role == "assistant" and self.tool_calls and not self.content:
-            d["content"] = "Calling tools..."
+        if not content and self.role == "assistant" and self.tool_calls:
+            content = "Calling tools..."
+        d: Dict[str, Any] = {"role": self.role, "content": content}
+        if self.name is not None:
+            d["name"] = self.name
+        if self.tool_calls is not None:
+            d["tool_calls"] = self.tool_calls
+        if self.tool_call_id is not None:
+            d["tool_call_id"] = self.tool_call_id
         return d
 
 
@@ -41,11 +87,18 @@ class LLMConfig(BaseModel):
     max_tokens: int = 16384  # 增大到 16K，支持复杂输出
     top_p: Optional[float] = None  # 默认不设置，避免与 temperature 冲突
     stream: bool = True
+    enable_prompt_cache: bool = True  # 为静态 system / tools 前缀打缓存断点（仅 Claude 使用）
 
 
 class LLMProvider(ABC):
     """LLM 提供者抽象基类"""
     
+    async def close(self) -> None:
+        """关闭底层 HTTP 客户端，释放连接池"""
+        client = getattr(self, "client", None)
+        if client is not None:
+            await client.close()
+    
     @abstractmethod
     async def chat(
         self,
@@ -75,17 +128,40 @@ class LLMProvider(ABC):
         """流式检测 tool_calls（默认回退到非流式实现）"""
         return await self.chat_complete(messages, config, tools=tools)
 
+    async def chat_stream_with_tools(
+        self,
+        messages: List[LLMMessage],
+        config: LLMConfig,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式 tool calling：生成过程中推送文本增量，结束时给出完整结果
+
+        依次产出 {"type": "content", "delta": str}、
+        {"type": "tool_call_delta", "index": int, "id": ..., "name": ..., "arguments_delta": str}（可选），
+        最后产出 {"type": "done", "content": str, "tool_calls": ..., "finish_reason": ...}。
+        默认回退到 chat_detect_tools_stream，文本一次性推送，不产出 tool_call_delta。
+        """
+        response = await self.chat_detect_tools_stream(messages, config, tools=tools)
+        content = response.get("content") or ""
+        if content:
+            yield {"type": "content", "delta": content}
+        yield {
+            "type": "done",
+            "content": content,
+            "tool_calls": response.get("tool_calls"),
+            "finish_reason": response.get("finish_reason"),
+        }
+
 
 class OpenAIProvider(LLMProvider):
     """OpenAI Provider"""
     
     def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         from openai import AsyncOpenAI
-        import httpx
         self.client = AsyncOpenAI(
             api_key=api_key or os.getenv("OPENAI_API_KEY"),
             base_url=base_url or os.getenv("OPENAI_BASE_URL"),
-            timeout=httpx.Timeout(120.0, connect=10.0),  # 总超时 120s，连接超时 10s
+            http_client=_build_http_client(),
         )
     
     async def chat(
@@ -113,7 +189,7 @@ class OpenAIProvider(LLMProvider):
         try:
             stream = await self.client.chat.completions.create(**request_params)
         except Exception as e:
-            print(f"[OpenAIProvider] Stream chat error: {type(e).__name__}: {e}")
+            logger.error("[OpenAIProvider] Stream chat error: %s: %s", type(e).__name__, e)
             raise
         
         async for chunk in stream:
@@ -130,9 +206,42 @@ class OpenAIProvider(LLMProvider):
         tools: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """流式检测 tool_calls，降低非流式长尾风险"""
+        result: Dict[str, Any] = {}
+        async for event in self.chat_stream_with_tools(messages, config, tools=tools):
+            if event["type"] == "done":
+                result = event
+        return {
+            "content": result.get("content", ""),
+            "tool_calls": result.get("tool_calls"),
+            "finish_reason": result.get("finish_reason"),
+        }
+
+    async def chat_stream_with_tools(
+        self,
+        messages: List[LLMMessage],
+        config: LLMConfig,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式 tool calling：文本与 tool_call 参数增量实时推送，完整 tool_calls 按 index 累积到流结束"""
+        events = self.chat_stream_with_tools_serialized(
+            [m.to_api_dict() for m in messages], config, tools=tools
+        )
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    async def chat_stream_with_tools_serialized(
+        self,
+        api_messages: List[Dict[str, Any]],
+        config: LLMConfig,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式 tool calling（消息已是 to_api_dict 格式），事件格式同 chat_stream_with_tools"""
         request_params = {
             "model": config.model,
-            "messages": [m.to_api_dict() for m in messages],
+            "messages": api_messages,
             "temperature": config.temperature,
             "max_tokens": config.max_tokens,
             "stream": True,
@@ -146,12 +255,15 @@ class OpenAIProvider(LLMProvider):
         if tools:
             request_params["tools"] = tools
 
-        print(f"[OpenAIProvider] chat_detect_tools_stream request: model={config.model}, temp={config.temperature}")
+        logger.debug(
+            "[OpenAIProvider] chat_stream_with_tools request: model=%s, temp=%s",
+            config.model, config.temperature,
+        )
 
         try:
             stream = await self.client.chat.completions.create(**request_params)
         except Exception as e:
-            print(f"[OpenAIProvider] Stream detect API Error: {type(e).__name__}: {e}")
+            logger.error("[OpenAIProvider] Stream detect API Error: %s: %s", type(e).__name__, e)
             raise
 
         content_parts: List[str] = []
@@ -183,6 +295,7 @@ class OpenAIProvider(LLMProvider):
                 if delta.content:
                     content_parts.append(delta.content)
                     content_chunk_count += 1
+                    yield {"type": "content", "delta": delta.content}
 
                 if delta.tool_calls:
                     for tc in delta.tool_calls:
@@ -208,14 +321,21 @@ class OpenAIProvider(LLMProvider):
                                 entry["function"]["name"] = tc.function.name
                             if tc.function.arguments:
                                 entry["function"]["arguments"] += tc.function.arguments
+                        yield {
+                            "type": "tool_call_delta",
+                            "index": idx,
+                            "id": tc.id,
+                            "name": tc.function.name if tc.function else None,
+                            "arguments_delta": (tc.function.arguments if tc.function else None) or "",
+                        }
         except Exception as e:
-            elapsed = time.monotonic() - detect_started_at
             ttfb = (first_chunk_at - detect_started_at) if first_chunk_at else None
-            print(
-                f"[OpenAIProvider] Stream detect loop error: {type(e).__name__}: {e}, "
-                f"elapsed={elapsed:.2f}s, chunks={stream_chunk_count}, "
-                f"content_chunks={content_chunk_count}, tool_deltas={tool_delta_count}, "
-                f"ttfb={f'{ttfb:.2f}s' if ttfb is not None else 'none'}"
+            logger.error(
+                "[OpenAIProvider] Stream detect loop error: %s: %s, elapsed=%.2fs, chunks=%s, "
+                "content_chunks=%s, tool_deltas=%s, ttfb=%s",
+                type(e).__name__, e, time.monotonic() - detect_started_at, stream_chunk_count,
+                content_chunk_count, tool_delta_count,
+                f"{ttfb:.2f}s" if ttfb is not None else "none",
             )
             raise
 
@@ -231,16 +351,18 @@ class OpenAIProvider(LLMProvider):
                 tool_calls.append(item)
 
         content = "".join(content_parts)
-        elapsed = time.monotonic() - detect_started_at
-        ttfb = (first_chunk_at - detect_started_at) if first_chunk_at else None
-        print(
-            f"[OpenAIProvider] Stream detect done: finish_reason={finish_reason}, content_len={len(content)}, "
-            f"tool_calls={len(tool_calls) if tool_calls else 0}, elapsed={elapsed:.2f}s, "
-            f"chunks={stream_chunk_count}, content_chunks={content_chunk_count}, tool_deltas={tool_delta_count}, "
-            f"ttfb={f'{ttfb:.2f}s' if ttfb is not None else 'none'}"
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            ttfb = (first_chunk_at - detect_started_at) if first_chunk_at else None
+            logger.debug(
+                "[OpenAIProvider] Stream detect done: finish_reason=%s, content_len=%s, tool_calls=%s, "
+                "elapsed=%.2fs, chunks=%s, content_chunks=%s, tool_deltas=%s, ttfb=%s",
+                finish_reason, len(content), len(tool_calls) if tool_calls else 0,
+                time.monotonic() - detect_started_at, stream_chunk_count, content_chunk_count,
+                tool_delta_count, f"{ttfb:.2f}s" if ttfb is not None else "none",
+            )
 
-        return {
+        yield {
+            "type": "done",
             "content": content,
             "tool_calls": tool_calls,
             "finish_reason": finish_reason,
@@ -253,9 +375,23 @@ class OpenAIProvider(LLMProvider):
         tools: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """非流式聊天"""
+        return await self.chat_complete_serialized(
+            [m.to_api_dict() for m in messages], config, tools=tools
+        )
+
+    async def chat_complete_serialized(
+        self,
+        api_messages: List[Dict[str, Any]],
+        config: LLMConfig,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """非流式聊天（消息已是 to_api_dict 格式）
+        
+        供 tool 循环增量维护已序列化的消息列表，避免每轮重新序列化全部历史。
+        """
         request_params = {
             "model": config.model,
-            "messages": [m.to_api_dict() for m in messages],
+            "messages": api_messages,
             "temperature": config.temperature,
             "max_tokens": config.max_tokens,
             "stream": False,
@@ -268,28 +404,33 @@ class OpenAIProvider(LLMProvider):
         if tools:
             request_params["tools"] = tools
         
-        print(f"[OpenAIProvider] chat_complete request: model={config.model}, temp={config.temperature}")
-        
-        # 调试：打印消息概要
-        api_messages = request_params["messages"]
-        for idx, m in enumerate(api_messages):
-            role = m.get("role", "?")
-            has_content = "content" in m
-            content_val = m.get("content")
-            content_info = f"None" if content_val is None else f"len={len(content_val)}" if content_val else "empty"
-            has_tc = "tool_calls" in m
-            print(f"  [{idx}] role={role}, content={content_info}, has_tc={has_tc}")
+        # 调试：打印请求与消息概要（仅 DEBUG 级别，避免每次请求都格式化整段历史）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[OpenAIProvider] chat_complete request: model=%s, temp=%s",
+                config.model, config.temperature,
+            )
+            for idx, m in enumerate(api_messages):
+                content_val = m.get("content")
+                content_info = "None" if content_val is None else f"len={len(content_val)}" if content_val else "empty"
+                logger.debug(
+                    "  [%s] role=%s, content=%s, has_tc=%s",
+                    idx, m.get("role", "?"), content_info, "tool_calls" in m,
+                )
         
         try:
             response = await self.client.chat.completions.create(**request_params)
-            print(f"[OpenAIProvider] Got response, choices count: {len(response.choices) if response.choices else 0}")
         except Exception as e:
-            print(f"[OpenAIProvider] API Error: {type(e).__name__}: {e}")
+            logger.error("[OpenAIProvider] API Error: %s: %s", type(e).__name__, e)
             raise
+        logger.debug(
+            "[OpenAIProvider] Got response, choices count: %s",
+            len(response.choices) if response.choices else 0,
+        )
         
         # 检查 choices 是否有效
         if not response.choices or len(response.choices) == 0:
-            print(f"[OpenAIProvider] Warning: No choices in response!")
+            logger.warning("[OpenAIProvider] No choices in response")
             return {
                 "content": "",
                 "tool_calls": None,
@@ -298,7 +439,7 @@ class OpenAIProvider(LLMProvider):
         
         message = response.choices[0].message
         content = message.content or ""
-        print(f"[OpenAIProvider] Response content length: {len(content)}")
+        logger.debug("[OpenAIProvider] Response content length: %s", len(content))
         
         result = {
             "content": content,
@@ -330,20 +471,23 @@ class ClaudeProvider(LLMProvider):
         self.client = AsyncAnthropic(
             api_key=api_key or os.getenv("ANTHROPIC_API_KEY")
         )
+        # id(openai_tools) -> (openai_tools, claude_tools, len)；保留原列表引用，防止 id 被复用
+        self._tool_cache: "OrderedDict[int, tuple]" = OrderedDict()
     
     def _build_claude_messages(self, messages: List[LLMMessage]):
         """将 LLMMessage 列表转换为 Claude API 格式
         
         处理：
-        - system 消息提取为独立字段
+        - system 消息提取为独立字段（多条时合并为 text blocks，保留 cache_control）
         - assistant(tool_calls) → assistant content blocks (tool_use)
         - tool 消息 → user content blocks (tool_result)
         - 合并连续的 tool_result 消息到同一个 user message
+        - 非 system 消息上的 cache_control 挂到对应的 content block 上
         
         Returns:
             (system_content, chat_messages) 元组
         """
-        system_content = ""
+        system_blocks = []
         chat_messages = []
         
         i = 0
@@ -351,7 +495,10 @@ class ClaudeProvider(LLMProvider):
             msg = messages[i]
             
             if msg.role == "system":
-                system_content = msg.content
+                block = {"type": "text", "text": msg.content}
+                if msg.cache_control:
+                    block["cache_control"] = msg.cache_control
+                system_blocks.append(block)
                 i += 1
                 continue
             
@@ -361,12 +508,11 @@ class ClaudeProvider(LLMProvider):
                 if msg.content:
                     content_blocks.append({"type": "text", "text": msg.content})
                 for tc in msg.tool_calls:
-                    import json as _json
                     tool_input = tc["function"]["arguments"]
                     if isinstance(tool_input, str):
                         try:
-                            tool_input = _json.loads(tool_input)
-                        except _json.JSONDecodeError:
+                            tool_input = json.loads(tool_input)
+                        except json.JSONDecodeError:
                             tool_input = {"raw": tool_input}
                     content_blocks.append({
                         "type": "tool_use",
@@ -383,31 +529,48 @@ class ClaudeProvider(LLMProvider):
                 # 合并连续的 tool 消息
                 tool_results = []
                 while i < len(messages) and messages[i].role == "tool":
-                    tool_results.append({
+                    block = {
                         "type": "tool_result",
                         "tool_use_id": messages[i].tool_call_id,
                         "content": messages[i].content,
-                    })
+                    }
+                    if messages[i].cache_control:
+                        block["cache_control"] = messages[i].cache_control
+                    tool_results.append(block)
                     i += 1
                 chat_messages.append({"role": "user", "content": tool_results})
                 continue
             
-            # 普通 user/assistant 消息
+            # 普通 user/assistant 消息（带缓存标记时转为 text block）
+            if msg.cache_control:
+                content = [{"type": "text", "text": msg.content, "cache_control": msg.cache_control}]
+            else:
+                content = msg.content
             chat_messages.append({
                 "role": msg.role,
-                "content": msg.content
+                "content": content
             })
             i += 1
         
+        # 单条无缓存标记的 system 保持字符串形式
+        if len(system_blocks) == 1 and "cache_control" not in system_blocks[0]:
+            system_content = system_blocks[0]["text"]
+        else:
+            system_content = system_blocks
         return system_content, chat_messages
     
-    async def chat(
+    def _build_request_params(
         self,
         messages: List[LLMMessage],
         config: LLMConfig,
         tools: Optional[List[Dict[str, Any]]] = None
-    ) -> AsyncGenerator[str, None]:
-        """流式聊天"""
+    ) -> Dict[str, Any]:
+        """构建 messages API 请求参数
+        
+        开启 enable_prompt_cache 时，为静态前缀（system、tools 定义）打上缓存断点：
+        - system 无显式 cache_control 时，在最后一个 system block 上标记
+        - tools 在最后一个定义上标记，缓存整个工具 schema
+        """
         system_content, chat_messages = self._build_claude_messages(messages)
         
         request_params = {
@@ -417,12 +580,33 @@ class ClaudeProvider(LLMProvider):
         }
         
         if system_content:
+            if config.enable_prompt_cache:
+                if isinstance(system_content, str):
+                    system_content = [{"type": "text", "text": system_content}]
+                if not any("cache_control" in block for block in system_content):
+                    system_content[-1]["cache_control"] = _EPHEMERAL_CACHE_CONTROL
             request_params["system"] = system_content
         
         if tools:
-            claude_tools = self._convert_tools(tools)
+            claude_tools = self._convert_tools_cached(tools)
+            if config.enable_prompt_cache and claude_tools:
+                # 缓存中的定义是共享的，断点打在副本上
+                claude_tools = claude_tools[:-1] + [
+                    {**claude_tools[-1], "cache_control": _EPHEMERAL_CACHE_CONTROL}
+                ]
             request_params["tools"] = claude_tools
         
+        return request_params
+    
+    async def chat(
+        self,
+        messages: List[LLMMessage],
+        config: LLMConfig,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncGenerator[str, None]:
+        """流式聊天"""
+        request_params = self._build_request_params(messages, config, tools)
+        
         async with self.client.messages.stream(**request_params) as stream:
             async for text in stream.text_stream:
                 yield text
@@ -434,20 +618,7 @@ class ClaudeProvider(LLMProvider):
         tools: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """非流式聊天"""
-        system_content, chat_messages = self._build_claude_messages(messages)
-        
-        request_params = {
-            "model": config.model,
-            "max_tokens": config.max_tokens,
-            "messages": chat_messages,
-        }
-        
-        if system_content:
-            request_params["system"] = system_content
-        
-        if tools:
-            claude_tools = self._convert_tools(tools)
-            request_params["tools"] = claude_tools
+        request_params = self._build_request_params(messages, config, tools)
         
         response = await self.client.messages.create(**request_params)
         
@@ -468,12 +639,31 @@ class ClaudeProvider(LLMProvider):
                     "type": "function",
                     "function": {
                         "name": block.name,
-                        "arguments": str(block.input)
+                        # 与 OpenAI 一致输出 JSON 字符串，str(dict) 的 Python repr 无法被下游 json 解析
+                        "arguments": _json_dumps(block.input)
                     }
                 })
         
         return result
     
+    def _convert_tools_cached(self, openai_tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """带缓存的工具格式转换
+        
+        tool 定义列表在 Subagent 生命周期内保持不变，tool 循环每轮传入的是同一列表对象，
+        按列表身份缓存转换结果（长度变化视为失效），返回值不可原地修改。
+        """
+        key = id(openai_tools)
+        entry = self._tool_cache.get(key)
+        if entry is not None and entry[0] is openai_tools and entry[2] == len(openai_tools):
+            self._tool_cache.move_to_end(key)
+            return entry[1]
+        
+        claude_tools = self._convert_tools(openai_tools)
+        self._tool_cache[key] = (openai_tools, claude_tools, len(openai_tools))
+        if len(self._tool_cache) > _TOOL_CACHE_MAX_ENTRIES:
+            self._tool_cache.popitem(last=False)
+        return claude_tools
+    
     def _convert_tools(self, openai_tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """将 OpenAI 格式的 tools 转换为 Claude 格式"""
         claude_tools = []
@@ -492,19 +682,40 @@ class LLMProviderFactory:
     """LLM Provider 工厂"""
     
     _providers: Dict[str, LLMProvider] = {}
+    # 保护首次创建：多线程（to_thread / 线程池）同时首次获取时只创建一个实例与连接池
+    _lock = threading.Lock()
     
     @classmethod
     def get_provider(cls, provider_type: str = "openai") -> LLMProvider:
-        """获取 LLM Provider"""
-        if provider_type not in cls._providers:
-            if provider_type == "openai":
-                cls._providers[provider_type] = OpenAIProvider()
-            elif provider_type == "claude":
-                cls._providers[provider_type] = ClaudeProvider()
-            else:
-                raise ValueError(f"Unknown provider type: {provider_type}")
+        """获取 LLM Provider（进程内单例）"""
+        provider = cls._providers.get(provider_type)
+        if provider is not None:
+            return provider
+        
+        with cls._lock:
+            provider = cls._providers.get(provider_type)
+            if provider is None:
+                if provider_type == "openai":
+                    provider = OpenAIProvider()
+                elif provider_type == "claude":
+                    provider = ClaudeProvider()
+                else:
+                    raise ValueError(f"Unknown provider type: {provider_type}")
+                cls._providers[provider_type] = provider
         
-        return cls._providers[provider_type]
+        return provider
+    
+    @classmethod
+    async def close_all(cls) -> None:
+        """关闭所有已缓存的 Provider（应用退出时调用）"""
+        with cls._lock:
+            providers = list(cls._providers.values())
+            cls._providers.clear()
+        for provider in providers:
+            try:
+                await provider.close()
+            except Exception as e:
+                logger.warning("[LLMProviderFactory] Close provider error: %s: %s", type(e).__name__, e)
     
     @classmethod
     def get_default_config(cls, provider_type: str = "openai") -> LLMConfig:
@@ -13,6 +13,7 @@ import uvicorn
 from api import router
 from auth.routes import router as auth_router
 from skills import init_skills, get_global_registry
+from llm.provider import LLMProviderFactory
 
 # 加载环境变量
 load_dotenv()
@@ -67,6 +68,12 @@ app.include_router(auth_router)
 app.include_router(router, prefix="/api")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """应用退出时关闭 LLM Provider 的连接池"""
+    await LLMProviderFactory.close_all()
+
+
 @app.get("/")
 async def root():
     """根路由"""
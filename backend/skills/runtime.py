@@ -18,6 +18,7 @@ class SkillsRuntimeConfig:
     tool_detect_timeout_sec: int = 60
     skill_exec_timeout_sec: int = 45
     max_total_tool_time_sec: int = 180
+    max_tool_parallelism: int = 4
     snapshot_ttl_sec: int = 300
     strict_gating: bool = False
 
@@ -44,6 +45,7 @@ class SkillsRuntimeConfig:
             tool_detect_timeout_sec=max(10, _int("SKILLS_TOOL_DETECT_TIMEOUT_SEC", 60)),
             skill_exec_timeout_sec=max(5, _int("SKILLS_SKILL_EXEC_TIMEOUT_SEC", 45)),
             max_total_tool_time_sec=max(15, _int("SKILLS_MAX_TOTAL_TOOL_TIME_SEC", 180)),
+            max_tool_parallelism=max(1, _int("SKILLS_MAX_TOOL_PARALLELISM", 4)),
             snapshot_ttl_sec=max(10, _int("SKILLS_SNAPSHOT_TTL_SEC", 300)),
             strict_gating=_bool("SKILLS_STRICT_GATING", False),
         )
@@ -7,13 +7,29 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple
 import json
 
+from utils.jsonfast import json_loads as _json_loads
+
+
+def _load_json_list(value: Optional[str]) -> List[Any]:
+    """解析 JSON 数组列；空值与 "[]" 直接返回新列表，不进入解析器"""
+    if not value or value == "[]":
+        return []
+    return _json_loads(value)
+
+
+def _load_json_dict(value: Optional[str]) -> Dict[str, Any]:
+    """解析 JSON 对象列；空值与 "{}" 直接返回新字典，不进入解析器"""
+    if not value or value == "{}":
+        return {}
+    return _json_loads(value)
+
 
 # ========== 数据记录类型 ==========
 
-@dataclass
+@dataclass(slots=True)
 class UserRecord:
     """用户记录 - 数据库存储格式"""
     user_id: str
@@ -31,11 +47,11 @@ class UserRecord:
             "display_name": self.display_name,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "metadata": json.loads(self.metadata_json) if self.metadata_json else {},
+            "metadata": _load_json_dict(self.metadata_json),
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class SessionRecord:
     """会话记录 - 数据库存储格式"""
     session_id: str
@@ -77,13 +93,13 @@ class SessionRecord:
             "model": self.model,
             "mode": self.mode,
             "user_id": self.user_id,
-            "plan": json.loads(self.plan_json) if self.plan_json else None,
+            "plan": _json_loads(self.plan_json) if self.plan_json else None,
             "final_report": self.final_report,
             "error": self.error,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "last_active_at": self.last_active_at.isoformat() if self.last_active_at else None,
-            "metadata": json.loads(self.metadata_json) if self.metadata_json else {},
+            "metadata": _load_json_dict(self.metadata_json),
         }
     
     @classmethod
@@ -107,7 +123,7 @@ class SessionRecord:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentRecord:
     """Agent 记录"""
     agent_id: str
@@ -143,7 +159,7 @@ class AgentRecord:
             "name": self.name,
             "role_name": self.role_name,
             "role_description": self.role_description,
-            "capabilities": json.loads(self.capabilities) if self.capabilities else [],
+            "capabilities": _load_json_list(self.capabilities),
             "task_segment": self.task_segment,
             "status": self.status,
             "progress": self.progress,
@@ -153,17 +169,17 @@ class AgentRecord:
             "partial_result": self.partial_result,
             "final_result": self.final_result,
             "work_objective": self.work_objective,
-            "deliverables": json.loads(self.deliverables) if self.deliverables else [],
+            "deliverables": _load_json_list(self.deliverables),
             "methodology": self.methodology,
-            "assigned_skills": json.loads(self.assigned_skills) if self.assigned_skills else [],
+            "assigned_skills": _load_json_list(self.assigned_skills),
             "expertise_level": self.expertise_level,
-            "focus_areas": json.loads(self.focus_areas) if self.focus_areas else [],
+            "focus_areas": _load_json_list(self.focus_areas),
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class MessageRecord:
     """消息记录"""
     message_id: str
@@ -180,11 +196,11 @@ class MessageRecord:
             "role": self.role,
             "content": self.content,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
-            "metadata": json.loads(self.metadata_json) if self.metadata_json else {},
+            "metadata": _load_json_dict(self.metadata_json),
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class RelayStationRecord:
     """中继站记录"""
     station_id: str
@@ -203,7 +219,7 @@ class RelayStationRecord:
             "session_id": self.session_id,
             "name": self.name,
             "phase": self.phase,
-            "participating_agents": json.loads(self.participating_agents) if self.participating_agents else [],
+            "participating_agents": _load_json_list(self.participating_agents),
             "is_active": self.is_active,
             "summary": self.summary,
             "created_at": self.created_at.isoformat() if self.created_at else None,
@@ -211,7 +227,7 @@ class RelayStationRecord:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class RelayMessageRecord:
     """中继消息记录"""
     message_id: str
@@ -237,18 +253,18 @@ class RelayMessageRecord:
             "relay_type": self.relay_type,
             "source_agent_id": self.source_agent_id,
             "source_agent_name": self.source_agent_name,
-            "target_agent_ids": json.loads(self.target_agent_ids) if self.target_agent_ids else [],
+            "target_agent_ids": _load_json_list(self.target_agent_ids),
             "content": self.content,
             "importance": self.importance,
-            "viewed_by": json.loads(self.viewed_by) if self.viewed_by else [],
-            "acknowledged_by": json.loads(self.acknowledged_by) if self.acknowledged_by else [],
-            "viewed_timestamps": json.loads(self.viewed_timestamps) if self.viewed_timestamps else {},
+            "viewed_by": _load_json_list(self.viewed_by),
+            "acknowledged_by": _load_json_list(self.acknowledged_by),
+            "viewed_timestamps": _load_json_dict(self.viewed_timestamps),
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
-            "metadata": json.loads(self.metadata_json) if self.metadata_json else {},
+            "metadata": _load_json_dict(self.metadata_json),
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class InterventionRecord:
     """人工干预记录"""
     intervention_id: str
@@ -269,8 +285,8 @@ class InterventionRecord:
             "intervention_type": self.intervention_type,
             "scope": self.scope,
             "target_agent_id": self.target_agent_id,
-            "target_agent_ids": json.loads(self.target_agent_ids) if self.target_agent_ids else [],
-            "payload": json.loads(self.payload_json) if self.payload_json else None,
+            "target_agent_ids": _load_json_list(self.target_agent_ids),
+            "payload": _json_loads(self.payload_json) if self.payload_json else None,
             "reason": self.reason,
             "priority": self.priority,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
@@ -287,6 +303,13 @@ class BaseSessionRepository(ABC):
         """创建会话"""
         pass
     
+    async def bulk_create_sessions(self, records: List[SessionRecord]) -> List[SessionRecord]:
+        """批量创建会话
+        
+        默认逐条调用 create_session，支持批量写入的后端应覆盖为单次提交。
+        """
+        return [await self.create_session(record) for record in records]
+    
     @abstractmethod
     async def get_session(self, session_id: str) -> Optional[SessionRecord]:
         """获取会话"""
@@ -339,6 +362,27 @@ class BaseAgentRepository(ABC):
         """创建 Agent 记录"""
         pass
     
+    async def bulk_create_agents(self, records: List[AgentRecord]) -> List[AgentRecord]:
+        """批量创建 Agent 记录
+        
+        默认逐条调用 create_agent，支持批量写入的后端应覆盖为单次提交。
+        """
+        return [await self.create_agent(record) for record in records]
+    
+    async def upsert_agents(self, items: List[Tuple[AgentRecord, Iterable[str]]]) -> int:
+        """按 (session_id, agent_id) 批量插入或更新 Agent
+        
+        items 为 (完整记录, 字段名集合)：不存在时插入完整记录，已存在时只更新集合中的字段。
+        默认先查后写，支持原生 upsert 的后端应覆盖为单条语句。
+        """
+        for record, fields in items:
+            if await self.get_agent(record.agent_id, record.session_id):
+                updates = {f: getattr(record, f) for f in fields if f not in ("agent_id", "session_id")}
+                await self.update_agent(record.agent_id, record.session_id, updates)
+            else:
+                await self.create_agent(record)
+        return len(items)
+    
     @abstractmethod
     async def get_agent(self, agent_id: str, session_id: str) -> Optional[AgentRecord]:
         """获取 Agent"""
@@ -368,6 +412,13 @@ class BaseMessageRepository(ABC):
         """创建消息"""
         pass
     
+    async def bulk_create_messages(self, records: List[MessageRecord]) -> List[MessageRecord]:
+        """批量创建消息
+        
+        默认逐条调用 create_message，支持批量写入的后端应覆盖为单次提交。
+        """
+        return [await self.create_message(record) for record in records]
+    
     @abstractmethod
     async def get_messages_by_session(
         self,
@@ -378,6 +429,11 @@ class BaseMessageRepository(ABC):
         """获取会话的消息"""
         pass
     
+    @abstractmethod
+    async def append_message_content(self, session_id: str, message_id: str, delta: str) -> int:
+        """在消息内容末尾追加文本（流式消息），返回受影响的行数"""
+        pass
+    
     @abstractmethod
     async def delete_messages_by_session(self, session_id: str) -> int:
         """删除会话的所有消息"""
@@ -392,6 +448,17 @@ class BaseRelayRepository(ABC):
         """创建中继站"""
         pass
     
+    async def upsert_station(self, record: RelayStationRecord, fields: Iterable[str]) -> None:
+        """按 (session_id, station_id) 插入或更新中继站，已存在时只更新 fields 中的字段
+        
+        默认先查后写，支持原生 upsert 的后端应覆盖为单条语句。
+        """
+        if await self.get_station(record.station_id, record.session_id):
+            updates = {f: getattr(record, f) for f in fields if f not in ("station_id", "session_id")}
+            await self.update_station(record.station_id, record.session_id, updates)
+        else:
+            await self.create_station(record)
+    
     @abstractmethod
     async def get_station(self, station_id: str, session_id: str) -> Optional[RelayStationRecord]:
         """获取中继站"""
@@ -412,6 +479,13 @@ class BaseRelayRepository(ABC):
         """创建中继消息"""
         pass
     
+    async def bulk_create_relay_messages(self, records: List[RelayMessageRecord]) -> List[RelayMessageRecord]:
+        """批量创建中继消息
+        
+        默认逐条调用 create_relay_message，支持批量写入的后端应覆盖为单次提交。
+        """
+        return [await self.create_relay_message(record) for record in records]
+    
     @abstractmethod
     async def get_relay_messages_by_station(
         self,
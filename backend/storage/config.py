@@ -43,9 +43,10 @@ class StorageConfig:
     postgres_database: str = "agent_swarm"
     
     # 连接池配置
-    pool_size: int = 5
+    pool_size: int = 20
     max_overflow: int = 10
     pool_timeout: int = 30
+    pool_recycle: int = 1800  # 秒
     
     # 其他配置
     echo_sql: bool = False  # 是否打印 SQL 语句（调试用）
@@ -83,9 +84,10 @@ class StorageConfig:
             postgres_database=os.getenv("POSTGRES_DATABASE", "agent_swarm"),
             
             # 连接池
-            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
             max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
             pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
             
             # 其他
             echo_sql=os.getenv("DB_ECHO_SQL", "false").lower() == "true",
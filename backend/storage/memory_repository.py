@@ -201,6 +201,13 @@ class MemoryRepository(
         records.sort(key=lambda r: r.timestamp)
         return records[offset:offset + limit]
     
+    async def append_message_content(self, session_id: str, message_id: str, delta: str) -> int:
+        record = self._messages.get(message_id)
+        if record is None or record.session_id != session_id:
+            return 0
+        record.content += delta
+        return 1
+    
     async def delete_messages_by_session(self, session_id: str) -> int:
         keys_to_delete = [k for k, v in self._messages.items() if v.session_id == session_id]
         for key in keys_to_delete:
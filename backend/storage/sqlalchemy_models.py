@@ -223,13 +223,23 @@ class InterventionModel(Base):
     )
 
 
-def create_database_engine(connection_url: str, echo: bool = False, pool_size: int = 5):
+def create_database_engine(
+    connection_url: str,
+    echo: bool = False,
+    pool_size: int = 20,
+    max_overflow: int = 10,
+    pool_timeout: int = 30,
+    pool_recycle: int = 1800,
+):
     """创建数据库引擎
     
     Args:
         connection_url: 数据库连接 URL
         echo: 是否打印 SQL
-        pool_size: 连接池大小
+        pool_size: 连接池常驻连接数
+        max_overflow: 突发时允许额外创建的连接数
+        pool_timeout: 获取连接的等待超时（秒）
+        pool_recycle: 连接最长复用时间（秒），避免被服务端空闲断开
     """
     # SQLite 特殊处理
     if connection_url.startswith("sqlite"):
@@ -245,6 +255,9 @@ def create_database_engine(connection_url: str, echo: bool = False, pool_size: i
             connection_url,
             echo=echo,
             pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
             pool_pre_ping=True,
         )
     
@@ -4,13 +4,17 @@ SQLAlchemy 仓库实现
 支持 SQLite、MySQL、PostgreSQL
 """
 
+import asyncio
 import json
+import os
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from collections import defaultdict
+from typing import List, Optional, Dict, Any, Iterable, Tuple, FrozenSet
 from contextlib import contextmanager
 
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, desc, asc
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 
 from storage.base import (
     BaseSessionRepository,
@@ -64,6 +68,8 @@ class SQLAlchemyRepository(
         self._engine = None
         self._session_factory = None
         self._initialized = False
+        # 流式追加的逐消息顺序锁：(session_id, message_id) -> [锁, 引用计数]
+        self._append_locks: Dict[Tuple[str, str], list] = {}
     
     def initialize(self):
         """初始化数据库连接"""
@@ -72,7 +78,6 @@ class SQLAlchemyRepository(
         
         # 确保 SQLite 数据目录存在
         if self.config.storage_type.value == "sqlite":
-            import os
             db_dir = os.path.dirname(self.config.sqlite_path)
             if db_dir and not os.path.exists(db_dir):
                 os.makedirs(db_dir, exist_ok=True)
@@ -82,6 +87,9 @@ class SQLAlchemyRepository(
             self.config.get_connection_url(),
             echo=self.config.echo_sql,
             pool_size=self.config.pool_size,
+            max_overflow=self.config.max_overflow,
+            pool_timeout=self.config.pool_timeout,
+            pool_recycle=self.config.pool_recycle,
         )
         
         # 创建表
@@ -110,32 +118,84 @@ class SQLAlchemyRepository(
         finally:
             session.close()
     
+    async def _run_blocking(self, fn, *args):
+        """在线程池中执行同步数据库操作
+        
+        SQLite 使用 StaticPool（所有会话共享同一个连接），跨线程并发会打乱事务，
+        因此仍在事件循环线程内直接执行；其他数据库每个线程从连接池取独立连接。
+        """
+        if not self._initialized:
+            self.initialize()
+        if self._engine.dialect.name == "sqlite":
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+    
+    # ========== Upsert ==========
+    
+    def _native_insert(self):
+        """当前方言支持原生 upsert 时返回其 insert 构造函数，否则返回 None"""
+        if not self._initialized:
+            self.initialize()
+        return {
+            "sqlite": sqlite.insert,
+            "postgresql": postgresql.insert,
+            "mysql": mysql.insert,
+        }.get(self._engine.dialect.name)
+    
+    def _execute_upsert(self, session: Session, model_cls, conflict_keys: Tuple[str, ...], rows: List[Tuple[Any, Iterable[str]]]):
+        """执行 upsert：rows 为 (未持久化的模型实例, 冲突时要更新的字段)
+        
+        更新字段集合相同的行合并为一条多行 INSERT。
+        """
+        insert = self._native_insert()
+        columns = [c.name for c in model_cls.__table__.columns if not c.primary_key]
+        updatable = frozenset(columns) - frozenset(conflict_keys) - {"created_at"}
+        has_updated_at = "updated_at" in updatable
+        
+        groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = defaultdict(list)
+        for model, fields in rows:
+            update_columns = frozenset(fields) & updatable
+            if has_updated_at:
+                update_columns |= {"updated_at"}
+                model.updated_at = datetime.now()
+            groups[update_columns].append({c: getattr(model, c) for c in columns})
+        
+        for update_columns, values in groups.items():
+            stmt = insert(model_cls).values(values)
+            if self._engine.dialect.name == "mysql":
+                if update_columns:
+                    stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+                else:
+                    stmt = stmt.prefix_with("IGNORE")
+            elif update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(conflict_keys),
+                    set_={c: stmt.excluded[c] for c in update_columns},
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_keys))
+            session.execute(stmt)
+    
     # ========== Session Repository ==========
     
     async def create_session(self, record: SessionRecord) -> SessionRecord:
         """创建会话"""
         with self.get_db_session() as session:
-            model = SessionModel(
-                session_id=record.session_id,
-                task=record.task,
-                status=record.status,
-                provider=record.provider,
-                model=record.model,
-                mode=record.mode,
-                user_id=record.user_id,
-                plan_json=record.plan_json,
-                final_report=record.final_report,
-                error=record.error,
-                created_at=record.created_at,
-                updated_at=record.updated_at,
-                last_active_at=record.last_active_at,
-                metadata_json=record.metadata_json,
-            )
+            model = self._session_record_to_model(record)
             session.add(model)
             session.flush()
             
             return self._model_to_session_record(model)
     
+    async def bulk_create_sessions(self, records: List[SessionRecord]) -> List[SessionRecord]:
+        """批量创建会话（单个事务、一次 flush）"""
+        with self.get_db_session() as session:
+            models = [self._session_record_to_model(record) for record in records]
+            session.add_all(models)
+            session.flush()
+            
+            return [self._model_to_session_record(m) for m in models]
+    
     async def get_session(self, session_id: str) -> Optional[SessionRecord]:
         """获取会话"""
         with self.get_db_session() as session:
@@ -239,6 +299,25 @@ class SQLAlchemyRepository(
             
             return count
     
+    def _session_record_to_model(self, record: SessionRecord) -> SessionModel:
+        """记录转模型"""
+        return SessionModel(
+            session_id=record.session_id,
+            task=record.task,
+            status=record.status,
+            provider=record.provider,
+            model=record.model,
+            mode=record.mode,
+            user_id=record.user_id,
+            plan_json=record.plan_json,
+            final_report=record.final_report,
+            error=record.error,
+            created_at=record.created_at,
+            updated_at=record.updated_at,
+            last_active_at=record.last_active_at,
+            metadata_json=record.metadata_json,
+        )
+    
     def _model_to_session_record(self, model: SessionModel) -> SessionRecord:
         """模型转记录"""
         return SessionRecord(
@@ -263,35 +342,35 @@ class SQLAlchemyRepository(
     async def create_agent(self, record: AgentRecord) -> AgentRecord:
         """创建 Agent 记录"""
         with self.get_db_session() as session:
-            model = AgentModel(
-                agent_id=record.agent_id,
-                session_id=record.session_id,
-                name=record.name,
-                role_name=record.role_name,
-                role_description=record.role_description,
-                capabilities=record.capabilities,
-                task_segment=record.task_segment,
-                status=record.status,
-                progress=record.progress,
-                current_step=record.current_step,
-                iterations=record.iterations,
-                thinking=record.thinking,
-                partial_result=record.partial_result,
-                final_result=record.final_result,
-                work_objective=record.work_objective,
-                deliverables=record.deliverables,
-                methodology=record.methodology,
-                assigned_skills=record.assigned_skills,
-                expertise_level=record.expertise_level,
-                focus_areas=record.focus_areas,
-                created_at=record.created_at,
-                updated_at=record.updated_at,
-            )
+            model = self._agent_record_to_model(record)
             session.add(model)
             session.flush()
             
             return self._model_to_agent_record(model)
     
+    async def bulk_create_agents(self, records: List[AgentRecord]) -> List[AgentRecord]:
+        """批量创建 Agent 记录（单个事务、一次 flush）"""
+        with self.get_db_session() as session:
+            models = [self._agent_record_to_model(record) for record in records]
+            session.add_all(models)
+            session.flush()
+            
+            return [self._model_to_agent_record(m) for m in models]
+    
+    async def upsert_agents(self, items: List[Tuple[AgentRecord, Iterable[str]]]) -> int:
+        """批量 upsert Agent（INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE）
+        
+        更新字段集合相同的行合并为一条多行语句，不需要先查询是否存在。
+        """
+        if self._native_insert() is None:
+            return await super().upsert_agents(items)
+        
+        with self.get_db_session() as session:
+            self._execute_upsert(session, AgentModel, ("session_id", "agent_id"), [
+                (self._agent_record_to_model(record), fields) for record, fields in items
+            ])
+        return len(items)
+    
     async def get_agent(self, agent_id: str, session_id: str) -> Optional[AgentRecord]:
         """获取 Agent"""
         with self.get_db_session() as session:
@@ -337,6 +416,33 @@ class SQLAlchemyRepository(
             count = session.query(AgentModel).filter_by(session_id=session_id).delete()
             return count
     
+    def _agent_record_to_model(self, record: AgentRecord) -> AgentModel:
+        """记录转模型"""
+        return AgentModel(
+            agent_id=record.agent_id,
+            session_id=record.session_id,
+            name=record.name,
+            role_name=record.role_name,
+            role_description=record.role_description,
+            capabilities=record.capabilities,
+            task_segment=record.task_segment,
+            status=record.status,
+            progress=record.progress,
+            current_step=record.current_step,
+            iterations=record.iterations,
+            thinking=record.thinking,
+            partial_result=record.partial_result,
+            final_result=record.final_result,
+            work_objective=record.work_objective,
+            deliverables=record.deliverables,
+            methodology=record.methodology,
+            assigned_skills=record.assigned_skills,
+            expertise_level=record.expertise_level,
+            focus_areas=record.focus_areas,
+            created_at=record.created_at,
+            updated_at=record.updated_at,
+        )
+    
     def _model_to_agent_record(self, model: AgentModel) -> AgentRecord:
         return AgentRecord(
             agent_id=model.agent_id,
@@ -368,19 +474,21 @@ class SQLAlchemyRepository(
     async def create_message(self, record: MessageRecord) -> MessageRecord:
         """创建消息"""
         with self.get_db_session() as session:
-            model = MessageModel(
-                message_id=record.message_id,
-                session_id=record.session_id,
-                role=record.role,
-                content=record.content,
-                timestamp=record.timestamp,
-                metadata_json=record.metadata_json,
-            )
+            model = self._message_record_to_model(record)
             session.add(model)
             session.flush()
             
             return self._model_to_message_record(model)
     
+    async def bulk_create_messages(self, records: List[MessageRecord]) -> List[MessageRecord]:
+        """批量创建消息（单个事务、一次 flush）"""
+        with self.get_db_session() as session:
+            models = [self._message_record_to_model(record) for record in records]
+            session.add_all(models)
+            session.flush()
+            
+            return [self._model_to_message_record(m) for m in models]
+    
     async def get_messages_by_session(
         self,
         session_id: str,
@@ -395,12 +503,55 @@ class SQLAlchemyRepository(
             
             return [self._model_to_message_record(m) for m in models]
     
+    async def append_message_content(self, session_id: str, message_id: str, delta: str) -> int:
+        """在消息内容末尾追加文本（单条 UPDATE，不读取整行）
+        
+        流式输出时每个 token 片段调用一次，放到线程池执行，不阻塞事件循环。
+        同一条消息的追加按调用顺序串行执行（asyncio.Lock 按 FIFO 唤醒），
+        避免各片段在不同连接上以任意顺序提交而打乱内容。
+        """
+        key = (session_id, message_id)
+        entry = self._append_locks.get(key)
+        if entry is None:
+            entry = self._append_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._run_blocking(
+                    self._append_message_content_sync, session_id, message_id, delta
+                )
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._append_locks[key]
+    
+    def _append_message_content_sync(self, session_id: str, message_id: str, delta: str) -> int:
+        with self.get_db_session() as session:
+            return session.query(MessageModel).filter_by(
+                session_id=session_id,
+                message_id=message_id
+            ).update(
+                {MessageModel.content: MessageModel.content + delta},
+                synchronize_session=False
+            )
+    
     async def delete_messages_by_session(self, session_id: str) -> int:
         """删除会话的所有消息"""
         with self.get_db_session() as session:
             count = session.query(MessageModel).filter_by(session_id=session_id).delete()
             return count
     
+    def _message_record_to_model(self, record: MessageRecord) -> MessageModel:
+        """记录转模型"""
+        return MessageModel(
+            message_id=record.message_id,
+            session_id=record.session_id,
+            role=record.role,
+            content=record.content,
+            timestamp=record.timestamp,
+            metadata_json=record.metadata_json,
+        )
+    
     def _model_to_message_record(self, model: MessageModel) -> MessageRecord:
         return MessageRecord(
             message_id=model.message_id,
@@ -432,6 +583,25 @@ class SQLAlchemyRepository(
             
             return self._model_to_station_record(model)
     
+    async def upsert_station(self, record: RelayStationRecord, fields: Iterable[str]) -> None:
+        """upsert 中继站（单条语句，不需要先查询是否存在）"""
+        if self._native_insert() is None:
+            return await super().upsert_station(record, fields)
+        
+        model = RelayStationModel(
+            station_id=record.station_id,
+            session_id=record.session_id,
+            name=record.name,
+            phase=record.phase,
+            participating_agents=record.participating_agents,
+            is_active=record.is_active,
+            summary=record.summary,
+            created_at=record.created_at,
+            closed_at=record.closed_at,
+        )
+        with self.get_db_session() as session:
+            self._execute_upsert(session, RelayStationModel, ("session_id", "station_id"), [(model, fields)])
+    
     async def get_station(self, station_id: str, session_id: str) -> Optional[RelayStationRecord]:
         """获取中继站"""
         with self.get_db_session() as session:
@@ -473,27 +643,21 @@ class SQLAlchemyRepository(
     async def create_relay_message(self, record: RelayMessageRecord) -> RelayMessageRecord:
         """创建中继消息"""
         with self.get_db_session() as session:
-            model = RelayMessageModel(
-                message_id=record.message_id,
-                station_id=record.station_id,
-                session_id=record.session_id,
-                relay_type=record.relay_type,
-                source_agent_id=record.source_agent_id,
-                source_agent_name=record.source_agent_name,
-                target_agent_ids=record.target_agent_ids,
-                content=record.content,
-                importance=record.importance,
-                viewed_by=record.viewed_by,
-                acknowledged_by=record.acknowledged_by,
-                viewed_timestamps=record.viewed_timestamps,
-                timestamp=record.timestamp,
-                metadata_json=record.metadata_json,
-            )
+            model = self._relay_message_record_to_model(record)
             session.add(model)
             session.flush()
             
             return self._model_to_relay_message_record(model)
     
+    async def bulk_create_relay_messages(self, records: List[RelayMessageRecord]) -> List[RelayMessageRecord]:
+        """批量创建中继消息（单个事务、一次 flush）"""
+        with self.get_db_session() as session:
+            models = [self._relay_message_record_to_model(record) for record in records]
+            session.add_all(models)
+            session.flush()
+            
+            return [self._model_to_relay_message_record(m) for m in models]
+    
     async def get_relay_messages_by_station(
         self,
         station_id: str,
@@ -535,6 +699,25 @@ class SQLAlchemyRepository(
             closed_at=model.closed_at,
         )
     
+    def _relay_message_record_to_model(self, record: RelayMessageRecord) -> RelayMessageModel:
+        """记录转模型"""
+        return RelayMessageModel(
+            message_id=record.message_id,
+            station_id=record.station_id,
+            session_id=record.session_id,
+            relay_type=record.relay_type,
+            source_agent_id=record.source_agent_id,
+            source_agent_name=record.source_agent_name,
+            target_agent_ids=record.target_agent_ids,
+            content=record.content,
+            importance=record.importance,
+            viewed_by=record.viewed_by,
+            acknowledged_by=record.acknowledged_by,
+            viewed_timestamps=record.viewed_timestamps,
+            timestamp=record.timestamp,
+            metadata_json=record.metadata_json,
+        )
+    
     def _model_to_relay_message_record(self, model: RelayMessageModel) -> RelayMessageRecord:
         return RelayMessageRecord(
             message_id=model.message_id,
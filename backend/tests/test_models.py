@@ -0,0 +1,60 @@
+"""
+核心数据模型测试集
+
+1. SubagentState 快照序列化结构（有界 deque 字段仍输出为列表）
+
+运行方式：
+  cd backend && python -m pytest tests/test_models.py -v
+"""
+
+import json
+import os
+import sys
+
+# 项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.models import (
+    RELAY_RECEIVED_MAXLEN,
+    EmergentRole,
+    RelayMessage,
+    RelayType,
+    SubagentConfig,
+    SubagentState,
+)
+from utils.jsonfast import json_dumps
+
+
+def new_state() -> SubagentState:
+    role = EmergentRole(
+        name="分析师",
+        description="d",
+        capabilities=[],
+        focus_areas=[],
+        system_prompt="s",
+        relay_triggers=[],
+    )
+    return SubagentState(id="a1", config=SubagentConfig(role=role, task_segment="t"))
+
+
+def test_relay_messages_received_dumps_as_list():
+    """已接收中继消息在内存中是有界 deque，model_dump 后是可 JSON 编码的 dict 列表"""
+    state = new_state()
+    for i in range(RELAY_RECEIVED_MAXLEN + 1):
+        state.relay_messages_received.append(RelayMessage(
+            type=RelayType.INSIGHT,
+            source_agent_id="a2",
+            source_agent_name="研究员",
+            target_agent_ids=[],
+            content=f"m{i}",
+        ))
+
+    dumped = state.model_dump()
+    received = dumped["relay_messages_received"]
+
+    assert isinstance(received, list)
+    assert len(received) == RELAY_RECEIVED_MAXLEN
+    assert received[0]["content"] == "m1"
+    # orjson 与标准库都能直接编码快照
+    json_dumps(dumped)
+    json.dumps(state.model_dump(mode="json"))
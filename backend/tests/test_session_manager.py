@@ -0,0 +1,670 @@
+"""
+SessionManager 测试集
+
+测试会话管理器的内存缓存逻辑（不依赖真实 LLM / 数据库）：
+1. Agent 常驻数量上限与 v-LRU 淘汰
+2. 订阅者 fan-out 广播
+3. SessionInfo 序列化
+4. 按 user_id 列出会话
+5. 空闲 MasterAgent 池复用
+6. Agent / 消息写缓冲合并
+
+运行方式（异步用例依赖 pytest-asyncio）：
+  cd backend && python -m pytest tests/test_session_manager.py -v
+或
+  cd backend && python tests/test_session_manager.py
+"""
+
+import asyncio
+import sys
+import os
+from datetime import datetime
+
+# 项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.session_manager import SessionManager, SessionInfo, TaskHistoryEntry
+from storage.memory_repository import MemoryRepository
+
+
+class FakeAgent:
+    """只记录 cleanup 调用的假 Agent，避免构造真实 MasterAgent"""
+
+    def __init__(self):
+        self.cleaned = False
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+class FakePooledAgent(FakeAgent):
+    """支持池化接口的假 MasterAgent"""
+
+    def __init__(self, provider_type: str = "openai", model=None, session_id=None, user_id=None):
+        super().__init__()
+        self.provider_type = provider_type
+        self.model = model
+        self.session_id = session_id
+        self.reset_count = 0
+
+    def reset_session_state(self):
+        self.reset_count += 1
+
+    def bind_session(self, session_id, user_id=None):
+        self.session_id = session_id
+
+
+
+class FakeDirectAgent(FakeAgent):
+    """普通模式假 Agent：cleanup 会清空对话历史（与 DirectAgent 一致）"""
+
+    def __init__(self, provider_type: str = "openai", model=None, session_id=None, user_id=None):
+        super().__init__()
+        self.session_id = session_id
+        self.conversation_history = []
+
+    def cleanup(self):
+        super().cleanup()
+        self.conversation_history.clear()
+
+def new_manager() -> SessionManager:
+    """创建一个独立的 SessionManager（不影响全局实例）"""
+    manager = SessionManager()
+    manager.set_repository(MemoryRepository())
+    return manager
+
+
+def add_session_with_agent(manager: SessionManager, session_id: str, running: bool = False) -> FakeAgent:
+    """直接向内存缓存注入一个会话及其 Agent（running=True 时标记有任务在执行）"""
+    manager._sessions[session_id] = SessionInfo(session_id=session_id)
+    agent = FakeAgent()
+    manager._agents[session_id] = agent
+    manager._record_agent_access(session_id)
+    if running:
+        manager._running_tasks[session_id] = 1
+    return agent
+
+
+async def start_task(manager: SessionManager, session_id: str):
+    """经 run_task 启动一个任务并停在执行中，返回 (任务流, 结束开关)"""
+    release = asyncio.Event()
+
+    async def execute_task():
+        yield {"type": "RUN_STARTED"}
+        await release.wait()
+        yield {"type": "RUN_FINISHED"}
+
+    task_stream = manager.run_task(session_id, execute_task())
+    await task_stream.__anext__()
+    return task_stream, release
+
+
+async def finish_task(task_stream, release: asyncio.Event):
+    """放行任务并消费完剩余事件"""
+    release.set()
+    async for _ in task_stream:
+        pass
+
+
+async def run_task_to_completion(manager: SessionManager, session_id: str):
+    """完整执行一轮任务（创建 → 运行 → 完成）"""
+    await finish_task(*await start_task(manager, session_id))
+
+
+def test_evict_keeps_session_info():
+    """Agent 达到上限时淘汰最久未访问的空闲 Agent，SessionInfo 保留"""
+    manager = new_manager()
+    manager._max_agents = 3
+
+    oldest = add_session_with_agent(manager, "s1")
+    add_session_with_agent(manager, "s2")
+    add_session_with_agent(manager, "s3")
+
+    manager._evict_agents_if_needed()
+
+    assert "s1" not in manager._agents
+    assert "s1" not in manager._agent_stats
+    assert oldest.cleaned
+    assert "s1" in manager._sessions
+    assert len(manager._agents) == 2
+
+
+def test_evict_skips_running_sessions():
+    """有任务在执行的会话 Agent 不会被淘汰"""
+    manager = new_manager()
+    manager._max_agents = 2
+
+    running = add_session_with_agent(manager, "s1", running=True)
+    add_session_with_agent(manager, "s2", running=True)
+
+    manager._evict_agents_if_needed()
+
+    assert not running.cleaned
+    assert len(manager._agents) == 2
+
+
+def test_evict_prefers_low_value_in_tail():
+    """尾部候选中，命中次数少且无报告的 Agent 优先被淘汰"""
+    manager = new_manager()
+    manager._max_agents = 20
+
+    for i in range(20):
+        add_session_with_agent(manager, f"s{i:02d}")
+    # s00 最旧但有报告且访问频繁；s01 次旧且价值低
+    manager._sessions["s00"].final_report = "report"
+    hits, ts = manager._agent_stats["s00"]
+    manager._agent_stats["s00"] = (hits + 10, ts)
+
+    manager._evict_agents_if_needed()
+
+    assert "s00" in manager._agents
+    assert "s01" not in manager._agents
+
+
+async def test_evicted_direct_session_keeps_history_for_followup():
+    """普通模式会话的 Agent 被淘汰后，追问时重建的 Agent 恢复原对话历史"""
+    manager = new_manager()
+    manager._ensure_imports = lambda: (FakePooledAgent, FakeDirectAgent)
+    manager._max_agents = 2
+
+    first = manager.get_or_create_direct_agent("d1")
+    first.conversation_history.extend(["user: q1", "assistant: a1"])
+    manager._sessions["d1"].status = "completed"
+    assert manager._sessions["d1"].has_history()
+
+    # 其它会话挤占 Agent 名额，d1 作为最久未访问的空闲 Agent 被淘汰
+    add_session_with_agent(manager, "s2")
+    manager.get_or_create_direct_agent("d3")
+    assert "d1" not in manager._agents
+    assert first.cleaned
+
+    # 追问：重建 DirectAgent 并恢复历史
+    followup = manager.get_or_create_direct_agent("d1")
+    assert followup is not first
+    assert followup.conversation_history == ["user: q1", "assistant: a1"]
+    assert "d1" not in manager._evicted_direct_history
+
+    # 再次被淘汰后关闭会话，淘汰历史随会话一起丢弃
+    manager._agent_stats["d1"] = (0, 0.0)
+    manager._evict_agents_if_needed()
+    assert "d1" in manager._evicted_direct_history
+    await manager.close_session("d1")
+    assert "d1" not in manager._evicted_direct_history
+
+
+async def test_agent_cap_enforced_through_real_task_flow():
+    """真实的创建 → 执行 → 完成流程下 Agent 数不超过上限，执行中的会话不被淘汰"""
+    manager = new_manager()
+    manager._ensure_imports = lambda: (FakePooledAgent, FakeDirectAgent)
+    manager._max_agents = 2
+
+    done = await manager.create_session(task="done", user_id="u")
+    busy = await manager.create_session(task="busy", user_id="u")
+    done_agent = manager.get_or_create_agent(done)
+    busy_agent = manager.get_or_create_agent(busy)
+    await run_task_to_completion(manager, done)
+    task_stream, release = await start_task(manager, busy)
+    # 两个会话的状态都一直是 active，淘汰只看是否有任务在执行
+    assert manager._sessions[done].status == manager._sessions[busy].status == "active"
+
+    third = await manager.create_session(task="third", user_id="u")
+    manager.get_or_create_agent(third)
+
+    assert set(manager._agents) == {busy, third}
+    assert manager._agents[busy] is busy_agent
+    assert done_agent.reset_count == 1
+    assert done in manager._sessions
+
+    # 被淘汰的会话仍可访问：按会话配置重建 Agent
+    manager._running_tasks[third] = 1
+    restored = manager.get_or_restore_agent(done)
+    assert restored is not None and manager._agents[done] is restored
+    assert manager.get_or_restore_agent("missing") is None
+
+    await finish_task(task_stream, release)
+    assert busy not in manager._running_tasks
+
+
+async def test_broadcast_fanout_to_all_subscribers():
+    """同一会话的多个订阅者都能按顺序收到广播事件"""
+    manager = new_manager()
+    q1 = await manager.subscribe("s1")
+    q2 = await manager.subscribe("s1")
+
+    assert await manager.broadcast_event("s1", {"type": "A"}) == 2
+    await manager.broadcast_event("s1", {"type": "B"})
+
+    for q in (q1, q2):
+        assert (await asyncio.wait_for(q.get(), 1))["type"] == "A"
+        assert (await asyncio.wait_for(q.get(), 1))["type"] == "B"
+
+    await manager.unsubscribe("s1", q1)
+    await manager.unsubscribe("s1", q2)
+    assert manager.get_subscriber_count("s1") == 0
+    assert "s1" not in manager._fanout_tasks
+    assert await manager.broadcast_event("s1", {"type": "C"}) == 0
+
+
+async def test_broadcast_drops_oldest_for_slow_subscriber():
+    """慢订阅者队列满时丢弃最旧事件，保留最新事件"""
+    manager = new_manager()
+    slow = await manager.subscribe("s1", maxsize=2)
+
+    for i in range(3):
+        await manager.broadcast_event("s1", {"type": "E", "i": i})
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert [slow.get_nowait()["i"] for _ in range(2)] == [1, 2]
+    assert manager.get_stats()["dropped_events"] == 1
+    await manager.unsubscribe("s1", slow)
+
+
+async def test_blocking_subscriber_receives_every_event():
+    """背压模式订阅者队列满时不丢事件，等待消费后继续投递"""
+    manager = new_manager()
+    steady = await manager.subscribe("s1", maxsize=1, block=True)
+
+    async def publish():
+        for i in range(4):
+            await manager.broadcast_event("s1", {"type": "E", "i": i})
+
+    publisher = asyncio.create_task(publish())
+    received = [(await asyncio.wait_for(steady.get(), 1))["i"] for _ in range(4)]
+    await publisher
+
+    assert received == [0, 1, 2, 3]
+    assert manager.get_stats()["dropped_events"] == 0
+    await manager.unsubscribe("s1", steady)
+
+
+async def test_stuck_blocking_subscriber_times_out():
+    """背压订阅者并行等待，卡住的订阅者超时后不再拖住其他订阅者"""
+    manager = new_manager()
+    manager._BLOCKING_PUT_TIMEOUT = 0.05
+    stuck = await manager.subscribe("s1", maxsize=1, block=True)
+    steady = await manager.subscribe("s1", maxsize=1, block=True)
+
+    await manager.broadcast_event("s1", {"type": "E", "i": 0})
+    await manager.broadcast_event("s1", {"type": "E", "i": 1})
+    assert (await asyncio.wait_for(steady.get(), 1))["i"] == 0
+    assert (await asyncio.wait_for(steady.get(), 1))["i"] == 1
+    await asyncio.sleep(0.1)
+
+    assert stuck.get_nowait()["i"] == 0
+    assert stuck.empty()
+    assert manager.get_stats()["dropped_events"] == 1
+    await manager.unsubscribe("s1", stuck)
+    await manager.unsubscribe("s1", steady)
+
+
+async def test_idle_subscriber_is_swept():
+    """长时间没有消费方等待的订阅者被巡检移除，正在等待事件的订阅者保留"""
+    manager = new_manager()
+    abandoned = await manager.subscribe("s1")
+    listening = await manager.subscribe("s1")
+    reader = asyncio.create_task(listening.get())
+    await asyncio.sleep(0)
+
+    abandoned.last_get -= manager._SUBSCRIBER_IDLE_TIMEOUT + 1
+    listening.last_get -= manager._SUBSCRIBER_IDLE_TIMEOUT + 1
+
+    assert await manager._sweep_idle_subscribers() == 1
+    assert manager.get_subscriber_count("s1") == 1
+
+    reader.cancel()
+    await manager.unsubscribe("s1", listening)
+
+
+async def test_event_is_serialized_once_for_all_subscribers():
+    """同一事件广播给多个订阅者时只序列化一次，订阅者收到广播时刻的 SSE 文本"""
+    from agui.events import SessionStateChangedEvent
+
+    manager = new_manager()
+    q1 = await manager.subscribe("s1")
+    q2 = await manager.subscribe("s1")
+    event = SessionStateChangedEvent(session_id="s1", change_type="agent_added")
+    calls = []
+    original_dump = event.model_dump_json
+
+    def counting_dump(*args, **kwargs):
+        calls.append(1)
+        return original_dump(*args, **kwargs)
+
+    object.__setattr__(event, "model_dump_json", counting_dump)
+    await manager.broadcast_event("s1", event)
+    # 广播后修改事件（含嵌套字段）不影响已广播的文本
+    event.summary["late"] = True
+
+    sse1 = await asyncio.wait_for(q1.get(), 1)
+    sse2 = await asyncio.wait_for(q2.get(), 1)
+    assert sse1 is sse2
+    assert sse1.startswith("event: SESSION_STATE_CHANGED\n") and '"agent_added"' in sse1
+    assert "late" not in sse1
+    assert len(calls) == 1
+    await manager.unsubscribe("s1", q1)
+    await manager.unsubscribe("s1", q2)
+
+
+def test_session_info_iso_cache_follows_timestamp():
+    """to_dict 复用 iso 字符串缓存，时间戳变化后重新生成"""
+    info = SessionInfo(session_id="s1", task="t" * 200)
+    assert not hasattr(info, "__dict__")
+
+    first = info.to_dict()
+    assert info.to_dict()["last_active_at"] is first["last_active_at"]
+    assert len(info.to_list_item(has_agent=False)["task"]) == 100
+
+    info.last_active_at = datetime(2030, 1, 1)
+    assert info.to_dict()["last_active_at"] == "2030-01-01T00:00:00"
+
+
+def test_plan_json_is_cached_until_plan_replaced():
+    """plan_json 对同一 plan 只编码一次，替换 plan 后重新编码"""
+    info = SessionInfo(session_id="s1")
+    assert info.plan_json() is None
+
+    info.plan = {"analysis": "a"}
+    first = info.plan_json()
+    assert first == '{"analysis":"a"}'
+    assert info.plan_json() is first
+
+    info.plan = {"analysis": "b"}
+    assert info.plan_json() == '{"analysis":"b"}'
+
+
+def test_followup_context_respects_budget_and_priority():
+    """追问上下文优先保留最终报告，总长度不超过预算"""
+    info = SessionInfo(
+        session_id="s1",
+        final_report="R" * 3000,
+        task_history=[TaskHistoryEntry(task="旧任务", summary="S" * 600, roles=[], timestamp="")],
+        intervention_summary="- [inject] 关注成本",
+    )
+
+    context = info.build_followup_context(max_chars=1000)
+    assert context.startswith("## 上一轮任务的最终报告")
+    assert context.endswith("...(上下文已截取)")
+    assert len(context) <= 1000 + len("\n...(上下文已截取)")
+    assert "历史任务记录" not in context
+
+    full = info.build_followup_context(max_chars=10000)
+    assert "...(报告已截取前 1500 字符)" in full
+    assert "关注成本" in full
+    assert info.to_dict()["task_history"][0]["task"] == "旧任务"
+
+
+def test_session_info_expiry_uses_monotonic_clock():
+    """过期判断基于单调时钟，touch 后重新计时"""
+    info = SessionInfo(session_id="s1")
+    assert not info.is_expired(timeout_minutes=1)
+
+    info._last_active_mono -= 120
+    assert info.is_expired(timeout_minutes=1)
+
+    info.touch()
+    assert not info.is_expired(timeout_minutes=1)
+
+
+async def test_cleanup_pops_only_expired_sessions():
+    """过期清理只关闭真正过期的会话，续期过的会话重新入堆"""
+    manager = new_manager()
+    stale = await manager.create_session(task="stale", user_id="u")
+    renewed = await manager.create_session(task="renewed", user_id="u")
+
+    # 两个会话都“很久以前”创建，但 renewed 刚刚被访问过
+    manager._expiry_heap = [(ts - 7200, token, sid) for ts, token, sid in manager._expiry_heap]
+    manager._sessions[stale]._last_active_mono -= 7200
+
+    await manager._cleanup_expired_sessions()
+
+    assert stale not in manager._sessions
+    assert renewed in manager._sessions
+    assert [sid for _, _, sid in manager._expiry_heap] == [renewed]
+
+
+async def test_concurrent_creates_are_batched():
+    """窗口期内的并发创建合并为一次批量写入"""
+    manager = new_manager()
+    repo = manager.get_repository()
+    calls = []
+    original = repo.bulk_create_sessions
+
+    async def counting_bulk(records):
+        calls.append(len(records))
+        return await original(records)
+
+    repo.bulk_create_sessions = counting_bulk
+
+    session_ids = await asyncio.gather(*(manager.create_session(task=f"t{i}", user_id="u") for i in range(5)))
+
+    assert calls == [5]
+    for session_id in session_ids:
+        assert await repo.get_session(session_id) is not None
+
+
+async def test_agent_saves_are_coalesced_per_agent():
+    """窗口期内同一 Agent 的多次保存合并为一次 upsert，读取前先落库缓冲"""
+    manager = new_manager()
+    repo = manager.get_repository()
+    calls = []
+    original = repo.upsert_agents
+
+    async def counting_upsert(items):
+        calls.append([record.agent_id for record, _ in items])
+        return await original(items)
+
+    repo.upsert_agents = counting_upsert
+
+    results = await asyncio.gather(
+        manager.save_agent("s1", "a1", {"name": "A1", "status": "running"}),
+        manager.save_agent("s1", "a1", {"status": "completed", "progress": 100}),
+        manager.save_agent("s1", "a2", {"name": "A2"}),
+    )
+
+    assert results == [True, True, True]
+    assert calls == [["a1", "a2"]]
+    agents = {a["agent_id"]: a for a in await manager.get_session_agents("s1")}
+    assert agents["a1"]["name"] == "A1"
+    assert agents["a1"]["status"] == "completed"
+
+    save = asyncio.create_task(manager.save_agent("s1", "a2", {"status": "failed"}))
+    await asyncio.sleep(0)
+    agents = {a["agent_id"]: a for a in await manager.get_session_agents("s1")}
+    assert agents["a2"]["status"] == "failed"
+    assert await save
+
+
+async def test_update_message_appends_to_buffered_message():
+    """流式追加直接更新目标消息，消息仍在写缓冲中时先落库"""
+    manager = new_manager()
+    save = asyncio.create_task(manager.save_message("s1", {"message_id": "m1", "content": "a"}))
+    await asyncio.sleep(0)
+
+    assert await manager.update_message("s1", "m1", "b")
+    assert await manager.update_message("s1", "m1", "c")
+    assert not await manager.update_message("s2", "m1", "x")
+    assert await save
+    assert [m["content"] for m in await manager.get_session_messages("s1")] == ["abc"]
+
+
+async def test_message_reads_are_cached_until_next_write():
+    """历史消息读取命中缓存，有新的写入后重新查询"""
+    manager = new_manager()
+    repo = manager.get_repository()
+    calls = []
+    original = repo.get_messages_by_session
+
+    async def counting_get(session_id, limit=100, offset=0):
+        calls.append(session_id)
+        return await original(session_id, limit, offset)
+
+    repo.get_messages_by_session = counting_get
+
+    await manager.save_message("s1", {"message_id": "m1", "content": "a"})
+    assert [m["content"] for m in await manager.get_session_messages("s1")] == ["a"]
+    assert [m["content"] for m in await manager.get_session_messages("s1")] == ["a"]
+    assert len(calls) == 1
+
+    await manager.update_message("s1", "m1", "b")
+    assert [m["content"] for m in await manager.get_session_messages("s1")] == ["ab"]
+    assert len(calls) == 2
+
+
+async def test_read_during_append_does_not_cache_stale_content():
+    """追加提交前开始的读取拿到旧内容，但不会以最新版本号留在缓存里"""
+    manager = new_manager()
+    repo = manager.get_repository()
+    await manager.save_message("s1", {"message_id": "m1", "content": "a"})
+    await manager.get_session_messages("s1")
+
+    committing = asyncio.Event()
+    original_append = repo.append_message_content
+
+    async def slow_append(session_id, message_id, delta):
+        committing.set()
+        await asyncio.sleep(0.02)
+        return await original_append(session_id, message_id, delta)
+
+    repo.append_message_content = slow_append
+
+    update = asyncio.create_task(manager.update_message("s1", "m1", "b"))
+    await committing.wait()
+    # 读取发生在版本号递增之后、追加提交之前
+    assert [m["content"] for m in await manager.get_session_messages("s1")] == ["a"]
+    await update
+
+    assert [m["content"] for m in await manager.get_session_messages("s1")] == ["ab"]
+
+
+async def test_full_cache_evicts_least_recently_used_idle_session():
+    """会话缓存满时淘汰最久未活跃的空闲会话，运行中的会话保留"""
+    manager = new_manager()
+    manager._max_sessions = 3
+    running = await manager.create_session(task="running", user_id="u")
+    idle_old = await manager.create_session(task="old", user_id="u")
+    idle_new = await manager.create_session(task="new", user_id="u")
+    await run_task_to_completion(manager, idle_old)
+    await run_task_to_completion(manager, idle_new)
+    manager._sessions[idle_new].touch()
+    # 最早创建的会话仍在执行任务，不能被淘汰
+    task_stream, release = await start_task(manager, running)
+
+    created = await manager.create_session(task="next", user_id="u")
+
+    assert set(manager._sessions) == {running, idle_new, created}
+    await finish_task(task_stream, release)
+    assert idle_old not in [s["session_id"] for s in manager.list_sessions("u")]
+
+
+async def test_full_cache_of_running_sessions_rejects_create():
+    """全部会话都在运行时拒绝创建新会话，任务结束后即可淘汰"""
+    manager = new_manager()
+    manager._max_sessions = 1
+    running = await manager.create_session(task="running", user_id="u")
+    task_stream, release = await start_task(manager, running)
+
+    try:
+        await manager.create_session(task="next", user_id="u")
+        assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
+
+    await finish_task(task_stream, release)
+    created = await manager.create_session(task="next", user_id="u")
+    assert set(manager._sessions) == {created}
+
+
+async def test_auto_create_respects_session_cap():
+    """按未知 session_id 自动建会话时同样受容量限制，不会越过上限插入"""
+    manager = new_manager()
+    manager._ensure_imports = lambda: (FakePooledAgent, FakeDirectAgent)
+    manager._max_sessions = 1
+    running = await manager.create_session(task="running", user_id="u")
+    task_stream, release = await start_task(manager, running)
+
+    for get_or_create in (manager.get_or_create_agent, manager.get_or_create_direct_agent):
+        try:
+            get_or_create("unknown")
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+    assert set(manager._sessions) == {running}
+
+    # 任务结束后最久未活跃的会话可被淘汰，自动建会话成功
+    await finish_task(task_stream, release)
+    manager.get_or_create_agent("unknown")
+    assert set(manager._sessions) == {"unknown"}
+
+
+async def test_list_sessions_uses_user_index():
+    """list_sessions 只返回本用户的会话，关闭后从索引移除"""
+    manager = new_manager()
+    a1 = await manager.create_session(task="a1", user_id="alice")
+    await manager.create_session(task="b1", user_id="bob")
+    a2 = await manager.create_session(task="a2", user_id="alice")
+
+    assert [s["session_id"] for s in manager.list_sessions("alice")] == [a1, a2]
+    assert manager.list_sessions(None) == []
+
+    await manager.close_session(a1)
+    assert [s["session_id"] for s in manager.list_sessions("alice")] == [a2]
+
+    await manager.close_session(a2)
+    assert "alice" not in manager._user_index
+
+
+async def test_closed_agent_is_recycled_for_next_session():
+    """已完成会话关闭后 Agent 进入空闲池，下一个会话直接复用"""
+    manager = new_manager()
+    manager._sessions["s1"] = SessionInfo(session_id="s1", status="completed")
+    pooled = FakePooledAgent()
+    manager._agents["s1"] = pooled
+
+    await manager.close_session("s1")
+    assert pooled.reset_count == 1
+    assert not pooled.cleaned
+
+    agent = manager.get_or_create_agent("s2", provider="openai", model=None)
+    assert agent is pooled
+    assert agent.session_id == "s2"
+    assert manager.get_stats()["pooled_agents"] == 0
+
+
+async def test_followup_during_running_task_gets_fresh_agent():
+    """上一轮仍在执行时追问：旧 Agent cleanup，绑定新实例；上一轮已结束时回收复用"""
+    manager = new_manager()
+    manager._ensure_imports = lambda: (FakePooledAgent, FakeDirectAgent)
+    session_id = await manager.create_session(task="t1", user_id="u")
+    first = manager.get_or_create_agent(session_id)
+    task_stream, release = await start_task(manager, session_id)
+
+    second = manager.prepare_followup(session_id)
+    assert second is not first
+    assert first.cleaned and first.reset_count == 0
+    assert manager.get_stats()["pooled_agents"] == 0
+
+    await finish_task(task_stream, release)
+    third = manager.prepare_followup(session_id)
+    # 上一轮已结束：实例重置后经空闲池重新绑定到本会话
+    assert third is second
+    assert second.reset_count == 1 and not second.cleaned
+
+
+async def test_running_agent_is_not_recycled():
+    """运行中会话被关闭时 Agent 直接 cleanup，不进入空闲池"""
+    manager = new_manager()
+    manager._sessions["s1"] = SessionInfo(session_id="s1")
+    running = FakePooledAgent()
+    manager._agents["s1"] = running
+    manager._running_tasks["s1"] = 1
+
+    await manager.close_session("s1")
+    assert running.cleaned
+    assert running.reset_count == 0
+    assert manager.get_stats()["pooled_agents"] == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,57 @@
+"""
+SQLAlchemyRepository 测试集
+
+测试仓库层不依赖真实数据库连接的并发逻辑：
+1. 同一消息的流式追加按调用顺序提交
+
+运行方式（异步用例依赖 pytest-asyncio）：
+  cd backend && python -m pytest tests/test_sqlalchemy_repository.py -v
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+# 项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.config import StorageConfig
+from storage.sqlalchemy_repository import SQLAlchemyRepository
+
+
+def new_threaded_repository(committed):
+    """构造走线程池路径的仓库（模拟 MySQL/PostgreSQL），追加只记录提交顺序"""
+    repo = SQLAlchemyRepository(StorageConfig())
+
+    async def run_blocking(fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    def append_sync(session_id, message_id, delta):
+        # 随机耗时模拟各连接提交速度不同
+        time.sleep(random.uniform(0, 0.01))
+        committed.append((message_id, delta))
+        return 1
+
+    repo._run_blocking = run_blocking
+    repo._append_message_content_sync = append_sync
+    return repo
+
+
+async def test_concurrent_appends_commit_in_call_order():
+    """fire-and-forget 的并发追加按创建顺序提交，不同消息互不阻塞"""
+    committed = []
+    repo = new_threaded_repository(committed)
+
+    deltas = [f"t{i}," for i in range(30)]
+    tasks = []
+    for delta in deltas:
+        tasks.append(asyncio.create_task(repo.append_message_content("s1", "m1", delta)))
+        tasks.append(asyncio.create_task(repo.append_message_content("s1", "m2", delta)))
+    await asyncio.gather(*tasks)
+
+    assert [d for m, d in committed if m == "m1"] == deltas
+    assert [d for m, d in committed if m == "m2"] == deltas
+    # 全部完成后不残留逐消息锁
+    assert repo._append_locks == {}
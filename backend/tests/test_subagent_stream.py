@@ -0,0 +1,203 @@
+"""
+SubagentRuntime 流式迭代测试集
+
+用假 provider 驱动 _stream_iteration_with_tools（不依赖真实 LLM）：
+1. 检测流已开始输出正文时不再受检测时限约束
+2. 检测流中断时从已推送文本续写，客户端不会收到重复内容
+3. 同一轮的多个工具调用受并行度上限约束并发执行，tool 消息按原始顺序回填
+4. run_stream 合并的 thinking 在上游停顿时按时间间隔推送
+
+运行方式（异步用例依赖 pytest-asyncio）：
+  cd backend && python -m pytest tests/test_subagent_stream.py -v
+"""
+
+import asyncio
+import os
+import sys
+from collections import deque
+from types import SimpleNamespace
+
+# 项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.subagent import SubagentRuntime, _RESUME_PARTIAL_PROMPT, _THINKING_FLUSH_INTERVAL
+from llm.provider import LLMConfig, LLMMessage
+
+
+class FakeProvider:
+    """检测流按脚本产出事件（每轮一份脚本），最终流 chat() 记录收到的消息"""
+
+    def __init__(self, *detect_rounds, final_chunks=("续写",)):
+        self.detect_rounds = list(detect_rounds)
+        self.final_chunks = final_chunks
+        self.chat_calls = []
+
+    async def chat_stream_with_tools(self, messages, config, tools=None):
+        for delay, event in self.detect_rounds.pop(0):
+            await asyncio.sleep(delay)
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    async def chat(self, messages, config):
+        self.chat_calls.append(list(messages))
+        for chunk in self.final_chunks:
+            yield chunk
+
+
+def new_runtime(provider, **budget):
+    """绕过 __init__ 构造只含流式迭代所需属性的运行时"""
+    runtime = SubagentRuntime.__new__(SubagentRuntime)
+    runtime.config = SimpleNamespace(id="a1", role=SimpleNamespace(name="分析师"))
+    runtime.provider = provider
+    runtime.llm_config = LLMConfig(model="fake")
+    runtime.on_tool_call = None
+    runtime.skill_set = object()
+    runtime._tool_definitions = [{"type": "function", "function": {"name": "search"}}]
+    runtime.runtime_budget = SimpleNamespace(**budget)
+    runtime.messages = [LLMMessage(role="system", content="sys"), LLMMessage(role="user", content="task")]
+    runtime._history_window = 12
+    runtime._history_head = 2
+    runtime._rolling_cache_message = None
+    return runtime
+
+
+async def collect(runtime):
+    return [event async for event in runtime._stream_iteration_with_tools()]
+
+
+def streamed_text(events):
+    return "".join(e["delta"] for e in events if e["type"] == "thinking")
+
+
+async def test_streaming_answer_not_cut_by_detect_timeout():
+    """正文开始输出且无 tool_call 增量后，累计耗时超过检测时限也不回退到 chat()"""
+    deltas = ["第一段，", "第二段，", "第三段。"]
+    provider = FakeProvider(
+        [(0.45, {"type": "content", "delta": d}) for d in deltas]
+        + [(0, {"type": "done", "content": "".join(deltas), "tool_calls": None, "finish_reason": "stop"})]
+    )
+    runtime = new_runtime(provider, tool_detect_timeout_sec=1, max_total_tool_time_sec=30)
+
+    events = await collect(runtime)
+
+    assert provider.chat_calls == []
+    assert streamed_text(events) == "".join(deltas)
+    assert events[-1] == {"type": "final_content", "content": "".join(deltas)}
+
+
+async def test_interrupted_detect_stream_resumes_from_partial_text():
+    """检测流推送部分正文后出错：最终流从中断处续写，推送内容与最终回复一致且不重复"""
+    provider = FakeProvider(
+        [
+            (0, {"type": "content", "delta": "前半段，"}),
+            (0, RuntimeError("connection reset")),
+        ],
+        final_chunks=("后半段。",),
+    )
+    runtime = new_runtime(provider)
+
+    events = await collect(runtime)
+
+    assert streamed_text(events) == "前半段，后半段。"
+    assert events[-1] == {"type": "final_content", "content": "前半段，后半段。"}
+    # 续写请求带上已推送文本与续写提示，但二者不写入对话历史
+    sent = provider.chat_calls[0]
+    assert [(m.role, m.content) for m in sent[-2:]] == [
+        ("assistant", "前半段，"),
+        ("user", _RESUME_PARTIAL_PROMPT),
+    ]
+    assert [(m.role, m.content) for m in runtime.messages[2:]] == [("assistant", "前半段，后半段。")]
+
+
+def tool_call(call_id, query):
+    return {"id": call_id, "type": "function", "function": {"name": "search", "arguments": f'{{"query": "{query}"}}'}}
+
+
+def new_tool_runtime(max_tool_parallelism, delays):
+    """首轮检测返回多个 tool_calls、次轮直接作答的运行时，工具按 delays 耗时执行"""
+    calls = [tool_call(f"c{i}", f"q{i}") for i in range(len(delays))]
+    provider = FakeProvider(
+        [(0, {"type": "done", "content": "", "tool_calls": calls, "finish_reason": "tool_calls"})],
+        [(0, {"type": "content", "delta": "结论"}), (0, {"type": "done", "content": "结论", "tool_calls": None})],
+    )
+    runtime = new_runtime(provider, max_tool_parallelism=max_tool_parallelism)
+    running = {"now": 0, "peak": 0}
+
+    async def execute_skill(skill_name, task_desc, func_args):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(delays[int(task_desc[1:])])
+        running["now"] -= 1
+        return {
+            "success": True,
+            "summary": task_desc,
+            "result_preview": task_desc,
+            "tool_message_content": f"result of {task_desc}",
+        }
+
+    runtime._execute_skill_with_guard = execute_skill
+    return runtime, running
+
+
+async def test_tool_calls_run_concurrently_and_keep_original_order():
+    """两个工具调用并发执行：结果事件按完成顺序推送，tool 消息按原始顺序回填"""
+    runtime, running = new_tool_runtime(max_tool_parallelism=2, delays=[0.05, 0.01])
+
+    events = await collect(runtime)
+
+    assert running["peak"] == 2
+    assert [e["tool_call_id"] for e in events if e["type"] == "tool_call_result"] == ["c1", "c0"]
+    tool_messages = [m for m in runtime.messages if m.role == "tool"]
+    assert [(m.tool_call_id, m.content) for m in tool_messages] == [
+        ("c0", "result of q0"),
+        ("c1", "result of q1"),
+    ]
+    assert events[-1] == {"type": "final_content", "content": "结论"}
+
+
+async def test_tool_calls_respect_parallelism_limit():
+    """并发执行数不超过 max_tool_parallelism"""
+    runtime, running = new_tool_runtime(max_tool_parallelism=1, delays=[0.02, 0.01])
+
+    events = await collect(runtime)
+
+    assert running["peak"] == 1
+    assert [e["tool_call_id"] for e in events if e["type"] == "tool_call_result"] == ["c0", "c1"]
+    assert [m.tool_call_id for m in runtime.messages if m.role == "tool"] == ["c0", "c1"]
+
+
+async def test_buffered_thinking_flushes_when_upstream_stalls():
+    """不足合并字符数的 thinking 在上游停顿时也会在间隔到期后推送，不必等下一个增量"""
+    runtime = new_runtime(FakeProvider())
+    runtime.config.max_iterations = 1
+    runtime.state = SimpleNamespace(thinking="", iterations=0)
+    runtime.on_progress = None
+    runtime.on_thinking = None
+    runtime._cancelled = False
+    runtime._not_paused = asyncio.Event()
+    runtime._not_paused.set()
+    runtime.relay_inbox = deque()
+    runtime.relay_event = asyncio.Event()
+    runtime._inbox_rev = 0
+    runtime._init_messages = lambda: None
+    stalled = asyncio.Event()
+
+    async def iteration():
+        yield {"type": "thinking", "delta": "短"}
+        yield {"type": "thinking", "delta": "句"}
+        # 上游长时间停顿
+        await stalled.wait()
+        yield {"type": "final_content", "content": "短句"}
+
+    runtime._stream_iteration_with_tools = iteration
+    stream = runtime.run_stream()
+    try:
+        event = await stream.__anext__()
+        while event["type"] != "thinking":
+            event = await asyncio.wait_for(stream.__anext__(), _THINKING_FLUSH_INTERVAL * 10)
+        assert event == {"type": "thinking", "delta": "短句"}
+        assert runtime.state.thinking == "短句"
+    finally:
+        stalled.set()
+        await stream.aclose()
@@ -0,0 +1,220 @@
+"""
+ToolCallingMixin 测试集
+
+用假工具处理器测试工具调用的执行与复用（不依赖真实 LLM / 技能）：
+1. 只缓存成功结果，失败结果不复用
+2. 并发的重复调用共享同一次执行
+3. 流式轮次提前启动工具、参数变化时取消重跑、流中断时不遗留任务
+
+运行方式（异步用例依赖 pytest-asyncio）：
+  cd backend && python -m pytest tests/test_tool_calling.py -v
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+# 项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.tool_calling_mixin import ToolCallingMixin
+
+
+class FakeToolHandler:
+    """按脚本依次返回 success 取值的工具处理器，记录每次执行的调用"""
+
+    def __init__(self, outcomes, delay=0.0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = []
+
+    async def handle_tool_calls(self, tool_calls):
+        tool_call = tool_calls[0]
+        self.calls.append(tool_call["id"])
+        await asyncio.sleep(self.delay)
+        outcome = self.outcomes.pop(0) if self.outcomes else True
+        if isinstance(outcome, Exception):
+            raise outcome
+        return [{
+            "tool_call_id": tool_call["id"],
+            "name": tool_call["function"]["name"],
+            "content": json.dumps({"success": outcome, "data": len(self.calls)}),
+        }]
+
+
+class FakeAgent(ToolCallingMixin):
+    def __init__(self, handler):
+        self._tool_handler = handler
+
+
+def make_call(call_id, arguments='{"query": "agent swarm", "limit": 3}'):
+    return {"id": call_id, "type": "function", "function": {"name": "web_search", "arguments": arguments}}
+
+
+async def test_failed_results_are_not_cached():
+    """失败结果（success 为 false 或抛异常）不进入缓存，下次相同调用重新执行"""
+    handler = FakeToolHandler([False, RuntimeError("timeout"), True])
+    agent = FakeAgent(handler)
+    semaphore = asyncio.Semaphore(4)
+    cache = {}
+
+    first = await agent._run_tool_call(make_call("c1"), semaphore, cache)
+    second = await agent._run_tool_call(make_call("c2"), semaphore, cache)
+    assert json.loads(first["content"])["success"] is False
+    assert json.loads(second["content"])["success"] is False
+    assert cache == {}
+
+    third = await agent._run_tool_call(make_call("c3"), semaphore, cache)
+    # 参数键顺序不同仍视为同一调用，复用成功结果
+    fourth = await agent._run_tool_call(make_call("c4", '{"limit": 3, "query": "agent swarm"}'), semaphore, cache)
+    assert handler.calls == ["c1", "c2", "c3"]
+    assert fourth["tool_call_id"] == "c4"
+    assert fourth["content"] == third["content"]
+
+
+async def test_concurrent_duplicates_share_one_execution():
+    """同名同参数的调用并发发起时只执行一次，各自得到自己的 tool_call_id"""
+    handler = FakeToolHandler([True], delay=0.05)
+    agent = FakeAgent(handler)
+
+    results = await agent._handle_tool_calls_parallel(
+        [make_call("c1"), make_call("c2"), make_call("c3")], asyncio.Semaphore(4), {}
+    )
+
+    assert handler.calls == ["c1"]
+    assert [r["tool_call_id"] for r in results] == ["c1", "c2", "c3"]
+    assert len({r["content"] for r in results}) == 1
+
+
+async def test_cancelled_owner_lets_waiting_duplicate_rerun():
+    """执行方被取消时，等待中的重复调用自行重新执行而不是一直挂起"""
+    handler = FakeToolHandler([True, True], delay=0.05)
+    agent = FakeAgent(handler)
+    semaphore = asyncio.Semaphore(4)
+    cache = {}
+
+    owner = asyncio.create_task(agent._run_tool_call(make_call("c1"), semaphore, cache))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(agent._run_tool_call(make_call("c2"), semaphore, cache))
+    await asyncio.sleep(0.01)
+    owner.cancel()
+
+    result = await asyncio.wait_for(waiter, 1)
+    assert result["tool_call_id"] == "c2"
+    assert handler.calls == ["c1", "c2"]
+
+
+class RecordingToolHandler:
+    """记录开始/取消的慢速工具处理器，结果回显最终参数"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.started = []
+        self.cancelled = []
+
+    async def handle_tool_calls(self, tool_calls):
+        tool_call = tool_calls[0]
+        arguments = tool_call["function"]["arguments"]
+        self.started.append((tool_call["id"], arguments))
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append((tool_call["id"], arguments))
+            raise
+        return [{
+            "tool_call_id": tool_call["id"],
+            "name": tool_call["function"]["name"],
+            "content": json.dumps({"success": True, "args": json.loads(arguments)}),
+        }]
+
+
+def tool_delta(index, call_id, arguments):
+    return {"type": "tool_call_delta", "index": index, "id": call_id, "name": "web_search", "arguments_delta": arguments}
+
+
+def done_event(*calls):
+    return {
+        "type": "done",
+        "content": "",
+        "tool_calls": [make_call(call_id, arguments) for call_id, arguments in calls],
+        "finish_reason": "tool_calls",
+    }
+
+
+async def fake_stream(events, observed=None, handler=None, error=None):
+    """模拟 chat_stream_with_tools_serialized：依次产出事件，可在结束前抛出异常"""
+    for event in events:
+        await asyncio.sleep(0.01)
+        yield event
+    if observed is not None:
+        # 流结束前让出一次，记录此时已开始执行的工具
+        await asyncio.sleep(0.01)
+        observed.extend(handler.started)
+    if error is not None:
+        await asyncio.sleep(0.01)
+        raise error
+
+
+async def test_stream_round_starts_complete_calls_early():
+    """出现下一个 index 时，前一个参数完整的调用在流结束前就开始执行"""
+    handler = RecordingToolHandler()
+    agent = FakeAgent(handler)
+    observed = []
+    events = [
+        tool_delta(0, "c0", '{"query": "a"}'),
+        tool_delta(1, "c1", '{"query": "b"}'),
+        done_event(("c0", '{"query": "a"}'), ("c1", '{"query": "b"}')),
+    ]
+
+    content, tool_calls, results = await agent._stream_tool_round(
+        fake_stream(events, observed, handler), asyncio.Semaphore(4), {}
+    )
+
+    assert observed == [("c0", '{"query": "a"}')]
+    assert [tc["id"] for tc in tool_calls] == ["c0", "c1"]
+    assert [r["tool_call_id"] for r in results] == ["c0", "c1"]
+    # 提前启动的调用被复用，没有重复执行
+    assert handler.started == [("c0", '{"query": "a"}'), ("c1", '{"query": "b"}')]
+    assert handler.cancelled == []
+
+
+async def test_stream_round_reruns_call_when_final_arguments_differ():
+    """最终参数与提前启动时不一致：取消提前任务并按最终参数重跑"""
+    handler = RecordingToolHandler()
+    agent = FakeAgent(handler)
+    events = [
+        tool_delta(0, "c0", '{"query": "a"}'),
+        tool_delta(1, "c1", '{"query": "b"}'),
+        done_event(("c0", '{"query": "a2"}'), ("c1", '{"query": "b"}')),
+    ]
+
+    _, _, results = await agent._stream_tool_round(fake_stream(events), asyncio.Semaphore(4), {})
+
+    assert handler.cancelled == [("c0", '{"query": "a"}')]
+    assert ("c0", '{"query": "a2"}') in handler.started
+    assert [json.loads(r["content"])["args"] for r in results] == [{"query": "a2"}, {"query": "b"}]
+
+
+async def test_stream_round_error_leaves_no_orphaned_tasks():
+    """流异常中断时，提前启动的工具任务全部取消，不留下后台任务"""
+    handler = RecordingToolHandler(delay=1)
+    agent = FakeAgent(handler)
+    events = [
+        tool_delta(0, "c0", '{"query": "a"}'),
+        tool_delta(1, "c1", '{"query": "b'),
+    ]
+
+    try:
+        await agent._stream_tool_round(
+            fake_stream(events, error=RuntimeError("stream reset")), asyncio.Semaphore(4), {}
+        )
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("stream error should propagate")
+    await asyncio.sleep(0)
+
+    assert handler.started == [("c0", '{"query": "a"}')]
+    assert handler.cancelled == [("c0", '{"query": "a"}')]
+    assert [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and not t.done()] == []
@@ -0,0 +1,49 @@
+"""
+JSON 序列化工具
+
+安装了 orjson 时在 C 层完成编解码，未安装时回退到标准库 json，
+两种实现的输出保持一致：紧凑分隔符、非 ASCII 字符原样输出（不转义）。
+orjson.JSONDecodeError 继承自 json.JSONDecodeError，调用方的异常处理无需区分。
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(value: Any) -> str:
+        """紧凑 JSON 序列化"""
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def json_dumps_indent(value: Any) -> str:
+        """两空格缩进的 JSON（用于 Prompt 中的可读渲染）"""
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+    def json_dumps_sorted(value: Any) -> str:
+        """键排序的紧凑 JSON（用作规范形式，如去重键）"""
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(value: Any) -> str:
+        """紧凑 JSON 序列化"""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+    def json_dumps_indent(value: Any) -> str:
+        """两空格缩进的 JSON（用于 Prompt 中的可读渲染）"""
+        return json.dumps(value, ensure_ascii=False, indent=2)
+
+    def json_dumps_sorted(value: Any) -> str:
+        """键排序的紧凑 JSON（用作规范形式，如去重键）"""
+        return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+__all__ = [
+    "json_loads",
+    "json_dumps",
+    "json_dumps_indent",
+    "json_dumps_sorted",
+]